@@ -12,6 +12,7 @@ from utils.printer import *
 from experimenter.internal.reservation import read_reservation_cli
 
 import experimenter.internal.experiment.executor as executor
+import experimenter.internal.experiment.execution.functionstore.local_general as local_general
 
 
 '''Python CLI module to deploy RADOS-Ceph on metareserve-allocated resources.'''
@@ -33,7 +34,7 @@ def _load_experiment(name):
     return module.get_experiment()
 
 
-def experiment(names):
+def experiment(names, local=False, dry_run=False):
     for idx, name in enumerate(names):
         if (not fs.isfile(experiments_dir(), name)) and not name.endswith('.py'):
             name = name+'.py'
@@ -44,6 +45,10 @@ def experiment(names):
 
     experiment_mapping = {name: _load_experiment(name) for name in names}
 
+    if dry_run:
+        return executor.dry_run(experiment_mapping, prepare_func=local_general.localize if local else None)
+    if local:
+        return executor.execute(experiment_mapping, local_general.local_reservation(), prepare_func=local_general.localize)
     reservation = read_reservation_cli()
     if not reservation:
         return False
@@ -52,7 +57,8 @@ def experiment(names):
 
 def add_args(parser):
     parser.add_argument('experiments', metavar='name', nargs='+', type=str, help='Experiment name(s) to execute.')
-    parser.add_argument('--debug', help='Perform debug run (no-start, no-data-deploy', action='store_true')
+    parser.add_argument('--dry-run', '--debug', dest='dry_run', help='Do not execute anything: Expands all executions, and prints predicted execution times per execution and stage. Predictions are calibrated on stage timings of earlier executions.', action='store_true')
+    parser.add_argument('--local', help='Execute on this machine only, without reservation: Uses a local directory instead of CephFS, and a local Spark (config "local_spark_home") or a mock benchmark.', action='store_true')
 
 
 def main():
@@ -65,9 +71,11 @@ def main():
     add_args(parser)
 
     args = parser.parse_args()
-    retval = experiment(args.experiments)
+    retval = experiment(args.experiments, local=args.local, dry_run=args.dry_run)
 
-    if retval:
+    if retval and args.dry_run:
+        prints('Dry run of experiment {} completed. Nothing was executed.'.format(', '.join(args.experiments)))
+    elif retval:
         prints('Experiment {} completed successfully.'.format(', '.join(args.experiments)))
     else:
         printe('An error occured.')
@@ -2,7 +2,6 @@ from datetime import datetime
 
 from rados_deploy import Designation
 
-from experimenter.internal.experiment.execution.execution_interface import ExecutionInterface
 import experimenter.internal.experiment.execution.functionstore.data_general as data_general
 import experimenter.internal.experiment.execution.functionstore.distribution_general as distribution_general
 import experimenter.internal.experiment.execution.functionstore.experiment_general as experiment_general
@@ -10,7 +9,8 @@ import experimenter.internal.experiment.execution.functionstore.spark as spark
 import experimenter.internal.experiment.execution.functionstore.rados_ceph as rados_ceph
 
 from experimenter.internal.experiment.interface import ExperimentInterface
-from experimenter.internal.experiment.config import ExperimentConfigurationBuilder, ExperimentConfiguration, NodeConfiguration, CephConfiguration
+import experimenter.internal.experiment.sweep as sweep
+from experimenter.internal.experiment.config import ExperimentConfiguration, NodeConfiguration, CephConfiguration
 
 import utils.fs as fs
 import utils.location as loc
@@ -51,37 +51,34 @@ class CephExperiment(ExperimentInterface):
         multipliers = [(32, 4), (32, 8), (32, 16), (32, 32), (32, 64), (32, 128)] #Total data size: 16, 32, 64, 128, 256, 512GB
         timestamp = datetime.now().isoformat()
 
-        configs = []
-        for mode in ['--arrow-only', '--spark-only']:
-            for (copy_multiplier, link_multiplier) in multipliers:
-                result_dirname = 'cp{}_ln{}'.format(copy_multiplier, link_multiplier)
-                configbuilder = ExperimentConfigurationBuilder()
-                configbuilder.set('batchsize', 1024)
-                configbuilder.set('mode', mode)
-                configbuilder.set('runs', 21)
-                configbuilder.set('spark_driver_memory', '60G')
-                configbuilder.set('spark_executor_memory', '60G')
-                configbuilder.set('node_config', get_node_configuration())
-                configbuilder.set('stripe', stripe)
-                configbuilder.set('copy_multiplier', copy_multiplier)
-                configbuilder.set('link_multiplier', link_multiplier)
-                configbuilder.set('remote_result_dir', fs.join('~', 'results', 'exp_data', str(timestamp), result_dirname))
-                configbuilder.set('result_dir', fs.join(loc.result_dir(), 'exp_data', str(timestamp), result_dirname))
-                configbuilder.set('data_path', fs.join(loc.data_generation_dir(), 'jayjeet_128mb.pq'))
-                configbuilder.set('data_query', '"{}"'.format(data_query))
-                configbuilder.set('spark_conf_options', lambda conf: ExperimentConfiguration.base_spark_conf_options(conf)+[
+        experiment_sweep = sweep.Sweep(
+            sweep.Axis('mode', ['--arrow-only', '--spark-only']),
+            sweep.Zip(sweep.Axis('copy_multiplier', [x for x, _ in multipliers]), sweep.Axis('link_multiplier', [x for _, x in multipliers])),
+            fixed={
+                'batchsize': 1024,
+                'runs': 21,
+                'spark_driver_memory': '60G',
+                'spark_executor_memory': '60G',
+                'node_config': get_node_configuration(),
+                'stripe': stripe,
+                'data_path': fs.join(loc.data_generation_dir(), 'jayjeet_128mb.pq'),
+                'data_query': '"{}"'.format(data_query),
+                'spark_conf_options': lambda conf: ExperimentConfiguration.base_spark_conf_options(conf)+[
                     'spark.arrowspark.pushdown.filters=True',
                     'spark.arrowspark.ceph.userados=True',
-                ])
-                config = configbuilder.build()
-                configs.append(config)
+                ],
+            },
+            derived={
+                'remote_result_dir': lambda point: fs.join('~', 'results', 'exp_data', str(timestamp), 'cp{}_ln{}'.format(point['copy_multiplier'], point['link_multiplier'])),
+                'result_dir': lambda point: fs.join(loc.result_dir(), 'exp_data', str(timestamp), 'cp{}_ln{}'.format(point['copy_multiplier'], point['link_multiplier'])),
+            })
+        return experiment_sweep.executions(_register_functions)
 
-        for idx, config in enumerate(configs):
-            executionInterface = ExecutionInterface(config)
-            executionInterface.register('distribute_func', distribution_general.distribute_default)
-            experiment_general.register_default_experiment_function(executionInterface, idx, len(configs))
-            experiment_general.register_default_result_fetch_function(executionInterface, idx, len(configs))
-            rados_ceph.register_rados_ceph_deploy_data(executionInterface, idx, len(configs))
-            spark.register_spark_functions(executionInterface, idx, len(configs))
-            rados_ceph.register_rados_ceph_functions(executionInterface, idx, len(configs))
-            yield executionInterface
\ No newline at end of file
+
+def _register_functions(executionInterface, idx, num_experiments):
+    executionInterface.register('distribute_func', distribution_general.distribute_default)
+    experiment_general.register_default_experiment_function(executionInterface, idx, num_experiments)
+    experiment_general.register_default_result_fetch_function(executionInterface, idx, num_experiments)
+    rados_ceph.register_rados_ceph_deploy_data(executionInterface, idx, num_experiments)
+    spark.register_spark_functions(executionInterface, idx, num_experiments)
+    rados_ceph.register_rados_ceph_functions(executionInterface, idx, num_experiments)
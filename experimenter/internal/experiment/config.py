@@ -30,11 +30,29 @@ class ExperimentConfiguration(object):
         self.tries = 2 # If our application dies X times, we stop trying and move on
         self.sleeptime = 30 # Sleep X seconds between checks
         self.dead_after_tries = 20 # If results have not changed between X block checks, we think the application has died.
-        # Unused experiment params
-        self.eventlog_path = None  # Set this to an existing directory to make Spark history server logs.
-        self.flamegraph_time = None
-        self.flamegraph_only_master = False
-        self.flamegraph_only_worker = False
+        self.adaptive_rel_error = None # If set, enables adaptive run-count: We stop the application once the confidence interval half-width of the median run time, relative to the median, is at most this value (e.g. 0.02 for 2%). Set to None to always perform `runs` runs.
+        self.adaptive_confidence = 0.95 # Confidence level for the adaptive run-count median confidence interval.
+        self.adaptive_min_runs = 10 # Minimal amount of measured runs before adaptive run-count may stop the application.
+        self.adaptive_max_runs = lambda conf: _to_val(conf.runs, conf) # Maximal amount of runs in adaptive mode. Passed to the application instead of `runs` when adaptive run-count is enabled.
+        self.adaptive_skip_leading = 1 # Amount of leading (warm-up) runs excluded from the adaptive convergence check.
+        self.adaptive_stop_grace = 30 # Seconds to wait for the application to exit by itself after signaling it to stop (by creating `<remote result file>.stop`), before killing the driver.
+        self.resume_runs = True # If set, retries after a crash or timeout only perform the missing runs, instead of all runs. Requires client deploy mode, and an application appending to its result file.
+        self.resume_warmup_runs = 1 # Amount of warm-up runs performed by resumed attempts. These are tagged in the result file (see `stats.attempt_marker`), and skipped by result readers.
+        self.driver_watch = True # If set, watches the driver process and driver logs while waiting for results, and aborts an attempt as soon as the driver exits early or logs a fatal error.
+        self.driver_watch_interval = 5 # Seconds between checks when `driver_watch` is set. `dead_after_tries` is scaled, such that unchanged results still time out after `dead_after_tries*sleeptime` seconds.
+        self.driver_watch_grace = 60 # Seconds after submission during which a missing driver process is not considered a crash (e.g. while the driver is scheduled in cluster mode).
+        self.driver_watch_context = 20 # Amount of driver log lines to show with a detected crash.
+        self.driver_logs = lambda conf: ExperimentConfiguration.base_driver_logs(conf) # Remote path globs of driver logs on the driver node, scanned for errors. Only logs written after submission are scanned.
+        self.driver_error_patterns = ['Exception in thread "main"', 'ERROR (SparkContext|SparkSubmit|DriverWrapper)', 'OutOfMemoryError', 'Error: (Could not|Failed to)'] # Extended regexes marking fatal driver errors in driver logs.
+        # Profiling params (used when profile functions are registered, see `functionstore/profile_general.py`)
+        self.flamegraph_time = None # Amount of seconds to profile with perf during each execution. Set to None to disable profiling.
+        self.flamegraph_only_master = False # If set, only profiles the Spark master node (runs the driver in client mode).
+        self.flamegraph_only_worker = False # If set, only profiles Spark worker nodes (executors).
+        self.flamegraph_groups = ['spark', 'rados_ceph'] # Distribution keys to profile. For 'rados_ceph', Ceph OSD processes are profiled.
+        self.flamegraph_delay = 0 # Amount of seconds to wait after the experiment starts, before profiling.
+        self.flamegraph_frequency = 99 # Profiler sampling frequency in Hz.
+        self.flamegraph_sudo = True # Run perf with sudo. Required unless kernel.perf_event_paranoid allows unprivileged profiling.
+        self.flamegraph_top = 50 # Amount of symbols to list per node and per role in the top-symbol table.
 
         # Spark cluster options
         self.spark_silent = False
@@ -44,7 +62,9 @@ class ExperimentConfiguration(object):
         self.spark_force_reinstall = False
         self.spark_download_url = 'https://archive.apache.org/dist/spark/spark-3.1.2/spark-3.1.2-bin-hadoop2.7.tgz'
         self.spark_driver_memory = '16G'
+        self.spark_master_webui_port = 8080 # Port of the Spark standalone master web UI. Its JSON status endpoint is used to find the node running the driver in cluster deploy mode.
         self.spark_executor_memory = '16G'
+        self.eventlog_path = None  # Set this to an existing remote directory to make Spark history server logs. Logs are collected by the result collection stage.
 
         # RADOS-Ceph cluster options
         self.ceph_silent = False
@@ -59,12 +79,19 @@ class ExperimentConfiguration(object):
         self.ceph_arrow_url = 'https://github.com/Sebastiaan-Alvarez-Rodriguez/arrow/archive/refs/heads/master.zip'
         self.ceph_force_reinstall = False
         self.ceph_debug = False
+        self.ceph_artifact_cache = False # If set, Arrow is compiled on one node only. The build is cached locally (keyed by `ceph_arrow_url` and the revision it points to, `ceph_debug` and rados-deploy version) and distributed to all other nodes.
+        self.ceph_artifact_paths = ['~/arrow'] # Remote paths (must start with '~/') containing the Arrow build produced by rados-deploy. These paths make up the cached artifact.
         self.rados_used = True # If set to False, we deploy data to a non-cephFS directory and we tell Arrow-Spark to not use RADOS-based reads, but regular reads instead.
         # bluestore cluster options
         self.ceph_bluestore_path_override = '/dev/nvme0n1p4' # Must point to a device (e.g. '/dev/nvme0n1p4') or `None`, in which case we don't override the "device_path" extra info of each OSD.
         # memstore cluster options
         self.ceph_memstore_storage_size = '10GiB' # Amount of bytes we reserve on OSDs for storing data with memstore.
 
+        # Local backend options (used when executing with '--local', see `functionstore/local_general.py`)
+        self.local_dir = fs.join(loc.cache_dir(), 'local') # Local directory replacing remote directories (data, results, Spark workdir).
+        self.local_spark_home = None # Path to a local Spark installation. If set, runs a local Spark standalone cluster and submits the application. Otherwise, runs a mock benchmark instead.
+        self.local_mock_data_size = 16*1024*1024 # Size in bytes of random data generated when `data_path` does not exist.
+
         #Shared cluster options
         self.silent = False # Overrides both `spark_silent` and `ceph_silent` if set to `True`.
         self.key_path = '~/.ssh/geni.rsa' # Key to use when connecting from our machine to them, remotely.
@@ -76,6 +103,10 @@ class ExperimentConfiguration(object):
         self.stripe = 128 # Generate a parquet file for a stripe-constraint of X MB.
         self.copy_multiplier =  2 # inflates dataset by this factor using file copies. We generate 1 file, so we end up with 2 files. 
         self.link_multiplier = 20 # inflates dataset by this factor using hardlinks. We first apply the copy multiplier. Effects stack. For sending 1 file with a copy_multiplier=2 and link_multiplier=16, we end up with 2 files, with 15 hardlinks for each file.
+        self.data_deploy_incremental = False # If set, inventories `remote_data_dir` first, and only transfers or creates missing/changed files. Warning: Removes all other files from `remote_data_dir`.
+        self.data_deploy_striped = False # If set, uploads every copy directly over parallel streams through all client nodes, writing objects with the configured stripe size. Reports throughput per stream.
+        self.data_deploy_streams = 4 # Amount of parallel upload streams per client node for striped deployment.
+        self.data_deploy_local_dir = None # If set, striped deployment writes into this local directory instead of the remote data dir. Useful for testing without a cluster.
         self.data_format = 'parquet'
         self.num_columns = 4
         self.data_query = ''
@@ -85,6 +116,16 @@ class ExperimentConfiguration(object):
         self.result_file = lambda conf: _to_val(conf.remote_result_file, conf) # result file on the local machine.
         self.remote_result_dir = '~/results' # result dir on the remote cluster.
         self.remote_result_file = lambda conf: '{}_{}_{:04}_{:06}.res_{}'.format(_to_val(conf.data_format, conf), _to_val(conf.data_generator_name, conf), _to_val(conf.stripe, conf), _to_val(conf.link_multiplier, conf), 'a' if 'arrow' in _to_val(conf.mode, conf) else 's')
+        self.collect_artifacts = lambda conf: ExperimentConfiguration.base_collect_artifacts(conf) # Extra artifacts to collect after each execution, as a list of (distribution key, remote path glob) pairs. Only files changed during the execution are collected.
+        self.collect_tries = 3 # Amount of times we try to fetch artifacts that failed to transfer or verify.
+        self.skip_measured = False # If set, executions are skipped when a result file measured with an identical configuration (see `fingerprint.py`) exists in `skip_measured_dir`.
+        self.skip_measured_dir = loc.result_dir() # Directory searched recursively for earlier results when `skip_measured` is set.
+        self.stage_history_path = fs.join(loc.cache_dir(), 'stage_timings.jsonl') # File to record stage timings of every execution in. Used to calibrate dry-run time estimates.
+        self.result_fetch_async = False # If set, result fetch functions run in the background, overlapping with stopping frameworks and the next execution. The executor waits for all fetches before exiting.
+        self.telemetry_groups = ['spark', 'rados_ceph'] # Distribution keys of nodes to sample resource telemetry (CPU, memory, disk, network) on, when telemetry functions are registered.
+        self.telemetry_interval = 1.0 # Telemetry sampling interval in seconds.
+        self.breakdown_logs = lambda conf: ExperimentConfiguration.base_breakdown_logs(conf) # Logs to parse backend stage timings from, as a list of (distribution key, remote path glob) pairs.
+        self.breakdown_stages = lambda conf: ExperimentConfiguration.base_breakdown_stages(conf) # Backend stages to extract from logs, as a list of (label, regex) pairs. Regexes need a named group 'value', and may have a named group 'unit' (ns, us, ms, s; default ms).
 
         self.batchsize = 8192 # This sets the read chunk size in bytes, both for Spark and for our bridge. Tweaking this parameter is important.
         self.spark_application_type = 'java' # Type of executable we deploy to Spark. Either 'java' or 'python'.
@@ -98,7 +139,7 @@ class ExperimentConfiguration(object):
             _to_val(conf.data_format, conf),
             _to_val(conf.num_columns, conf),
             _to_val(conf.data_query, conf),
-            _to_val(conf.runs, conf),
+            _to_val(conf.adaptive_max_runs, conf) if _to_val(conf.adaptive_rel_error, conf) else _to_val(conf.runs, conf),
             _to_val(conf.mode, conf))
         self.spark_application_mainclass = 'org.arrowspark.benchmark.Benchmark'
         self.spark_extra_jars = []
@@ -126,21 +167,82 @@ class ExperimentConfiguration(object):
         ]
         if not conf.rados_used:
             base.append("'spark.arrowspark.ceph.userados=false'") # This rule ensures the connector reads using a regular filesystem reader.
+        if _to_val(conf.eventlog_path, conf):
+            base.append("'spark.eventLog.enabled=true'")
+            base.append("'spark.eventLog.dir=file://{}'".format(_to_val(conf.eventlog_path, conf)))
+        return base
+
+
+    @staticmethod
+    def base_collect_artifacts(conf):
+        '''Provides default artifacts to collect: Spark executor logs, cluster-mode driver logs, and Spark eventlogs (if enabled).'''
+        base = [
+            ('spark', fs.join(_to_val(conf.spark_workdir, conf), 'app-*', '*', 'std*')),
+            ('spark', fs.join(_to_val(conf.spark_workdir, conf), 'driver-*', 'std*')),
+        ]
+        if _to_val(conf.eventlog_path, conf):
+            base.append(('spark', fs.join(_to_val(conf.eventlog_path, conf), '*')))
         return base
 
 
+    @staticmethod
+    def base_driver_logs(conf):
+        '''Provides default driver logs: Driver output of Spark standalone in cluster mode. In client mode, the driver writes to the output of spark-submit, which must be added here if redirected to a file.'''
+        return [fs.join(_to_val(conf.spark_workdir, conf), 'driver-*', 'stderr')]
+
+
+    @staticmethod
+    def base_breakdown_logs(conf):
+        '''Provides default logs to parse backend timings from: Ceph OSD logs (offloaded scans) and Spark executor logs (connector side).'''
+        return [
+            ('rados_ceph', '/var/log/ceph/ceph-osd.*.log'),
+            ('spark', fs.join(_to_val(conf.spark_workdir, conf), 'app-*', '*', 'stderr')),
+        ]
+
+
+    @staticmethod
+    def base_breakdown_stages(conf):
+        '''Provides default backend stages to extract. Matches log lines like "serialize_resulttable: 12.5 ms" or "disk_io=1200us".'''
+        stages = [
+            ('Stat Fragment', 'stat_fragment'),
+            ('Serialize Scan Request', 'serialize_scanrequest'),
+            ('Deserialize Scan Request', 'deserialize_scanrequest'),
+            ('Disk I/O', 'disk_io'),
+            ('Scan Parquet Data', 'scan_pq_data'),
+            ('Serialize Result Table', 'serialize_resulttable'),
+            ('Result Transfer', 'transfer'),
+            ('Deserialize Result Table', 'deserialize_resulttable'),
+        ]
+        return [(label, r'\b{}[=:] ?(?P<value>[0-9]+(\.[0-9]+)?) ?(?P<unit>ns|us|ms|s)?\b'.format(key)) for label, key in stages]
+
+
+class _ResolvingProxy(object):
+    '''Stand-in for a configuration instance, passed to callables during `ExperimentConfigurationBuilder.build`.
+    Reading a field through this proxy resolves that field first, so callables always see final values.'''
+    def __init__(self, builder):
+        object.__setattr__(self, '_builder', builder)
+
+    def __getattr__(self, name):
+        return self._builder._resolve(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Illegal set-call during configuration building. Cannot set config attribute "{}" from a callable.'.format(name))
+
+
 class ExperimentConfigurationBuilder(object):
     '''Simple builder object. Allows you to instantiate a class, change attributes, and finalize them using the `build` method.
     This builder allows users to set lambdas/callable functions as values.
-    These get executed on configuration finalization, with the to-be-finalized class instance.'''
+    These get executed on configuration finalization, with the to-be-finalized class instance.
+    Callables are resolved in dependency order: When a callable reads another field, that field is resolved first. Every callable is executed exactly once.'''
     def __init__(self, clazz=ExperimentConfiguration):
         self.instance = clazz()
+        self.dependencies = dict() # Maps field names to the names of fields they read during building.
 
     def set(self, name, value):
         '''Set any attribute of a `clazz` instance. 
         Note: You can assign lambdas/callable function as values.
-        These callables must take 1 argument, to which the `clazz` instance will be passed.
-        Warning: If your callables require other instance variables, you must explicitly check if they are callable (then you must call them to get value) or just values.
+        These callables must take 1 argument, to which the (to-be-finalized) `clazz` instance will be passed.
+        Fields read from that argument are always resolved values, never callables.
         Args:
             name (str): Name of the attribute to set.
             value (any type, callable): Value for the attribute to set. Can be callable with 1 argument.'''
@@ -148,13 +250,40 @@ class ExperimentConfigurationBuilder(object):
             raise ValueError('Illegal set-call. Cannot set config attributes starting with underscores ("_"). Found name: {}'.format(name))
         setattr(self.instance, name, value)
 
+    def _resolve(self, name):
+        '''Returns the final value of a field, resolving it (and the fields it depends on) if required.'''
+        if not name in self._fields:
+            return getattr(self.instance, name)
+        if self._stack:
+            self.dependencies.setdefault(self._stack[-1], set()).add(name)
+        if name in self._resolved:
+            return getattr(self.instance, name)
+        if name in self._stack:
+            cycle = self._stack[self._stack.index(name):]+[name]
+            raise ValueError('Cyclic configuration dependency detected: {}'.format(' -> '.join(cycle)))
+        value = self._fields[name]
+        if callable(value):
+            self._stack.append(name)
+            try:
+                value = value(self._proxy)
+            finally:
+                self._stack.pop()
+            setattr(self.instance, name, value)
+        self._resolved.add(name)
+        return value
+
     def build(self):
-        '''Build an instance of `class`.'''
-        config_attr_names = [x for x in dir(self.instance) if not x.startswith('_')]
-        for x in config_attr_names:
-            attr = getattr(self.instance, x)
-            if callable(attr):
-                setattr(self.instance, x, attr(self.instance))
+        '''Build an instance of `class`. Callable fields are evaluated once each, in dependency order.
+        Raises:
+            ValueError: When fields depend on each other cyclically.'''
+        self._fields = {k: v for k, v in vars(self.instance).items() if not k.startswith('_')}
+        self._resolved = set()
+        self._stack = []
+        self._proxy = _ResolvingProxy(self)
+        self.dependencies = dict()
+        for name in sorted(self._fields):
+            self._resolve(name)
+        del self._fields, self._resolved, self._stack, self._proxy
         return self.instance
 
 
@@ -0,0 +1,178 @@
+from datetime import datetime
+import json
+
+import experimenter.internal.experiment.fingerprint as fingerprint
+import utils.fs as fs
+from utils.printer import *
+
+'''Linear cost model for execution stages, calibrated from historical stage timings. Used to estimate campaign durations without executing anything.'''
+
+# Stages in execution order, mapped to the registered functions they need, and the feature their duration scales with (`None` for constant-time stages).
+STAGES = [
+    ('install_spark', 'install_spark_func', 'first'),
+    ('install_others', 'install_others_funcs', 'first'),
+    ('start_spark', 'start_spark_func', None),
+    ('start_others', 'start_others_funcs', None),
+    ('generate_data', 'generate_data_funcs', None),
+    ('deploy_data', 'deploy_data_func', 'upload_bytes'),
+    ('monitor', 'monitor_start_funcs', None),
+    ('experiment', 'experiment_funcs', 'run_bytes'),
+    ('result_fetch', 'result_fetch_funcs', None),
+    ('stop_spark', 'stop_spark_func', None),
+    ('stop_others', 'stop_others_funcs', None),
+]
+
+# Rough durations (seconds, or seconds per feature unit) used for stages without any history.
+_PRIOR_INTERCEPTS = {'install_spark': 10, 'install_others': 30, 'start_spark': 30, 'start_others': 300, 'generate_data': 60, 'deploy_data': 30, 'monitor': 5, 'experiment': 30, 'result_fetch': 5, 'stop_spark': 15, 'stop_others': 60}
+_PRIOR_SLOPES = {'install_spark': 180, 'install_others': 3600, 'deploy_data': 1/(200*1024*1024), 'experiment': 1/(500*1024*1024)}
+
+
+def _data_size(path):
+    '''Returns the size in bytes of a file, or of all files directly inside a directory. Returns 0 for missing paths.'''
+    if fs.isfile(path):
+        return fs.sizeof(path)
+    if fs.isdir(path):
+        return sum(fs.sizeof(x) for x in fs.ls(path, only_files=True, full_paths=True))
+    return 0
+
+
+def features(config, first=False, data_reused=False):
+    '''Computes cost model features for an execution.
+    Args:
+        config (ExperimentConfiguration): Built configuration.
+        first (optional bool): Whether this execution is the first of its experiment. Installations are (mostly) skipped for later executions, as installs are fingerprinted.
+        data_reused (optional bool): Whether the previous execution left exactly the required data in place, so deployment transfers nothing.
+
+    Returns:
+        `dict(str, float)` with keys 'first', 'upload_bytes' (bytes to deploy) and 'run_bytes' (bytes read over all runs).'''
+    size = _data_size(config.data_path)
+    runs = config.adaptive_max_runs if getattr(config, 'adaptive_rel_error', None) else config.runs
+    return {
+        'first': 1.0 if first else 0.0,
+        'upload_bytes': 0.0 if data_reused else float(size*config.copy_multiplier),
+        'run_bytes': float(size*config.copy_multiplier*config.link_multiplier*runs),
+    }
+
+
+def data_key(config):
+    '''Returns a key identifying the deployed data of an execution.'''
+    return (config.data_path, config.copy_multiplier, config.link_multiplier, config.stripe, config.remote_data_dir)
+
+
+def record(execution, path, first=False, data_reused=False):
+    '''Appends measured stage timings of an execution to the history file at `path` (JSON lines). See `features` for the other arguments.'''
+    if not any(execution.stage_times):
+        return
+    fs.mkdir(fs.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps({
+            'created': datetime.now().isoformat(),
+            'fingerprint': fingerprint.config_fingerprint(execution.config),
+            'features': features(execution.config, first=first, data_reused=data_reused),
+            'stages': execution.stage_times})+'\n')
+
+
+def read_history(path):
+    '''Reads stage timing history written by `record`. Returns `list(dict)`, skipping malformed lines.'''
+    if not fs.isfile(path):
+        return []
+    history = []
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                history.append(json.loads(line))
+            except ValueError:
+                continue
+    return history
+
+
+def _fit_line(points):
+    '''Least-squares fit of `y = intercept + slope*x`. Returns `(intercept, slope)`. With less than 2 distinct x-values, fits a constant.'''
+    n = len(points)
+    mean_x = sum(x for x, _ in points)/n
+    mean_y = sum(y for _, y in points)/n
+    var_x = sum((x-mean_x)**2 for x, _ in points)
+    if var_x == 0:
+        return mean_y, 0.0
+    slope = max(sum((x-mean_x)*(y-mean_y) for x, y in points)/var_x, 0.0)
+    return max(mean_y-slope*mean_x, 0.0), slope
+
+
+class CostModel(object):
+    '''Predicts stage durations as `intercept + slope*feature`, per stage. Coefficients are fitted on history, and fall back to rough priors for stages without history.'''
+    def __init__(self, history=None):
+        self.coefficients = dict()
+        self.samples = dict()
+        for stage, _, feature in STAGES:
+            points = [(entry['features'].get(feature, 0.0) if feature else 0.0, entry['stages'][stage]) for entry in (history if history else []) if stage in entry['stages']]
+            self.samples[stage] = len(points)
+            if any(points):
+                self.coefficients[stage] = _fit_line(points)
+            else:
+                self.coefficients[stage] = (_PRIOR_INTERCEPTS[stage], _PRIOR_SLOPES.get(stage, 0.0))
+
+    def predict(self, stage, feats):
+        '''Returns the predicted duration of a stage in seconds, for given features.'''
+        feature = next(x for name, _, x in STAGES if name == stage)
+        intercept, slope = self.coefficients[stage]
+        return intercept + slope*(feats[feature] if feature else 0.0)
+
+
+def _registered(execution, attr):
+    value = getattr(execution, attr)
+    return bool(value) if isinstance(value, list) else callable(value)
+
+
+def simulate(executions, model):
+    '''Simulates executing a sequence of executions (of one experiment), applying the same reuse logic as real executions:
+     - Executions with `skip_measured` set, whose configuration was measured before, are skipped.
+     - Installations are only performed fully for the first execution.
+     - With `data_deploy_incremental`, data identical to that of the previous execution is not transferred again.
+    Args:
+        executions (iterable(ExecutionInterface)): Executions to simulate, with stage functions registered.
+        model (CostModel): Cost model to predict stage durations with.
+
+    Returns:
+        `list(dict(str, float) or None)`, with predicted stage durations (seconds) for every execution, or `None` for skipped executions.'''
+    predictions = []
+    measured = dict()
+    previous_data = None
+    first = True
+    for execution in executions:
+        config = execution.config
+        if getattr(config, 'skip_measured', False):
+            if not config.skip_measured_dir in measured:
+                measured[config.skip_measured_dir] = fingerprint.index_measured(config.skip_measured_dir)
+            if fingerprint.config_fingerprint(config) in measured[config.skip_measured_dir]:
+                predictions.append(None)
+                continue
+        data_reused = getattr(config, 'data_deploy_incremental', False) and data_key(config) == previous_data
+        feats = features(config, first=first, data_reused=data_reused)
+        predictions.append({stage: model.predict(stage, feats) for stage, attr, _ in STAGES if _registered(execution, attr)})
+        previous_data = data_key(config)
+        first = False
+    return predictions
+
+
+def format_seconds(seconds):
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return '{}h{:02}m{:02}s'.format(hours, rest//60, rest % 60)
+
+
+def report(name, predictions, model, num_critical=3):
+    '''Prints a simulation report for an experiment: Predicted time per execution, total time, and the stages taking most time.
+    Returns:
+        `float`, the predicted total duration in seconds.'''
+    stage_totals = dict()
+    for prediction in predictions:
+        for stage, seconds in (prediction if prediction else dict()).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0)+seconds
+    total = sum(stage_totals.values())
+    print('Experiment "{}": {} executions ({} skipped), predicted {}.'.format(name, len(predictions), sum(1 for x in predictions if x == None), format_seconds(total)))
+    for idx, prediction in enumerate(predictions):
+        print('\tExecution {}/{}: {}'.format(idx+1, len(predictions), 'skipped (already measured)' if prediction == None else format_seconds(sum(prediction.values()))))
+    if total > 0:
+        print('\tCritical stages:')
+        for stage, seconds in sorted(stage_totals.items(), key=lambda x: -x[1])[:num_critical]:
+            print('\t\t{:<16} {} ({:.1f}%, {} historical samples)'.format(stage, format_seconds(seconds), 100*seconds/total, model.samples[stage]))
+    return total
@@ -1,3 +1,5 @@
+import time
+
 import metareserve
 
 from utils.printer import *
@@ -15,6 +17,11 @@ class ExecutionInterface(object):
         self._config = config
         self._reservation = None
         self._distribution = None
+        self.experiment_start_time = None # Local epoch time at which the experiment stage started. Set during execution.
+        self.experiment_end_time = None # Local epoch time at which the experiment stage ended. Set during execution.
+        self.result_fetch_future = None # Future for result fetching, when fetching happens in the background. See `execute`.
+        self.stage_times = dict() # Maps stage names (e.g. 'install_spark', 'experiment') to the amount of seconds spent in them. Set during execution.
+        self.driver_node_id = None # Node id of the node running the Spark driver. Set by the default experiment function, and used by the default result fetch function.
 
         self.distribute_func = None
         self.install_spark_func = None
@@ -23,7 +30,9 @@ class ExecutionInterface(object):
         self.start_others_funcs = []
         self.generate_data_funcs = []
         self.deploy_data_func = None
+        self.monitor_start_funcs = []
         self.experiment_funcs = []
+        self.monitor_stop_funcs = []
         self.result_fetch_funcs = []
         self.stop_spark_func = None
         self.stop_others_funcs = []
@@ -81,7 +90,10 @@ class ExecutionInterface(object):
         start_others_funcs      : optional, starts others. Can register multiple functions, which will be executed in order of registering.
         generate_data_funcs     : optional, generates data. Can register multiple functions, which will be executed in order of registering.
         deploy_data_func        : optional, deploys data.
+        monitor_start_funcs     : optional, starts monitoring (e.g. telemetry) right before the experiment. Can register multiple functions, which will be executed in order of registering.
         experiment_funcs        : required, performs experiment. Can register multiple functions, which will be executed in order of registering.
+        monitor_stop_funcs      : optional, stops monitoring right after the experiment. Always executed when monitoring was started, also when the experiment fails.
+                                  Can register multiple functions, which will be executed in order of registering.
         result_fetch_funcs      : optional, fetches results. Can register multiple functions, which will be executed in order of registering.
         stop_spark_func         : required, stops Spark.
         stop_others_funcs       : optional, stops others. Can register multiple functions, which will be executed in order of registering.
@@ -118,10 +130,57 @@ class ExecutionInterface(object):
             return False
 
 
-    def execute(self):
+    def _timed(self, stage, func):
+        '''Calls `func()`, adding its duration to `stage_times[stage]`. Returns the return value of `func`.'''
+        start = time.time()
+        try:
+            return func()
+        finally:
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0)+time.time()-start
+
+
+    def _stop_monitors(self):
+        '''Executes all registered monitor stop functions in order. A failing function does not prevent others from executing.
+        Returns:
+            `True` on success, `False` otherwise.'''
+        if any(self.monitor_stop_funcs):
+            print('Stopping {} monitor(s)...'.format(len(self.monitor_stop_funcs)))
+        retval = True
+        for idx, x in enumerate(self.monitor_stop_funcs):
+            try:
+                if self._timed('monitor', lambda: x(self)):
+                    continue
+                printe('Could not execute monitor stop function {}/{}: {}'.format(idx+1, len(self.monitor_stop_funcs), x.__name__))
+            except Exception as e:
+                printe('Monitor stop function {}/{} ({}) raised an exception: {}'.format(idx+1, len(self.monitor_stop_funcs), x.__name__, e))
+            retval = False
+        return retval
+
+
+    def _fetch_results(self):
+        '''Executes all registered result fetch functions in order.
+        Returns:
+            `True` on success, `False` otherwise.'''
+        for idx, x in enumerate(self.result_fetch_funcs):
+            try:
+                if self._timed('result_fetch', lambda: x(self)):
+                    continue
+                printe('Could not execute result fetch function {}/{}: {}'.format(idx+1, len(self.result_fetch_funcs), x.__name__))
+            except Exception as e:
+                printe('Result fetch function {}/{} ({}) raised an exception: {}'.format(idx+1, len(self.result_fetch_funcs), x.__name__, e))
+            return False
+        return True
+
+
+    def execute(self, background_executor=None):
         '''Executes experiment setup, calling registered methods as needed.
+        Args:
+            background_executor (optional concurrent.futures.Executor): If set, result fetch functions are submitted to this executor instead of being executed directly.
+                                                                        Fetching then overlaps with stopping frameworks and with the next execution.
+                                                                        The resulting future is stored in `result_fetch_future`, and returns `True` on fetch success, `False` otherwise.
+
         Returns:
-            `True` on successful execution, `False` otherwise.'''
+            `True` on successful execution, `False` otherwise. When fetching in the background, fetch failures are not reflected in this value.'''
         callables_named = {
             'distribute_func': self.distribute_func,
             'install_spark_func': self.install_spark_func,
@@ -150,62 +209,78 @@ class ExecutionInterface(object):
 
 
         print('Installing Spark ({} nodes)...'.format(len(self.distribution['spark'])))
-        if not self.install_spark_func(self):
+        if not self._timed('install_spark', lambda: self.install_spark_func(self)):
             printe('Could not install Spark.')
             return False
         if any(self.install_others_funcs):
             print('Installing {} other components...'.format(len(self.install_others_funcs)))
         for idx, x in enumerate(self.install_others_funcs):
-            if not x(self):
+            if not self._timed('install_others', lambda: x(self)):
                 printe('Could not execute installation function {}/{}: {}'.format(idx+1, len(self.install_others_funcs), x.__name__))
                 return False
 
         print('Starting Spark ({} nodes)...'.format(len(self.distribution['spark'])))
-        if not self.start_spark_func(self):
+        if not self._timed('start_spark', lambda: self.start_spark_func(self)):
             printe('Could not start Spark.')
             return False
         if any(self.start_others_funcs):
             print('Starting {} other components...'.format(len(self.start_others_funcs)))
         for idx, x in enumerate(self.start_others_funcs):
-            if not x(self):
+            if not self._timed('start_others', lambda: x(self)):
                 printe('Could not execute start function {}/{}: {}'.format(idx+1, len(self.start_others_funcs), x.__name__))
                 return False
 
         if any(self.generate_data_funcs):
             print('Generating data ({} functions)...'.format(len(self.generate_data_funcs)))
         for idx, x in enumerate(self.generate_data_funcs):
-            if not x(self):
+            if not self._timed('generate_data', lambda: x(self)):
                 printe('Could not execute data generation function {}/{}: {}'.format(idx+1, len(self.generate_data_funcs), x.__name__))
                 return False
 
         print('Deploying data...')
-        if callable(self.deploy_data_func) and not self.deploy_data_func(self):
+        if callable(self.deploy_data_func) and not self._timed('deploy_data', lambda: self.deploy_data_func(self)):
             printe('Could not deploy data.')
             return False
 
-        print('Executing {} experiment function(s)...'.format(len(self.experiment_funcs)))
-        for idx, x in enumerate(self.experiment_funcs):
-            if not x(self):
-                printe('Could not execute experiment function {}/{}: {}'.format(idx+1, len(self.experiment_funcs), x.__name__))
+        if any(self.monitor_start_funcs):
+            print('Starting {} monitor(s)...'.format(len(self.monitor_start_funcs)))
+        for idx, x in enumerate(self.monitor_start_funcs):
+            if not self._timed('monitor', lambda: x(self)):
+                printe('Could not execute monitor start function {}/{}: {}'.format(idx+1, len(self.monitor_start_funcs), x.__name__))
+                self._stop_monitors()
                 return False
 
-        if any(self.result_fetch_funcs):
-            print('Aggregating results ({} functions)...'.format(len(self.result_fetch_funcs)))
-            for idx, x in enumerate(self.result_fetch_funcs):
+        print('Executing {} experiment function(s)...'.format(len(self.experiment_funcs)))
+        self.experiment_start_time = time.time()
+        try:
+            for idx, x in enumerate(self.experiment_funcs):
                 if not x(self):
-                    printe('Could not execute result fetch function {}/{}: {}'.format(idx+1, len(self.result_fetch_funcs), x.__name__))
+                    printe('Could not execute experiment function {}/{}: {}'.format(idx+1, len(self.experiment_funcs), x.__name__))
+                    return False
+        finally:
+            self.experiment_end_time = time.time()
+            self.stage_times['experiment'] = self.experiment_end_time-self.experiment_start_time
+            self._stop_monitors()
+
+        if any(self.result_fetch_funcs):
+            if background_executor:
+                print('Aggregating results in the background ({} functions)...'.format(len(self.result_fetch_funcs)))
+                self.result_fetch_future = background_executor.submit(self._fetch_results)
+            else:
+                print('Aggregating results ({} functions)...'.format(len(self.result_fetch_funcs)))
+                if not self._fetch_results():
                     return False
 
 
         print('Stopping Spark ({} nodes)...'.format(len(self.distribution['spark'])))
-        if not self.stop_spark_func(self):
+        if not self._timed('stop_spark', lambda: self.stop_spark_func(self)):
             printe('Could not stop Spark.')
             return False
 
         if any(self.stop_others_funcs):
             print('Stopping {} other components...'.format(len(self.stop_others_funcs)))
         for idx, x in enumerate(self.stop_others_funcs):
-            if not x(self):
+            if not self._timed('stop_others', lambda: x(self)):
                 printe('Could not execute stop function {}/{}: {}'.format(idx+1, len(self.stop_others_funcs), x.__name__))
                 return False
 
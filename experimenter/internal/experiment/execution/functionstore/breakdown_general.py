@@ -0,0 +1,168 @@
+import concurrent.futures
+from datetime import datetime
+import json
+import re
+
+import remoto
+
+from experimenter.internal.remoto.ssh_wrapper import close_wrappers
+from experimenter.internal.experiment.execution.functionstore.util import get_connections, all_open
+
+import utils.fs as fs
+from utils.printer import *
+
+
+_unit_to_ms = {'ns': 1e-6, 'us': 1e-3, 'ms': 1.0, 's': 1000.0}
+
+
+def _log_nodes(interface):
+    '''Returns `dict(metareserve.Node, list(str))`, mapping nodes to the log globs to read on them.'''
+    nodes = dict()
+    for group, glob in interface.config.breakdown_logs:
+        for node in interface.distribution.get(group, []):
+            nodes.setdefault(node, []).append(glob)
+    return nodes
+
+
+def _remote_sizes(connection, globs):
+    '''Returns `dict(str, int)` mapping every existing remote log file matching given globs to its size in bytes.'''
+    out, err, exitcode = remoto.process.check(connection, 'for f in {}; do [ -f "$f" ] && echo "$(stat -c %s "$f") $f"; done; true'.format(' '.join(globs)), shell=True)
+    sizes = dict()
+    for line in out:
+        size, _, path = line.strip().partition(' ')
+        sizes[path] = int(size)
+    return sizes
+
+
+def parse_breakdown(lines, stages):
+    '''Extracts stage timings from log lines.
+    Args:
+        lines (iterable(str)): Log lines.
+        stages (list((str, str))): `(stage label, regex)` pairs. Every regex must contain a named group `value`, and may contain a named group `unit` ('ns', 'us', 'ms', 's'). Without unit, values are in milliseconds.
+
+    Returns:
+        `dict(str, list(float))`, mapping stage labels to all found timings in milliseconds.'''
+    compiled = [(label, re.compile(regex)) for label, regex in stages]
+    found = {label: [] for label, _ in stages}
+    for line in lines:
+        for label, regex in compiled:
+            for match in regex.finditer(line):
+                unit = match.groupdict().get('unit') or 'ms'
+                found[label].append(float(match.group('value'))*_unit_to_ms[unit])
+    return found
+
+
+def summarize_breakdown(found):
+    '''Summarizes stage timings, as returned by `parse_breakdown`.
+    Returns:
+        `dict(str, dict)` mapping stage labels to statistics: `count`, `total_ms`, `mean_ms`, `median_ms`, `share` (fraction of the sum of all stage totals).'''
+    grand_total = sum(sum(x) for x in found.values())
+    summary = dict()
+    for label, values in found.items():
+        ordered = sorted(values)
+        median = (ordered[(len(ordered)-1)//2]+ordered[len(ordered)//2])/2 if ordered else 0.0
+        summary[label] = {
+            'count': len(values),
+            'total_ms': sum(values),
+            'mean_ms': sum(values)/len(values) if values else 0.0,
+            'median_ms': median,
+            'share': sum(values)/grand_total if grand_total else 0.0,
+        }
+    return summary
+
+
+def breakdown_start(interface, idx, num_experiments):
+    '''Records the current sizes of all configured log files, so only lines written during the experiment are parsed afterwards.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        breakdown_logs (list((str, str))): Logs to parse, as `(distribution key, remote path glob)` pairs.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    nodes = _log_nodes(interface)
+    interface.breakdown_offsets = dict()
+    if not any(nodes):
+        return True
+    connectionwrappers = get_connections(config, list(nodes), silent=config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all nodes to read backend logs from (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            futures_sizes = {node: executor.submit(_remote_sizes, connectionwrappers[node].connection, globs) for node, globs in nodes.items()}
+            interface.breakdown_offsets = {node: x.result() for node, x in futures_sizes.items()}
+        return True
+    finally:
+        close_wrappers(connectionwrappers)
+
+
+def breakdown_collect(interface, idx, num_experiments):
+    '''Parses per-stage backend timings from log lines written during the experiment, and writes them to `<result_dir>/<result_file>.breakdown.json`.
+    Only lines matching a stage regex are transferred. Log files which shrank during the experiment (rotated) are read from the start.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        breakdown_logs (list((str, str))): Logs to parse, as `(distribution key, remote path glob)` pairs.
+        breakdown_stages (list((str, str))): Stages to extract, as `(label, regex)` pairs. See `parse_breakdown`.
+        result_dir (str): Result dir on the local machine.
+        result_file (str): Result file on the local machine.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    nodes = _log_nodes(interface)
+    if not any(nodes):
+        return True
+    offsets = getattr(interface, 'breakdown_offsets', dict())
+    # Remote filtering uses grep, which does not know Python's named and non-capturing groups.
+    combined = '|'.join('({})'.format(re.sub(r'\(\?(P<\w+>|:)', '(', regex)) for _, regex in config.breakdown_stages).replace("'", "'\\''")
+
+    connectionwrappers = get_connections(config, list(nodes), silent=config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all nodes to read backend logs from (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        def _read(node, wrapper):
+            sizes = _remote_sizes(wrapper.connection, nodes[node])
+            lines = []
+            for path, size in sizes.items():
+                start = offsets.get(node, dict()).get(path, 0)
+                start = start if start <= size else 0
+                out, _, _ = remoto.process.check(wrapper.connection, "tail -c +{} {} | grep -E '{}'".format(start+1, path, combined), shell=True)
+                lines += out
+            return lines
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            futures_read = {node: executor.submit(_read, node, connectionwrappers[node]) for node in nodes}
+            lines = {node: x.result() for node, x in futures_read.items()}
+    finally:
+        close_wrappers(connectionwrappers)
+
+    found = parse_breakdown((line for node_lines in lines.values() for line in node_lines), config.breakdown_stages)
+    per_node = {str(node.node_id): summarize_breakdown(parse_breakdown(node_lines, config.breakdown_stages)) for node, node_lines in lines.items()}
+    dest = fs.join(config.result_dir, '{}.breakdown.json'.format(config.result_file))
+    fs.mkdir(config.result_dir, exist_ok=True)
+    with open(dest, 'w') as f:
+        json.dump({'created': datetime.now().isoformat(), 'result_file': config.result_file, 'order': [label for label, _ in config.breakdown_stages], 'stages': summarize_breakdown(found), 'nodes': per_node}, f, indent=2)
+    if not any(any(x) for x in found.values()):
+        printw('No backend stage timings found in logs. Check "breakdown_logs" and "breakdown_stages".')
+    else:
+        print('Stored backend time breakdown ({} measurements) at: {}'.format(sum(len(x) for x in found.values()), dest))
+    return True
+
+
+def register_breakdown_functions(interface, idx, num_experiments):
+    '''Registers backend time breakdown collection. Log offsets are recorded when the experiment starts, timings are parsed when fetching results.'''
+    interface.register('monitor_start_funcs', lambda iface: breakdown_start(iface, idx, num_experiments))
+    interface.register('result_fetch_funcs', lambda iface: breakdown_collect(iface, idx, num_experiments))
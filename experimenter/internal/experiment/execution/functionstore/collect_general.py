@@ -0,0 +1,185 @@
+import concurrent.futures
+from datetime import datetime
+import hashlib
+import json
+import subprocess
+import tempfile
+import time
+
+import remoto
+
+from experimenter.internal.remoto.ssh_wrapper import get_wrappers, close_wrappers
+
+import utils.fs as fs
+from utils.printer import *
+
+
+def _merge_kwargs(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
+
+def _get_connections(config, nodes):
+    ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
+    if config.key_path:
+        ssh_kwargs['IdentityFile'] = config.key_path
+    return get_wrappers(nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=config.silent)
+
+
+def _sha256(path):
+    '''Returns sha256 hexdigest of a local file.'''
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _remote_list(connection, globs, newer_than, older_than):
+    '''Lists remote files matching given globs, which changed in a time window relative to the current time.
+    Note: We compute the time window using the remote clock, so clock skew between our machine and the remote does not matter.
+    Args:
+        connection (remoto.Connection): Connection to remote.
+        globs (iterable(str)): Remote path globs to list.
+        newer_than (int): Only list files modified at most this many seconds ago.
+        older_than (int): Only list files modified at least this many seconds ago.
+
+    Returns:
+        `list((str, int, str))` of `(absolute path, size in bytes, sha256 hexdigest)` tuples on success, `None` on failure.'''
+    cmd = 'now=$(date +%s); for f in {}; do if [ -f "$f" ] && [ "$(stat -c %Y "$f")" -ge "$(( now - {} ))" ] && [ "$(stat -c %Y "$f")" -le "$(( now - {} ))" ]; then echo "$(stat -c %s "$f") $(sha256sum "$f")"; fi; done'.format(' '.join(globs), int(newer_than), int(older_than))
+    out, err, exitcode = remoto.process.check(connection, cmd, shell=True)
+    if exitcode != 0:
+        return None
+    found = []
+    for line in out:
+        size, checksum, path = line.strip().split(None, 2)
+        found.append((path, int(size), checksum))
+    return found
+
+
+def _rsync_files(ssh_config_path, host, paths, dest_dir):
+    '''Fetches a series of absolute remote paths from one host, using one compressed rsync transfer. Remote directory structure is recreated inside `dest_dir`.
+    Returns:
+        `True` on success, `False` on failure.'''
+    fs.mkdir(dest_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(mode='w') as listfile:
+        listfile.write('\n'.join(paths)+'\n')
+        listfile.flush()
+        return subprocess.call('rsync -e "ssh -F {}" -q -z -aHAX --inplace --files-from={} {}:/ {}'.format(ssh_config_path, listfile.name, host, dest_dir), shell=True) == 0
+
+
+def _collect_node(wrapper, node, group, globs, dest_dir, window, tries, known):
+    '''Collects artifacts from a single node: Lists, transfers, and verifies.
+    Args:
+        wrapper (RemotoSSHWrapper): Open connection to `node`.
+        node (metareserve.Node): Node to collect from.
+        group (str): Distribution key `node` belongs to.
+        globs (list(str)): Remote path globs to collect.
+        dest_dir (str): Local directory to place artifacts of this node in.
+        window ((int, int)): Only files changed at most `window[0]` and at least `window[1]` seconds ago are collected.
+        tries (int): Amount of transfer attempts for files failing verification.
+        known (dict(str, str)): Mapping from local path to sha256 hexdigest for files verified by an earlier collection. These are not transferred again.
+
+    Returns:
+        `list(dict)` containing one manifest entry per artifact.'''
+    listing = _remote_list(wrapper.connection, globs, *window)
+    if listing == None:
+        return [{'group': group, 'node_id': node.node_id, 'host': node.ip_public, 'remote': x, 'local': None, 'size': None, 'sha256': None, 'status': 'list_failed'} for x in globs]
+
+    entries = [{'group': group, 'node_id': node.node_id, 'host': node.ip_public, 'remote': path, 'local': fs.join(dest_dir, path.lstrip('/')), 'size': size, 'sha256': checksum, 'status': 'pending'} for path, size, checksum in listing]
+    for entry in entries:
+        if known.get(entry['local']) == entry['sha256'] and fs.isfile(entry['local']):
+            entry['status'] = 'verified'
+
+    for _ in range(tries):
+        pending = [x for x in entries if x['status'] != 'verified']
+        if not any(pending):
+            break
+        _rsync_files(wrapper.ssh_config_path, node.ip_public, [x['remote'] for x in pending], dest_dir)
+        for entry in pending:
+            if not fs.isfile(entry['local']):
+                entry['status'] = 'missing'
+            elif _sha256(entry['local']) != entry['sha256']:
+                entry['status'] = 'checksum_mismatch' # Files that change during collection (e.g. still-running logs) end up here.
+            else:
+                entry['status'] = 'verified'
+    return entries
+
+
+def collect_results_default(interface, idx, num_experiments, artifacts=None, connectionwrappers=None):
+    '''Collects declared artifacts (logs, eventlogs, etc.) from all relevant nodes in parallel.
+    Per node, files are listed and checksummed remotely, fetched with one compressed rsync transfer, and verified locally.
+    A manifest describing all artifacts is written alongside them.
+    When collection is executed again for the same execution, verified artifacts listed in the existing manifest are not transferred again.
+    Note: Artifact collection is best-effort: Failures are recorded in the manifest and reported, but do not fail the execution.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+        artifacts (optional list((str, str))): If set, collects these `(distribution key, remote path glob)` pairs instead of the configured ones.
+        connectionwrappers (optional dict(metareserve.Node, RemotoSSHWrapper)): If set, uses given open connections. Must contain a connection for every node to collect from.
+
+    Required config args:
+        collect_artifacts (list((str, str))): Artifacts to collect, as `(distribution key, remote path glob)` pairs.
+        collect_tries (int): Amount of transfer attempts for files failing verification.
+        result_dir (str): Result dir on the local machine.
+        result_file (str): Result file on the local machine. Artifacts are stored in a directory named after this file.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    artifacts = artifacts if artifacts != None else config.collect_artifacts
+    if not any(artifacts):
+        return True
+
+    groups = dict()
+    for group, glob in artifacts:
+        if not group in interface.distribution:
+            printw('Cannot collect artifact "{}": Distribution has no "{}" nodes.'.format(glob, group))
+            continue
+        groups.setdefault(group, []).append(glob)
+    tasks = [(group, node, globs) for group, globs in groups.items() for node in interface.distribution[group]]
+    if not any(tasks):
+        return True
+
+    artifact_dir = fs.join(config.result_dir, '{}.artifacts'.format(config.result_file))
+    manifest_path = fs.join(artifact_dir, 'manifest.json')
+    known = dict()
+    if fs.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            known = {x['local']: x['sha256'] for x in json.load(f)['artifacts'] if x['status'] == 'verified'}
+    # Only collect files changed during the experiment stage (with a margin), so we never collect files of other executions.
+    now = time.time()
+    window = (now - interface.experiment_start_time + 60 if interface.experiment_start_time else 24*60*60, max(0, now - interface.experiment_end_time - 60) if interface.experiment_end_time else 0)
+
+    local_connections = connectionwrappers == None
+    if local_connections:
+        connectionwrappers = _get_connections(config, list(set(node for _, node, _ in tasks)))
+    if not all(connectionwrappers.get(node) for _, node, _ in tasks):
+        printe('Could not connect to all nodes to collect artifacts from.')
+        if local_connections:
+            close_wrappers(connectionwrappers)
+        return False
+
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures_collect = [executor.submit(_collect_node, connectionwrappers[node], node, group, globs, fs.join(artifact_dir, group, str(node.node_id)), window, config.collect_tries, known) for group, node, globs in tasks]
+        entries = [entry for x in futures_collect for entry in x.result()]
+    if local_connections:
+        close_wrappers(connectionwrappers)
+
+    fs.mkdir(artifact_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump({'created': datetime.now().isoformat(), 'result_file': config.result_file, 'artifacts': entries}, f, indent=2)
+
+    failed = [x for x in entries if x['status'] != 'verified']
+    print('Collected {}/{} artifacts ({:.2f} MB) from {} nodes in {:.1f} seconds (iteration {}/{}).'.format(len(entries)-len(failed), len(entries), sum(x['size'] for x in entries if x['size'])/1024/1024, len(tasks), time.time()-start, idx+1, num_experiments))
+    if any(failed):
+        printw('Could not collect {} artifacts. See manifest for details: {}'.format(len(failed), manifest_path))
+    return True
+
+
+def register_default_collect_function(interface, idx, num_experiments, artifacts=None):
+    '''Registers artifact collection as a result fetch function.'''
+    interface.register('result_fetch_funcs', lambda iface: collect_results_default(iface, idx, num_experiments, artifacts=artifacts))
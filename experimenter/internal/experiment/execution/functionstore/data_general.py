@@ -1,8 +1,16 @@
+import concurrent.futures
+import subprocess
+import time
+
 import data_deploy
 import metareserve
+import remoto
 
 import experimenter.internal.data as data
+from experimenter.internal.remoto.ssh_wrapper import close_wrappers
+from experimenter.internal.experiment.execution.functionstore.util import get_connections, all_open
 
+import utils.fs as fs
 from utils.printer import *
 
 
@@ -13,6 +21,288 @@ def _merge_kwargs(x, y):
     return z
 
 
+def _expected_layout(data_path, copy_multiplier, link_multiplier):
+    '''Computes the remote file layout for a dataset. For a file "name.ext", copy `c` is named "name_c.ext", and link `l` of copy `c` is named "name_c_l.ext".
+    Returns:
+        `list((str, list(str)))`, with a `(copy name, link names)` tuple for every copy.'''
+    name = fs.basename(data_path)
+    stem, dot, ext = name.rpartition('.')
+    if not dot:
+        stem, ext = name, ''
+    ext = dot+ext
+    return [('{}_{}{}'.format(stem, c, ext), ['{}_{}_{}{}'.format(stem, c, l, ext) for l in range(1, link_multiplier)]) for c in range(copy_multiplier)]
+
+
+def _remote_inventory(connection, remote_dir, layout_names=None):
+    '''Inventories regular files directly inside a remote directory.
+    Args:
+        connection (remoto.Connection): Connection to remote.
+        remote_dir (str): Directory to inventory.
+        layout_names (optional iterable(str)): If set, also reads the CephFS object size of these files (if they exist).
+
+    Returns:
+        `dict(str, (int, int, int or None))` on success, mapping filenames to `(size, inode, object size)`. `None` on failure.'''
+    out, err, exitcode = remoto.process.check(connection, 'cd {} 2>/dev/null || exit 0; find . -maxdepth 1 -type f -printf "%f %s %i\\n"'.format(remote_dir), shell=True)
+    if exitcode != 0:
+        return None
+    inventory = dict()
+    for line in out:
+        name, size, inode = line.strip().rsplit(' ', 2)
+        inventory[name] = (int(size), int(inode), None)
+
+    layout_names = [x for x in layout_names if x in inventory] if layout_names else []
+    if any(layout_names):
+        out, err, exitcode = remoto.process.check(connection, 'cd {} && for f in {}; do echo "$f $(getfattr --only-values -n ceph.file.layout.object_size "$f" 2>/dev/null)"; done'.format(remote_dir, ' '.join(layout_names)), shell=True)
+        if exitcode != 0:
+            return None
+        for line in out:
+            name, _, object_size = line.strip().partition(' ')
+            if object_size.isdigit():
+                inventory[name] = inventory[name][:2]+(int(object_size),)
+    return inventory
+
+
+def plan_incremental_deploy(layout, inventory, size, object_size=None):
+    '''Computes which remote actions are needed to turn the remote directory into the expected layout.
+    Args:
+        layout (list((str, list(str)))): Expected layout, as produced by `_expected_layout`.
+        inventory (dict(str, (int, int, int or None))): Current directory contents, as produced by `_remote_inventory`.
+        size (int): Size of the source file in bytes.
+        object_size (optional int): If set, copies with a different CephFS object size are recreated.
+
+    Returns:
+        `(bool, list((str, str)), list((str, str)), list(str))`: Whether the source file must be uploaded (to the name of the first copy, because no valid copy exists),
+        `(source, destination)` pairs to copy, `(target, link name)` pairs to (re)link, and names of files to remove.'''
+    valid_copies = [name for name, _ in layout if name in inventory and inventory[name][0] == size and (object_size == None or inventory[name][2] == object_size)]
+    upload = not any(valid_copies)
+    origin = valid_copies[0] if valid_copies else layout[0][0]
+
+    copies, links = [], []
+    for name, link_names in layout:
+        fresh = not name in valid_copies # A recreated copy gets a new inode: All its links must be recreated too.
+        if fresh and not (upload and name == origin):
+            copies.append((origin, name))
+        links += [(name, x) for x in link_names if fresh or not (x in inventory and inventory[x][1] == inventory[name][1])]
+    expected = set(name for name, _ in layout).union(x for _, link_names in layout for x in link_names)
+    removals = sorted(x for x in inventory if not x in expected)
+    return upload, copies, links, removals
+
+
+def _deploy_incremental_node(config, node, wrapper, remote_dir, object_size):
+    '''Performs incremental data deployment for a single node. See `deploy_data_incremental`.
+    Returns:
+        `True` on success, `False` on failure.'''
+    layout = _expected_layout(config.data_path, config.copy_multiplier, config.link_multiplier)
+    inventory = _remote_inventory(wrapper.connection, remote_dir, layout_names=[x for x, _ in layout] if object_size else None)
+    if inventory == None:
+        printe('Could not inventory "{}" on node {}'.format(remote_dir, node.node_id))
+        return False
+    upload, copies, links, removals = plan_incremental_deploy(layout, inventory, fs.sizeof(config.data_path), object_size=object_size)
+    print('Incremental deployment on node {}: {} existing files, upload={}, {} copies, {} links, {} removals.'.format(node.node_id, len(inventory), upload, len(copies), len(links), len(removals)))
+
+    cmds = ['mkdir -p {0}'.format(remote_dir)]
+    if object_size: # New files inherit the directory layout.
+        cmds.append('setfattr -n ceph.dir.layout -v "stripe_unit={0} stripe_count=1 object_size={0}" {1}'.format(object_size, remote_dir))
+    if any(removals):
+        cmds.append('cd {} && rm -f {}'.format(remote_dir, ' '.join(removals)))
+    if not all(remoto.process.check(wrapper.connection, x, shell=True)[2] == 0 for x in cmds):
+        printe('Could not prepare "{}" on node {}'.format(remote_dir, node.node_id))
+        return False
+
+    if upload:
+        if subprocess.call('rsync -e "ssh -F {}" -q -aHAX {} {}:{}'.format(wrapper.ssh_config_path, config.data_path, node.ip_public, fs.join(remote_dir, layout[0][0])), shell=True) != 0:
+            printe('Could not upload "{}" to node {}'.format(config.data_path, node.node_id))
+            return False
+    # Many small commands would cost a roundtrip each. Instead, we send one script.
+    script = ['cd {}'.format(remote_dir)]
+    script += ['cp {} {}'.format(src, dst) for src, dst in copies]
+    script += ['ln -f {} {}'.format(target, name) for target, name in links]
+    if len(script) > 1:
+        _, err, exitcode = remoto.process.check(wrapper.connection, ' && '.join(script), shell=True)
+        if exitcode != 0:
+            printe('Could not create copies and links in "{}" on node {}: {}'.format(remote_dir, node.node_id, '\n'.join(err)))
+            return False
+    return True
+
+
+def deploy_data_incremental(interface, idx, num_experiments, nodes, object_size=None):
+    '''Deploys data incrementally: Inventories what already exists in the remote data directory, and only transfers or creates the delta.
+    Consecutive executions with the same data, but a different `link_multiplier`, only add (or remove) links.
+    The source file is only uploaded when no valid copy exists on the remote.
+    Warning: Removes all files from `remote_data_dir` that are not part of the deployed dataset, as Spark reads all files inside it.
+    Note: The remote naming scheme differs from the one used by data-deploy. Switching between modes redeploys everything once.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+        nodes (list(metareserve.Nodes)): Nodes to deploy data for. Every node gets its own copy. For shared filesystems, pass 1 node.
+        object_size (optional int): If set, `remote_data_dir` is on CephFS, and files must have this object size (in bytes).
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        data_path (str): Path to data to transmit.
+        remote_data_dir (str): Data destination directory on remote.
+        copy_multiplier (int): Amount of copies of each file to make on the remote.
+        link_multiplier (int): Amount of hardlinks of each file to make on the remote.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    if not fs.isfile(config.data_path):
+        printe('Incremental data deployment requires "data_path" to be a file: {}'.format(config.data_path))
+        return False
+    connectionwrappers = get_connections(config, nodes, silent=config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all data deployment nodes (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            futures_deploy = [executor.submit(_deploy_incremental_node, config, node, connectionwrappers[node], config.remote_data_dir, object_size) for node in nodes]
+            return all(x.result() for x in futures_deploy)
+    finally:
+        close_wrappers(connectionwrappers)
+
+
+def _striped_tasks(data_path, copy_multiplier, link_multiplier):
+    '''Computes upload tasks for striped deployment. `data_path` may be a single file, or a directory of distinct files.
+    Returns:
+        `list((str, str, int))` of `(local source path, remote name, size in bytes)` upload tasks, and `list((str, str))` of `(target, link name)` pairs.'''
+    sources = [data_path] if fs.isfile(data_path) else sorted(fs.ls(data_path, only_files=True, full_paths=True))
+    tasks, links = [], []
+    for source in sources:
+        for name, link_names in _expected_layout(source, copy_multiplier, link_multiplier):
+            tasks.append((source, name, fs.sizeof(source)))
+            links += [(name, x) for x in link_names]
+    return tasks, links
+
+
+def _assign_streams(tasks, num_streams):
+    '''Distributes tasks over streams, largest first, always to the least loaded stream (longest-processing-time-first).
+    Returns:
+        `list(list((str, str, int)))`, containing tasks for each stream.'''
+    streams = [[] for _ in range(num_streams)]
+    loads = [0]*num_streams
+    for task in sorted(tasks, key=lambda x: (-x[2], x[1])):
+        idx = loads.index(min(loads))
+        streams[idx].append(task)
+        loads[idx] += task[2]
+    return streams
+
+
+def _local_copy(source, destination, chunk_size):
+    '''Copies a file writing `chunk_size` bytes at a time, emulating object-granular writes on a local directory stand-in.'''
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        for chunk in iter(lambda: src.read(chunk_size), b''):
+            dst.write(chunk)
+    return True
+
+
+def _upload_stream(transport, tasks):
+    '''Uploads tasks sequentially using given transport.
+    Args:
+        transport (callable): Function taking a local source path and remote name, returning `True` on success, `False` on failure.
+        tasks (list((str, str, int))): Upload tasks, as produced by `_striped_tasks`.
+
+    Returns:
+        `(bool, int, float)`: Success value, amount of bytes transferred, and time taken in seconds.'''
+    start = time.time()
+    transferred = 0
+    for source, name, size in tasks:
+        if not transport(source, name):
+            printe('Could not upload "{}" as "{}"'.format(source, name))
+            return False, transferred, time.time()-start
+        transferred += size
+    return True, transferred, time.time()-start
+
+
+def deploy_data_striped(interface, idx, num_experiments, nodes, shared=True, object_size=None):
+    '''Deploys data using parallel upload streams. Every copy is uploaded directly (no remote copying), and only hardlinks are created remotely.
+    For shared filesystems (e.g. CephFS), uploads are spread over all given client nodes, each using `data_deploy_streams` streams.
+    Otherwise, every node receives the full dataset over its own `data_deploy_streams` streams.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+        nodes (list(metareserve.Nodes)): Client nodes to upload through.
+        shared (optional bool): If set, `remote_data_dir` is shared between all nodes.
+        object_size (optional int): If set, `remote_data_dir` is on CephFS, and files are written with this object size (in bytes).
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        data_path (str): Path to data to transmit. Either a file, or a directory containing distinct files.
+        remote_data_dir (str): Data destination directory on remote.
+        copy_multiplier (int): Amount of copies of each file to make on the remote.
+        link_multiplier (int): Amount of hardlinks of each file to make on the remote.
+        data_deploy_streams (int): Amount of parallel upload streams per client node.
+        data_deploy_local_dir (str or None): If set, deploys to this local directory instead of to the nodes. Used for testing.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    tasks, links = _striped_tasks(config.data_path, config.copy_multiplier, config.link_multiplier)
+    if not any(tasks):
+        printe('No data found to deploy at: {}'.format(config.data_path))
+        return False
+
+    if config.data_deploy_local_dir:
+        fs.mkdir(config.data_deploy_local_dir, exist_ok=True)
+        transport = lambda source, name: _local_copy(source, fs.join(config.data_deploy_local_dir, name), object_size if object_size else 4*1024*1024)
+        streams = [('local', x, transport) for x in range(config.data_deploy_streams)]
+        connectionwrappers = dict()
+    else:
+        connectionwrappers = get_connections(config, nodes, silent=config.silent)
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all data deployment nodes (iteration {}/{})'.format(idx+1, num_experiments))
+            close_wrappers(connectionwrappers)
+            return False
+        cmd = 'mkdir -p {0}'.format(config.remote_data_dir)
+        if object_size: # Files inherit the directory layout when created. We write in-place, so objects are written directly with the right size.
+            cmd += ' && setfattr -n ceph.dir.layout -v "stripe_unit={0} stripe_count=1 object_size={0}" {1}'.format(object_size, config.remote_data_dir)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            futures_prepare = [executor.submit(remoto.process.check, connectionwrappers[x].connection, cmd, shell=True) for x in (nodes[:1] if shared else nodes)]
+            if not all(x.result()[2] == 0 for x in futures_prepare):
+                printe('Could not prepare "{}" for deployment (iteration {}/{})'.format(config.remote_data_dir, idx+1, num_experiments))
+                close_wrappers(connectionwrappers)
+                return False
+        make_transport = lambda node: lambda source, name: subprocess.call('rsync -e "ssh -F {}" -q -aHAX --inplace {} {}:{}'.format(connectionwrappers[node].ssh_config_path, source, node.ip_public, fs.join(config.remote_data_dir, name)), shell=True) == 0
+        streams = [(node.node_id, x, make_transport(node)) for x in range(config.data_deploy_streams) for node in nodes]
+
+    try:
+        # Shared: One stream set covering all tasks. Otherwise: Every node needs all tasks.
+        groups = [streams] if shared or config.data_deploy_local_dir else [[x for x in streams if x[0] == node.node_id] for node in nodes]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(streams)) as executor:
+            futures_upload = [(stream, executor.submit(_upload_stream, stream[2], stream_tasks)) for group in groups for stream, stream_tasks in zip(group, _assign_streams(tasks, len(group))) if any(stream_tasks)]
+            results = [(stream, x.result()) for stream, x in futures_upload]
+        for (node_id, stream_idx, _), (_, transferred, duration) in results:
+            print('    Stream {}/{}: {:.2f} MB in {:.2f} seconds ({:.2f} MB/s)'.format(node_id, stream_idx, transferred/1024/1024, duration, transferred/1024/1024/duration if duration > 0 else 0))
+        total = sum(x[1] for _, x in results)
+        wallclock = max(x[2] for _, x in results)
+        print('Striped deployment: {:.2f} MB over {} streams in {:.2f} seconds ({:.2f} MB/s aggregate).'.format(total/1024/1024, len(results), wallclock, total/1024/1024/wallclock if wallclock > 0 else 0))
+        if not all(x[0] for _, x in results):
+            printe('Striped data deployment failed (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+
+        if not any(links):
+            return True
+        if config.data_deploy_local_dir:
+            for target, name in links:
+                fs.rm(config.data_deploy_local_dir, name, ignore_errors=True)
+                fs.ln(fs.join(config.data_deploy_local_dir, target), fs.join(config.data_deploy_local_dir, name), soft=False)
+            return True
+        script = 'cd {} && {}'.format(config.remote_data_dir, ' && '.join('ln -f {} {}'.format(target, name) for target, name in links))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            futures_link = [executor.submit(remoto.process.check, connectionwrappers[x].connection, script, shell=True) for x in (nodes[:1] if shared else nodes)]
+            if not all(x.result()[2] == 0 for x in futures_link):
+                printe('Could not create hardlinks in "{}" (iteration {}/{})'.format(config.remote_data_dir, idx+1, num_experiments))
+                return False
+        return True
+    finally:
+        if connectionwrappers: # No connections are opened when deploying to a local directory.
+            close_wrappers(connectionwrappers)
+
+
 def deploy_data_default(interface, idx, num_experiments, nodes, *args, plugin='star_remote', **kwargs):
     '''Uses the data-deploy package to get data to a series of nodes.
     Args:
@@ -32,10 +322,16 @@ def deploy_data_default(interface, idx, num_experiments, nodes, *args, plugin='s
         link_multiplier (int): Amount of hardlinks of each file to make on the remote.
         ceph_silent (bool): Indication whether Ceph output must be suppressed.
         silent (bool): Indication whether general output must be suppressed.
+        data_deploy_incremental (bool): If set, deploys incrementally using `deploy_data_incremental`. Ignores `plugin`, `*args` and `**kwargs`.
+        data_deploy_striped (bool): If set (and `data_deploy_incremental` is not), deploys using parallel streams with `deploy_data_striped`. Ignores `plugin`, `*args` and `**kwargs`.
 
     Returns:
         `True` on success, `False` on failure.'''
     config = interface.config
+    if config.data_deploy_incremental:
+        return deploy_data_incremental(interface, idx, num_experiments, nodes)
+    if config.data_deploy_striped:
+        return deploy_data_striped(interface, idx, num_experiments, nodes, shared=False)
     return data_deploy.deploy(metareserve.Reservation(nodes), *args, key_path=config.key_path, paths=[config.data_path], dest=config.remote_data_dir, copy_multiplier=config.copy_multiplier, link_multiplier=config.link_multiplier, silent=config.ceph_silent or config.silent, plugin=plugin, **kwargs)
 
 
@@ -1,3 +1,5 @@
+from rados_deploy import StorageType
+
 from utils.printer import *
 
 def distribute_default(interface):
@@ -17,8 +19,107 @@ def distribute_default(interface):
     num_ceph_nodes = node_config.num_ceph_nodes
 
     if len(reservation_nodes) < num_spark_nodes+num_ceph_nodes:
-        printe('Not enough nodes reserved to satisfy largest experiment configuration. Have {} nodes, need {} ({} Spark nodes + {} Ceph nodes)'.format(reserved_nodes_len, len(max_node_conf), max_node_conf.num_spark_nodes, max_node_conf.num_ceph_nodes))
+        printe('Not enough nodes reserved to satisfy largest experiment configuration. Have {} nodes, need {} ({} Spark nodes + {} Ceph nodes)'.format(len(reservation_nodes), len(node_config), num_spark_nodes, num_ceph_nodes))
         return False, None
     rados_ceph_nodes = reservation_nodes[:num_ceph_nodes]
     spark_nodes = reservation_nodes[num_ceph_nodes:num_ceph_nodes+num_spark_nodes]
-    return True, {'spark': spark_nodes, 'rados_ceph': rados_ceph_nodes}
\ No newline at end of file
+    return True, {'spark': spark_nodes, 'rados_ceph': rados_ceph_nodes}
+
+
+def _to_number(value, default=0):
+    '''Parses numbers like "16", "64G", "65536MB" (sizes are returned in MB), returns `default` for missing or malformed values.'''
+    if value == None:
+        return default
+    string = str(value).strip().upper().rstrip('B').rstrip('I')
+    multipliers = {'K': 1/1024, 'M': 1, 'G': 1024, 'T': 1024*1024}
+    try:
+        if string and string[-1] in multipliers:
+            return float(string[:-1])*multipliers[string[-1]]
+        return float(string)
+    except ValueError:
+        return default
+
+
+def _to_bool(value):
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _node_traits(node):
+    '''Reads hardware and topology information of a node from its `extra_info`. All keys are optional:
+        hostname (str): Name of the node. Used for deterministic tie-breaking.
+        rack, switch (str): Name of the rack/switch the node is attached to.
+        site (str): Name of the site the node is located at.
+        cores (int): Amount of CPU cores.
+        memory (str): Amount of memory, e.g. "64G".
+        nvme (bool): Whether the node has a NVMe device.
+        device_path (str): Storage device path for Ceph bluestore. NVMe presence is inferred from this path when `nvme` is unset.
+
+    Returns:
+        `dict(str, Any)` with keys 'domain', 'cores', 'memory', 'has_nvme', 'has_device', 'name'.'''
+    info = node.extra_info if node.extra_info else dict()
+    site = str(info.get('site', ''))
+    rack = str(info.get('rack', info.get('switch', '')))
+    device_path = str(info.get('device_path', ''))
+    return {
+        'domain': (site, rack), # Nodes in the same domain share a switch.
+        'cores': _to_number(info.get('cores')),
+        'memory': _to_number(info.get('memory')),
+        'has_nvme': _to_bool(info['nvme']) if 'nvme' in info else 'nvme' in device_path,
+        'has_device': bool(device_path) or ('nvme' in info and _to_bool(info['nvme'])),
+        'name': str(info.get('hostname', getattr(node, 'ip_local', ''))),
+    }
+
+
+def distribute_topology(interface):
+    '''Hardware- and topology-aware node distributor. Uses `metareserve.Node.extra_info` (see `_node_traits` for the keys we read) to:
+     1. Place Ceph OSDs on nodes with the right storage device (NVMe for bluestore) and the most memory for memstore.
+     2. Place Spark nodes in as few switch domains (rack or site) as possible, preferring the domains hosting Ceph, to minimise cross-switch traffic.
+    Nodes without extra info are treated as equal and distributed in `node_id` order. The distribution is deterministic for a given reservation: It does not depend on node ordering in the reservation.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+
+    Required config args:
+        node config (NodeConfiguration): Node configuration to distribute nodes for.
+        ceph_store_type (rados_deploy.StorageType): Storage backend type to use: MEMSTORE or BLUESTORE.
+        ceph_bluestore_path_override (str or None): If set, all nodes are assumed to have the given storage device.
+
+    Returns:
+        `True`, `dict(name, list(metareserve.Node))` on success, `False`, `None` on failure.'''
+    config = interface.config
+    node_config = config.node_config
+    num_spark_nodes = node_config.num_spark_nodes
+    num_ceph_nodes = node_config.num_ceph_nodes
+
+    reservation_nodes = sorted(interface.reservation.nodes, key=lambda x: x.node_id)
+    if len(reservation_nodes) < num_spark_nodes+num_ceph_nodes:
+        printe('Not enough nodes reserved to satisfy experiment configuration. Have {} nodes, need {} ({} Spark nodes + {} Ceph nodes)'.format(len(reservation_nodes), len(node_config), num_spark_nodes, num_ceph_nodes))
+        return False, None
+
+    traits = {x: _node_traits(x) for x in reservation_nodes}
+    tiebreak = lambda node: (traits[node]['domain'], traits[node]['name'], node.node_id)
+    domain_sizes = dict()
+    for node in reservation_nodes:
+        domain_sizes[traits[node]['domain']] = domain_sizes.get(traits[node]['domain'], 0) + 1
+
+    # Ceph: Storage fitness first, then prefer large domains (more room to co-locate Spark), then hardware.
+    if config.ceph_store_type == StorageType.BLUESTORE:
+        fitness = lambda node: (not (traits[node]['has_nvme'] or config.ceph_bluestore_path_override), not (traits[node]['has_device'] or config.ceph_bluestore_path_override))
+    else:
+        fitness = lambda node: (-traits[node]['memory'],)
+    ceph_order = sorted(reservation_nodes, key=lambda node: fitness(node)+(-domain_sizes[traits[node]['domain']], -traits[node]['cores'], -traits[node]['memory'])+tiebreak(node))
+    rados_ceph_nodes = ceph_order[:num_ceph_nodes]
+    if config.ceph_store_type == StorageType.BLUESTORE and not config.ceph_bluestore_path_override and any(x for x in rados_ceph_nodes if not traits[x]['has_device']):
+        printw('Not enough nodes with a known storage device to host all Ceph OSDs. Using {} nodes without a known device.'.format(sum(1 for x in rados_ceph_nodes if not traits[x]['has_device'])))
+
+    # Spark: Fill domains hosting Ceph first, then the largest remaining domains, so executors share as few switches as possible.
+    ceph_domains = set(traits[x]['domain'] for x in rados_ceph_nodes)
+    remaining = [x for x in reservation_nodes if not x in rados_ceph_nodes]
+    remaining_sizes = dict()
+    for node in remaining:
+        remaining_sizes[traits[node]['domain']] = remaining_sizes.get(traits[node]['domain'], 0) + 1
+    spark_order = sorted(remaining, key=lambda node: (not traits[node]['domain'] in ceph_domains, -remaining_sizes[traits[node]['domain']], -traits[node]['cores'], -traits[node]['memory'])+tiebreak(node))
+    spark_nodes = spark_order[:num_spark_nodes]
+
+    num_spark_domains = len(set(traits[x]['domain'] for x in spark_nodes))
+    print('Topology-aware distribution: {} Ceph nodes in {} domain(s), {} Spark nodes in {} domain(s).'.format(len(rados_ceph_nodes), len(ceph_domains), len(spark_nodes), num_spark_domains))
+    return True, {'spark': spark_nodes, 'rados_ceph': rados_ceph_nodes}
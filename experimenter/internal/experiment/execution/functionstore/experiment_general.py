@@ -1,11 +1,17 @@
 import concurrent.futures
+import math
+import re
 import subprocess
+import time
 
 import metareserve
+import remoto
 import spark_deploy
 
 import experimenter.internal.experiment.blocker as blocker
+import experimenter.internal.experiment.fingerprint as fingerprint
 from experimenter.internal.remoto.ssh_wrapper import get_wrapper, get_wrappers, close_wrappers
+import experimenter.internal.result.stats as stats
 import experimenter.internal.result.util as func_util
 
 from experimenter.internal.experiment.execution.functionstore.util import get_user_home
@@ -32,24 +38,94 @@ def _get_connections(config, spark_nodes):
     return get_wrappers(spark_nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=config.spark_silent or config.silent)
 
 
-def _submit_blocking(config, command, spark_nodes, spark_master_id, connectionwrappers=None):
+def _process_pattern(remote_result_loc):
+    '''Returns a `pgrep -f` pattern matching the application writing to given result file. The bracket prevents matching the shell executing the pattern.'''
+    return '[-]-result-path .*{}'.format(fs.basename(remote_result_loc))
+
+
+def _find_driver(config, connectionwrappers, spark_master_id, remote_result_loc, ignore=None, completed=False):
+    '''Finds the node running the driver in cluster deploy mode. First asks the Spark master (see `remote_driver_find`), which needs only 1 command on the master node per check.
+    If the master status is unavailable, falls back to searching the result file on all nodes (see `remote_file_find`).
+    Args:
+        config (ExperimentConfiguration): Configuration to read control parameters from.
+        connectionwrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to all Spark nodes.
+        spark_master_id (int): Node id of the Spark master node.
+        remote_result_loc (str): Remote result file path.
+        ignore (optional set(str)): Driver ids to ignore. See `remote_driver_find`.
+        completed (optional bool): If set, also considers completed drivers. See `remote_driver_find`.
+
+    Returns:
+        `int`, the node id of the node running the driver, or `None` if it could not be found.'''
+    master_connection = next(wrapper.connection for node, wrapper in connectionwrappers.items() if node.node_id == spark_master_id)
+    state, val = blocker.block_with_value(func_util.remote_driver_find, args=(master_connection, list(connectionwrappers.keys()), config.spark_master_webui_port, ignore, completed), return_val=True, sleeptime=1, dead_after_tries=30)
+    if state != blocker.BlockState.COMPLETE:
+        printw('Could not find driver using the Spark master status. Searching result file on all nodes...')
+        state, val = blocker.block_with_value(func_util.remote_file_find, args=(connectionwrappers, remote_result_loc), return_val=True, sleeptime=10, dead_after_tries=3)
+    if state != blocker.BlockState.COMPLETE:
+        return None
+    print('Found driver running on node_id={}'.format(val[0]))
+    return val[0]
+
+
+def _stop_application(config, connection, remote_result_loc):
+    '''Signals the application to stop by creating `<remote_result_loc>.stop`, which benchmarks may observe between runs.
+    If the application did not exit after `adaptive_stop_grace` seconds, we kill it. Afterwards, a partially written last result line is removed.
+    Args:
+        config (ExperimentConfiguration): Configuration to read control parameters from.
+        connection (remoto.Connection): Connection to the node running the driver.
+        remote_result_loc (str): Remote result file path.'''
+    pattern = _process_pattern(remote_result_loc)
+    cmd = 'touch {loc}.stop; for i in $(seq {tries}); do pgrep -f \'{pattern}\' > /dev/null || break; sleep 1; done; pkill -f \'{pattern}\'; [ -n "$(tail -c 1 {loc})" ] && sed -i \'$ d\' {loc}; rm -f {loc}.stop'.format(
+        loc=remote_result_loc, tries=config.adaptive_stop_grace, pattern=pattern)
+    remoto.process.check(connection, cmd, shell=True)
+
+
+def _prepare_resume(connection, remote_result_loc, marker):
+    '''Prepares a result file for a resumed attempt: Kills the application if it still runs, removes a partially written last result line, and appends an attempt marker line.
+    Args:
+        connection (remoto.Connection): Connection to the node running the driver.
+        remote_result_loc (str): Remote result file path.
+        marker (str): Attempt marker line to append (see `stats.attempt_marker`).
+
+    Returns:
+        `int`, the amount of result lines present.'''
+    pattern = _process_pattern(remote_result_loc)
+    cmd = 'pkill -f \'{pattern}\'; for i in $(seq 10); do pgrep -f \'{pattern}\' > /dev/null || break; sleep 1; done; pkill -9 -f \'{pattern}\'; touch {loc}; [ -n "$(tail -c 1 {loc})" ] && sed -i \'$ d\' {loc}; echo \'{marker}\' >> {loc}'.format(
+        pattern=pattern, loc=remote_result_loc, marker=marker)
+    remoto.process.check(connection, cmd, shell=True)
+    return func_util.remote_count_runs(connection, remote_result_loc)
+
+
+def _with_runs(application_args, runs):
+    '''Returns application arguments with the amount of runs (`-r <runs>`) replaced. Returns `None` if the arguments do not specify the amount of runs.'''
+    args, found = re.subn(r'(?<!\S)-r\s+[0-9]+', '-r {}'.format(runs), application_args, count=1)
+    return args if found else None
+
+
+def _submit_blocking(config, command_func, spark_nodes, spark_master_id, connectionwrappers=None):
     '''Submits Spark command. Waits on completion by checking the amount of results gathered to this point.
     If the system appears to have crashed, we reboot it and make it continue.
     Args:
         config (ExperimentConfiguration): Configuration to read control parameters from.
-        command (str): Command to provide to spark-submit.
+        command_func (function): Function taking the amount of runs the application must perform (or `None` for the configured amount), returning the command to provide to spark-submit.
         spark_nodes (list(metareserve.Node)): Nodes we run Spark on.
         spark_master_id (int): Node id of the Spark master node.
         connectionwrappers (dict(metareserve.Node, RemotoSSHWrapper)): If set, uses given connections. Otherwise, makes new ones.
 
+    Note: If config option `adaptive_rel_error` is set, we stop the application as soon as measurements converged (see `remote_check_convergence`), instead of waiting for all runs.
+    Note: If config option `driver_watch` is set, we also watch the driver (see `remote_watch_driver`), and abort an attempt as soon as the driver crashed, instead of waiting for results to time out.
+    Note: If config option `resume_runs` is set, retries only perform the missing runs, plus `resume_warmup_runs` warm-up runs. The result file records where each retry starts, and how many warm-up runs it performs (see `stats.attempt_marker`).
+          Resuming requires client deploy mode, as the driver must write to the same result file every attempt. Otherwise, retries perform all runs again.
+
     Returns:
-        `True` if the run is complete and we collected enough data. `False` if the run crashed too many times.'''
+        `(bool, int)`: `True` if the run is complete and we collected enough data, `False` if the run crashed too many times. The node id of the node running the driver (`None` when not submitted).'''
     local_connections = connectionwrappers == None
     if local_connections:
         connectionwrappers = _get_connections(config, spark_nodes)
     remote_result_loc = fs.join(config.remote_result_dir, config.remote_result_file)
 
-    lines_needed = config.runs
+    adaptive = bool(config.adaptive_rel_error)
+    lines_needed = config.adaptive_max_runs if adaptive else config.runs
 
     if any(True for path in config.local_application_paths if not (fs.exists(path) or fs.issymlink(path))):
         printe('Application data transfer found non-existing source paths:')
@@ -57,41 +133,88 @@ def _submit_blocking(config, command, spark_nodes, spark_master_id, connectionwr
             if not (fs.exists(path) or fs.issymlink(path)):
                 print('    {}'.format(path))
         printe('Mofidy config variable "local_application_paths" to change/remove these paths, or make sure files exist in the correct location.')
-        return False
+        return False, None
+
+    if config.driver_watch: # We check more often, but keep the same timeout for unchanged results.
+        sleeptime = min(config.driver_watch_interval, config.sleeptime)
+        dead_after_tries = math.ceil(config.dead_after_tries*config.sleeptime/sleeptime)
+    else:
+        sleeptime, dead_after_tries = config.sleeptime, config.dead_after_tries
+    marker = remote_result_loc+'.submitted'
+    driver_node_id = None
+    resume = config.resume_runs and config.spark_deploymode == 'client' and command_func(1) != None
+    command = command_func(None)
 
     for _try in range(config.tries):
+        if _try > 0 and resume:
+            present = _prepare_resume(connection, remote_result_loc, stats.attempt_marker(_try+1, config.resume_warmup_runs))
+            if present >= lines_needed: # The application completed right before we stopped it.
+                if local_connections:
+                    close_wrappers(connectionwrappers)
+                return True, driver_node_id
+            lines_needed += config.resume_warmup_runs
+            command = command_func(lines_needed-present)
+            print('Resuming with {} runs ({} warm-up), {} runs present (attempt {}/{}).'.format(lines_needed-present, config.resume_warmup_runs, present, _try+1, config.tries))
+        elif _try > 0:
+            lines_needed += 1 # +1 because we need a new line for warming caches.
+
+        prepare_cmds = ['rm -f {}'.format(remote_result_loc)] if _try == 0 else [] # Remove results of earlier executions.
+        if adaptive: # Remove stop signals from earlier executions.
+            prepare_cmds.append('rm -f {}.stop'.format(remote_result_loc))
+        if config.driver_watch: # Marks the submission time, to scan only logs written by this attempt.
+            prepare_cmds.append('mkdir -p {} && touch {}'.format(config.remote_result_dir, marker))
+        if any(prepare_cmds):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(connectionwrappers)) as executor:
+                futures_prepare = [executor.submit(remoto.process.check, x.connection, '; '.join(prepare_cmds), shell=True) for x in connectionwrappers.values()]
+                for x in futures_prepare:
+                    x.result()
+        if config.spark_deploymode == 'cluster': # Drivers running before submission are not ours.
+            status = func_util.remote_master_status(next(x.connection for node, x in connectionwrappers.items() if node.node_id == spark_master_id), config.spark_master_webui_port)
+            known_drivers = {x.get('id') for x in status.get('activedrivers', [])} if status else set()
+        submitted = time.time()
         if not spark_deploy.submit(metareserve.Reservation(spark_nodes), command, paths=config.local_application_paths, key_path=config.key_path, master_id=spark_master_id, use_sudo=config.spark_submit_with_sudo, silent=config.spark_silent or config.silent):
             printw('Could not submit application on remote. Used command: {}'.format(command))
             if local_connections:
                 close_wrappers(connectionwrappers)
-            return False
+            return False, None
 
         if config.spark_deploymode == 'client': # We know the driver is executed on the spark master node in client mode.
             driver_node_id = spark_master_id
         else: # We have to find the node that executes the driver in cluster mode.
-            state, val = blocker.block_with_value(func_util.remote_file_find, args=(connectionwrappers, remote_result_loc), return_val=True, sleeptime=10, dead_after_tries=3) 
-            if state == blocker.BlockState.COMPLETE:
-                driver_node_id = val[0]
-                print('Found driver running on node_id={}'.format(driver_node_id))
-            else:
+            driver_node_id = _find_driver(config, connectionwrappers, spark_master_id, remote_result_loc, ignore=known_drivers)
+            if driver_node_id == None:
                 if local_connections:
                     close_wrappers(connectionwrappers)
                 raise RuntimeError('Could not find results file on any node: {}'.format(remote_result_loc))
 
         driver_node = next(node for node, wrapper in connectionwrappers.items() if node.node_id == driver_node_id)
-        state, val = blocker.block_with_value(func_util.remote_count_lines, args=(connectionwrappers[driver_node].connection, remote_result_loc, lines_needed, config.spark_silent or config.silent), return_val=True, sleeptime=config.sleeptime, dead_after_tries=config.dead_after_tries)
+        connection = connectionwrappers[driver_node].connection
+        if adaptive:
+            check, check_args = func_util.remote_check_convergence, (connection, remote_result_loc, config.adaptive_min_runs, lines_needed, config.adaptive_rel_error, config.adaptive_confidence, config.adaptive_skip_leading, config.spark_silent or config.silent)
+        else:
+            check, check_args = func_util.remote_count_lines, (connection, remote_result_loc, lines_needed, config.spark_silent or config.silent)
+        if config.driver_watch:
+            check, check_args = func_util.remote_watch_driver, (check, check_args, connection, marker, _process_pattern(remote_result_loc), config.driver_logs, config.driver_error_patterns, config.driver_watch_context, submitted+config.driver_watch_grace)
+        state, val = blocker.block_with_value(check, args=check_args, return_val=True, sleeptime=sleeptime, dead_after_tries=dead_after_tries)
+        if adaptive and state == blocker.BlockState.COMPLETE and val[0] < lines_needed:
+            print('Measurements converged after {}/{} runs (relative error {:.2%}). Stopping application.'.format(val[0], lines_needed, val[1]))
+            _stop_application(config, connection, remote_result_loc)
         if state == blocker.BlockState.COMPLETE:
             if local_connections:
                 close_wrappers(connectionwrappers)
-            return True
+            return True, driver_node_id
+        if state == blocker.BlockState.FAILED:
+            printe('Driver crashed after {}/{} runs (attempt {}/{}, {:.0f} seconds after submission).'.format(val[0], lines_needed, _try+1, config.tries, time.time()-submitted))
+            for line in val[-1]:
+                print('    {}'.format(line))
+            remoto.process.check(connection, 'pkill -f \'{}\''.format(_process_pattern(remote_result_loc)), shell=True) # Kills a driver that logged an error, but did not exit.
         if state == blocker.BlockState.TIMEOUT:
-            printw('System timeout detected. Current status: {}/{}'.format(val[0], config.runs))
+            printw('System timeout detected. Current status: {}/{}'.format(val[0], lines_needed))
             if val[0] == 0:
                 printw('No runs have completed. Does the Spark code crash because of an error?')
-            lines_needed += 1 # +1 because we need a new line for warming caches.
     if local_connections:
             close_wrappers(connectionwrappers)
-    return False
+    return False, driver_node_id
 
 
 def experiment_deploy_default(interface, idx, num_experiments, connectionwrappers=None):
@@ -128,6 +251,12 @@ def experiment_deploy_default(interface, idx, num_experiments, connectionwrapper
 
     make_remote_abspath = lambda string: string.replace('~', homedir) 
 
+    if config.eventlog_path: # Spark refuses to start when the eventlog directory does not exist.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(connectionwrappers)) as executor:
+            futures_mkdir = [executor.submit(remoto.process.check, x.connection, 'mkdir -p {}'.format(config.eventlog_path), shell=True) for x in connectionwrappers.values()]
+            if not all(x.result()[2] == 0 for x in futures_mkdir):
+                printw('Could not create eventlog directory "{}" on all Spark nodes.'.format(config.eventlog_path))
+
     cmd_builder = spark_deploy.SubmitCommandBuilder(cmd_type=config.spark_application_type)
     cmd_builder.set_master(spark_master_url)
     cmd_builder.set_deploymode(config.spark_deploymode)
@@ -136,12 +265,16 @@ def experiment_deploy_default(interface, idx, num_experiments, connectionwrapper
     cmd_builder.add_java_options(*[make_remote_abspath(x) for x in config.spark_java_options])
     cmd_builder.set_application(config.spark_application_path)
     cmd_builder.add_conf_options(*[make_remote_abspath(x) for x in config.spark_conf_options])
-    cmd_builder.set_args(make_remote_abspath(config.spark_application_args))
     if config.spark_application_type == 'java':
         cmd_builder.set_class(config.spark_application_mainclass)
         cmd_builder.add_jars(*config.spark_extra_jars)
-    command = cmd_builder.build()
-    retval = _submit_blocking(config, command, interface.distribution['spark'], spark_master_id, connectionwrappers=connectionwrappers)
+    def command_func(runs):
+        args = _with_runs(config.spark_application_args, runs) if runs != None else config.spark_application_args
+        if args == None:
+            return None
+        cmd_builder.set_args(make_remote_abspath(args))
+        return cmd_builder.build()
+    retval, interface.driver_node_id = _submit_blocking(config, command_func, interface.distribution['spark'], spark_master_id, connectionwrappers=connectionwrappers)
 
     if local_connections:
         close_wrappers(connectionwrappers)
@@ -160,9 +293,11 @@ def experiment_fetch_results_default(interface, idx, num_experiments, driver_nod
         interface (ExperimentInterface): Experiment we are running right now.
         idx (int): Experiment index number. 0 for first experiment, 1 for seconds, etc.
         num_experiments (int): Amount of experiments we will run.
-        driver_node_id (optional int): If set, skips searching for the driver node. Assumes node with given id is the driver instead.
+        driver_node_id (optional int): If set, skips searching for the driver node. Assumes node with given id is the driver instead. Defaults to the driver node found by the experiment function, if any.
         connectionwrapper (optional RemotoSSHWrapper): If set, uses given connection, instead of building a new one.
 
+    Note: Also writes a configuration sidecar file (`<result_file>.config.json`) next to the result file, containing the configuration fingerprint.
+
     Required config args:
         remote_result_file (str): Remote result location for experiment files.
         result_dir (str): Result dir on the local machine.
@@ -178,6 +313,8 @@ def experiment_fetch_results_default(interface, idx, num_experiments, driver_nod
     remote_result_loc = fs.join(config.remote_result_dir, config.remote_result_file)
 
     local_connections = connectionwrapper == None
+    if driver_node_id == None:
+        driver_node_id = interface.driver_node_id
 
     if driver_node_id == None and not local_connections:
         raise ValueError('Caller provided an open connectionwrapper, without specifying the node id it connects to.')
@@ -188,12 +325,9 @@ def experiment_fetch_results_default(interface, idx, num_experiments, driver_nod
             driver_node_id = spark_master_id
         else: # We have to find the node that executes the driver in cluster mode.
             tmp_connectionwrappers = _get_connections(config, spark_nodes)
-            state, val = blocker.block_with_value(func_util.remote_file_find, args=(tmp_connectionwrappers, remote_result_loc), return_val=True, sleeptime=10, dead_after_tries=3) 
+            driver_node_id = _find_driver(config, tmp_connectionwrappers, spark_master_id, remote_result_loc, completed=True)
             close_wrappers(tmp_connectionwrappers)
-            if state == blocker.BlockState.COMPLETE:
-                driver_node_id = val[0]
-                print('Found driver running on node_id={}'.format(driver_node_id))
-            else:
+            if driver_node_id == None:
                 raise RuntimeError('Could not find results file on any node: {}'.format(remote_result_loc))
     driver_node = next(x for x in spark_nodes if x.node_id == driver_node_id)
 
@@ -207,6 +341,8 @@ def experiment_fetch_results_default(interface, idx, num_experiments, driver_nod
         printw('Resultfile "{}" already exists, overwriting...'.format(target_loc))
         fs.rm(target_loc)
     retval = subprocess.call('rsync -e "ssh -F {}" -q -aHAX --inplace {}:{} {}'.format(connectionwrapper.ssh_config.name, driver_node.ip_public, remote_result_loc, target_loc), shell=True) == 0
+    if retval:
+        fingerprint.write_sidecar(config, target_loc)
 
     if local_connections:
         close_wrappers([connectionwrapper])
@@ -0,0 +1,252 @@
+import getpass
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+
+import metareserve
+
+import experimenter.internal.experiment.fingerprint as fingerprint
+from experimenter.internal.experiment.execution.functionstore.data_general import _striped_tasks
+import experimenter.internal.experiment.execution.functionstore.mock_benchmark as mock_benchmark
+import experimenter.internal.result.stats as stats
+
+import utils.fs as fs
+from utils.printer import *
+
+'''Local single-machine backend. Replaces all stages requiring remote nodes (SSH, spark-deploy, rados-deploy) by local equivalents:
+    - Nodes are fake `metareserve.Node`s bound to localhost.
+    - Spark runs as a local standalone master and worker when `local_spark_home` is set. Otherwise, the mock benchmark (see `mock_benchmark.py`) runs instead of the Spark application.
+    - Data is deployed to a plain local directory instead of CephFS.
+Use `localize` to turn any execution into a local execution.'''
+
+
+def local_reservation(num_nodes=1):
+    '''Returns a `metareserve.Reservation` with `num_nodes` fake nodes, all bound to localhost.'''
+    return metareserve.Reservation([metareserve.Node(node_id=x, node_name='local{}'.format(x), ip_local='127.0.0.1', ip_public='127.0.0.1', extra_info={'user': getpass.getuser()}) for x in range(num_nodes)])
+
+
+def _localize_path(config, path):
+    '''Maps a remote path (e.g. '~/results/x' or '/mnt/cephfs') to a path inside `local_dir`.'''
+    return fs.join(config.local_dir, path.replace('~', '', 1).lstrip('/'))
+
+
+def _use_spark(config):
+    return config.local_spark_home and fs.isdir(config.local_spark_home)
+
+
+def distribute_local(interface):
+    '''Assigns all (local) nodes to Spark. There are no Ceph nodes.
+    Returns:
+        `True`, `dict(name, list(metareserve.Node))`.'''
+    return True, {'spark': list(interface.reservation.nodes), 'rados_ceph': []}
+
+
+def install_spark_local(interface, idx, num_experiments):
+    '''Checks the local Spark installation. Nothing is installed: Without a Spark installation, the mock benchmark is used.
+    Required config args:
+        local_spark_home (str or None): Path to a local Spark installation.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    if config.local_spark_home and not _use_spark(config):
+        printe('Local Spark installation not found at: {}'.format(config.local_spark_home))
+        return False
+    if not _use_spark(config):
+        print('No local Spark installation configured, using mock benchmark.')
+    return True
+
+
+def start_spark_local(interface, idx, num_experiments):
+    '''Starts a local Spark standalone master and worker, if `local_spark_home` is set.
+    Required config args:
+        local_spark_home (str or None): Path to a local Spark installation.
+        local_dir (str): Local directory to use as Spark worker workdir (in subdirectory 'spark_workdir').
+        spark_silent (bool): Indication whether Spark output must be suppressed.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    master_id = interface.distribution['spark'][0].node_id
+    setattr(interface, 'spark_master_id', master_id)
+    if not _use_spark(config):
+        setattr(interface, 'spark_master_url', None)
+        return True
+    master_url = 'spark://127.0.0.1:7077'
+    workdir = fs.join(config.local_dir, 'spark_workdir')
+    fs.mkdir(workdir, exist_ok=True)
+    output = subprocess.DEVNULL if config.spark_silent or config.silent else None
+    env = dict(os.environ, SPARK_MASTER_HOST='127.0.0.1', SPARK_WORKER_DIR=workdir)
+    if subprocess.call([fs.join(config.local_spark_home, 'sbin', 'start-master.sh')], env=env, stdout=output, stderr=output) != 0:
+        printe('Could not start local Spark master (iteration {}/{})'.format(idx+1, num_experiments))
+        return False
+    if subprocess.call([fs.join(config.local_spark_home, 'sbin', 'start-worker.sh'), master_url], env=env, stdout=output, stderr=output) != 0:
+        printe('Could not start local Spark worker (iteration {}/{})'.format(idx+1, num_experiments))
+        return False
+    setattr(interface, 'spark_master_url', master_url)
+    return True
+
+
+def stop_spark_local(interface, idx, num_experiments):
+    '''Stops the local Spark standalone master and worker, if they were started.
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    if not _use_spark(config):
+        return True
+    output = subprocess.DEVNULL if config.spark_silent or config.silent else None
+    retval = subprocess.call([fs.join(config.local_spark_home, 'sbin', 'stop-worker.sh')], stdout=output, stderr=output) == 0
+    retval &= subprocess.call([fs.join(config.local_spark_home, 'sbin', 'stop-master.sh')], stdout=output, stderr=output) == 0
+    if not retval:
+        printe('Could not stop local Spark (iteration {}/{})'.format(idx+1, num_experiments))
+    return retval
+
+
+def deploy_data_local(interface, idx, num_experiments):
+    '''Deploys data to the local data directory (`remote_data_dir`, rewritten by `localize`), applying copy and link multipliers like remote deployment.
+    If `data_path` does not exist, a file of `local_mock_data_size` random bytes is generated in its place.
+    Required config args:
+        data_path (str): Local path to data to deploy.
+        remote_data_dir (str): Local directory to deploy data to.
+        copy_multiplier (int): Amount of copies of each file to make.
+        link_multiplier (int): Amount of hardlinks of each file to make.
+        local_mock_data_size (int): Size in bytes of generated data, when `data_path` does not exist.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    data_path = config.data_path
+    if not fs.exists(data_path):
+        data_path = fs.join(config.local_dir, 'generated', fs.basename(config.data_path))
+        if not fs.isfile(data_path) or fs.sizeof(data_path) != config.local_mock_data_size:
+            printw('Data not found at "{}", generating {} random bytes instead.'.format(config.data_path, config.local_mock_data_size))
+            fs.mkdir(fs.dirname(data_path), exist_ok=True)
+            with open(data_path, 'wb') as f:
+                f.write(os.urandom(config.local_mock_data_size))
+    fs.rm(config.remote_data_dir, ignore_errors=True)
+    fs.mkdir(config.remote_data_dir, exist_ok=True)
+    tasks, links = _striped_tasks(data_path, config.copy_multiplier, config.link_multiplier)
+    for source, name, _ in tasks:
+        shutil.copyfile(source, fs.join(config.remote_data_dir, name))
+    for target, name in links:
+        os.link(fs.join(config.remote_data_dir, target), fs.join(config.remote_data_dir, name))
+    print('Deployed {} files and {} links to "{}" (iteration {}/{})'.format(len(tasks), len(links), config.remote_data_dir, idx+1, num_experiments))
+    return True
+
+
+def _application_command(interface):
+    '''Returns the command to execute the application locally: Using spark-submit when a local Spark installation is used, otherwise using the mock benchmark.'''
+    config = interface.config
+    args = shlex.split(config.spark_application_args)
+    if not _use_spark(config):
+        return [sys.executable, mock_benchmark.__file__]+args
+    cmd = [fs.join(config.local_spark_home, 'bin', 'spark-submit'), '--master', interface.spark_master_url, '--deploy-mode', 'client', '--driver-memory', config.spark_driver_memory, '--executor-memory', config.spark_executor_memory]
+    if config.spark_application_type == 'java':
+        cmd += ['--class', config.spark_application_mainclass]
+        if any(config.spark_extra_jars):
+            cmd += ['--jars', ','.join(config.spark_extra_jars)]
+    for option in config.spark_conf_options:
+        cmd += ['--conf', option]
+    return cmd+[config.local_application_paths[0]]+args
+
+
+def experiment_local(interface, idx, num_experiments):
+    '''Executes the application locally, and waits for it to finish. With adaptive run-count (`adaptive_rel_error`), signals the application to stop once measurements converge.
+    Required config args:
+        spark_application_args (str): Application arguments, with paths rewritten by `localize`.
+        remote_result_dir (str): Local directory the application writes results to.
+        remote_result_file (str): Result file the application writes to.
+        runs (int): Amount of runs to expect.
+        sleeptime (int): Only used as upper bound for the polling interval, in seconds.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    result_loc = fs.join(config.remote_result_dir, config.remote_result_file)
+    fs.mkdir(config.remote_result_dir, exist_ok=True)
+    for path in (result_loc, result_loc+'.stop'):
+        if fs.exists(path):
+            fs.rm(path)
+    output = subprocess.DEVNULL if config.spark_silent or config.silent else None
+    process = subprocess.Popen(_application_command(interface), stdout=output, stderr=output)
+    while process.poll() == None:
+        time.sleep(min(0.1, config.sleeptime))
+        if config.adaptive_rel_error and fs.isfile(result_loc) and not fs.exists(result_loc+'.stop'):
+            with open(result_loc, 'r') as f:
+                state, num_lines, current = _local_convergence(f.readlines(), config)
+            if state:
+                print('Measurements converged after {} runs (relative error {:.2%}). Stopping application.'.format(num_lines, current))
+                fs.touch(result_loc+'.stop')
+    if fs.exists(result_loc+'.stop'):
+        fs.rm(result_loc+'.stop')
+    if process.returncode != 0 or not fs.isfile(result_loc):
+        printe('Local application failed with exitcode {} (iteration {}/{})'.format(process.returncode, idx+1, num_experiments))
+        return False
+    prints('Experiment completed! (iteration {}/{})'.format(idx+1, num_experiments))
+    return True
+
+
+def _local_convergence(lines, config):
+    '''Checks local result lines for convergence, like `remote_check_convergence` does for remote files.
+    Returns:
+        `(bool, int, float or None)`: Whether measurements converged, the amount of result lines (excluding comment lines), and the current relative error.'''
+    values = stats.parse_result_lines(lines, skip_leading=config.adaptive_skip_leading)
+    current = stats.median_rel_error(values, confidence=config.adaptive_confidence)
+    num_lines = sum(1 for x in lines if x.strip() and not x.startswith('#'))
+    return len(values) >= config.adaptive_min_runs and current != None and current <= config.adaptive_rel_error, num_lines, current
+
+
+def fetch_results_local(interface, idx, num_experiments):
+    '''Copies the result file to the result directory, and writes a configuration sidecar (see `fingerprint.py`).
+    Required config args:
+        remote_result_dir (str): Local directory the application wrote results to.
+        remote_result_file (str): Result file the application wrote to.
+        result_dir (str): Result dir on the local machine.
+        result_file (str): Result file on the local machine.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    fs.mkdir(config.result_dir, exist_ok=True)
+    target_loc = fs.join(config.result_dir, config.result_file)
+    if fs.isfile(target_loc):
+        printw('Resultfile "{}" already exists, overwriting...'.format(target_loc))
+    shutil.copyfile(fs.join(config.remote_result_dir, config.remote_result_file), target_loc)
+    fingerprint.write_sidecar(config, target_loc)
+    return True
+
+
+def localize(interface, idx, num_experiments):
+    '''Turns an execution into a local execution: Rewrites remote paths in its (built) configuration to paths inside `local_dir`, and replaces all registered stage functions by local ones.
+    Data generation functions are kept, as they run locally already. Monitoring functions are removed, as they require remote nodes.
+    Args:
+        interface (ExecutionInterface): Execution to localize.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+
+    Required config args:
+        local_dir (str): Local directory replacing remote directories.'''
+    config = interface.config
+    remote_data_dir, remote_result_dir = config.remote_data_dir, config.remote_result_dir
+    config.rados_used = False
+    config.remote_data_dir = _localize_path(config, remote_data_dir)
+    config.remote_result_dir = _localize_path(config, remote_result_dir)
+    config.spark_application_args = config.spark_application_args.replace(remote_result_dir, config.remote_result_dir).replace(remote_data_dir, config.remote_data_dir)
+    config.stage_history_path = fs.join(config.local_dir, 'stage_timings.jsonl') # Local timings must not calibrate estimates for remote executions.
+
+    interface.register('distribute_func', distribute_local)
+    interface.register('install_spark_func', lambda iface: install_spark_local(iface, idx, num_experiments))
+    interface.register('start_spark_func', lambda iface: start_spark_local(iface, idx, num_experiments))
+    interface.register('deploy_data_func', lambda iface: deploy_data_local(iface, idx, num_experiments))
+    interface.register('stop_spark_func', lambda iface: stop_spark_local(iface, idx, num_experiments))
+    interface.uninstall_spark_func = None
+    for functype in ('install_others_funcs', 'start_others_funcs', 'monitor_start_funcs', 'monitor_stop_funcs', 'stop_others_funcs', 'uninstall_others_funcs'):
+        setattr(interface, functype, [])
+    interface.experiment_funcs = []
+    interface.register('experiment_funcs', lambda iface: experiment_local(iface, idx, num_experiments))
+    interface.result_fetch_funcs = []
+    interface.register('result_fetch_funcs', lambda iface: fetch_results_local(iface, idx, num_experiments))
@@ -0,0 +1,52 @@
+'''Stand-in for the Spark benchmark application, used by the local backend (see `local_general.py`).
+This file is executed as a standalone program, and only uses the Python standard library.
+It accepts the benchmark application arguments, and writes one `init_ns,comp_ns` line per run to the result path:
+    init_ns: Time to list the data files.
+    comp_ns: Time to read all data files.
+Like the real benchmark, it stops early when `<result path>.stop` exists.'''
+
+import argparse
+import os
+import time
+
+
+def _list_files(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(os.path.join(path, x) for x in os.listdir(path) if os.path.isfile(os.path.join(path, x)))
+
+
+def _read_all(paths, chunk_size=1024*1024):
+    total = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                total += len(chunk)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='mock_benchmark', description='Benchmark application stand-in.')
+    parser.add_argument('kind', nargs='?', default='df')
+    parser.add_argument('--path', required=True)
+    parser.add_argument('--result-path', dest='result_path', required=True)
+    parser.add_argument('-r', dest='runs', type=int, default=1)
+    args, _ = parser.parse_known_args() # Ignores arguments we do not need, e.g. '--format', '--arrow-only'.
+
+    stop_path = args.result_path+'.stop'
+    os.makedirs(os.path.dirname(os.path.abspath(args.result_path)), exist_ok=True)
+    with open(args.result_path, 'w') as f:
+        for _ in range(args.runs):
+            if os.path.exists(stop_path):
+                break
+            start = time.perf_counter_ns()
+            files = _list_files(args.path)
+            listed = time.perf_counter_ns()
+            _read_all(files)
+            done = time.perf_counter_ns()
+            f.write('{},{}\n'.format(listed-start, done-listed))
+            f.flush()
+
+
+if __name__ == '__main__':
+    main()
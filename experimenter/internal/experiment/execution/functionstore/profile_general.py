@@ -0,0 +1,190 @@
+import concurrent.futures
+import gzip
+import subprocess
+
+import remoto
+
+from experimenter.internal.remoto.ssh_wrapper import close_wrappers
+from experimenter.internal.experiment.execution.functionstore.util import get_connections, all_open
+import experimenter.internal.result.flamegraph as flamegraph
+
+import utils.fs as fs
+from utils.printer import *
+
+
+_remote_profile_dir = '~/.spark_arrow_experiments/profile'
+
+# `pgrep -f` patterns per role. The brackets prevent matching the shell executing the pattern, which has the pattern in its own command line.
+_role_patterns = {
+    'driver': '[o]rg.apache.spark.deploy.SparkSubmit',
+    'executor': '[C]oarseGrainedExecutorBackend',
+    'osd': '[c]eph-osd',
+}
+
+
+def _profile_targets(interface):
+    '''Determines which nodes to profile, and which processes to profile on them.
+    Returns:
+        `dict(metareserve.Node, list(str))`, mapping nodes to the roles to profile on them.'''
+    config = interface.config
+    targets = dict()
+    if 'spark' in config.flamegraph_groups:
+        master_id = getattr(interface, 'spark_master_id', None)
+        for node in interface.distribution['spark']:
+            is_master = node.node_id == master_id
+            if config.flamegraph_only_master and not is_master:
+                continue
+            if config.flamegraph_only_worker and is_master:
+                continue
+            roles = ['executor']
+            if is_master or config.spark_deploymode != 'client': # In cluster mode, the driver may run on any node.
+                roles.insert(0, 'driver')
+            targets.setdefault(node, []).extend(roles)
+    if 'rados_ceph' in config.flamegraph_groups and not (config.flamegraph_only_master or config.flamegraph_only_worker):
+        for node in interface.distribution.get('rados_ceph', []):
+            targets.setdefault(node, []).append('osd')
+    return targets
+
+
+def _remote_paths(config, node, role):
+    base = fs.join(_remote_profile_dir, '{}.{}_{}'.format(config.result_file, node.node_id, role))
+    return base+'.perf.data', base+'.perf.txt.gz', base+'.pid'
+
+
+def profile_start(interface, idx, num_experiments):
+    '''Starts sampling profilers (Linux `perf`, with call graphs) on selected Spark and Ceph processes.
+    Every role (driver, executor, osd) is profiled by its own profiler, so samples are attributed to roles exactly.
+    Profiling waits for target processes to appear (e.g. executors start only after submission), then samples for `flamegraph_time` seconds.
+    Note: JVM frames are only symbolized when the JVM writes perf maps (e.g. using perf-map-agent). Native frames (Arrow, libc, Ceph) are always symbolized.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        flamegraph_time (int or None): Amount of seconds to profile. If `None`, profiling is disabled.
+        flamegraph_only_master (bool): If set, only profiles the Spark master node (which runs the driver in client mode).
+        flamegraph_only_worker (bool): If set, only profiles Spark worker nodes (executors).
+        flamegraph_groups (list(str)): Distribution keys to profile. Supports 'spark' and 'rados_ceph'.
+        flamegraph_delay (int): Amount of seconds to wait after experiment start before profiling.
+        flamegraph_frequency (int): Sampling frequency in Hz.
+        flamegraph_sudo (bool): If set, runs perf using sudo.
+        spark_deploymode (str): Denotes the Spark deploy mode.
+        result_file (str): Result file on the local machine. Used to name remote profile files.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    if config.flamegraph_time == None:
+        return True
+    targets = _profile_targets(interface)
+    if not any(targets):
+        printw('No nodes selected for profiling.')
+        return True
+    sudo = 'sudo -n ' if config.flamegraph_sudo else ''
+
+    connectionwrappers = get_connections(config, list(targets), silent=config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all nodes to profile (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        def _start(node, wrapper, role):
+            data_path, _, pid_path = _remote_paths(config, node, role)
+            pattern = _role_patterns[role]
+            script = 'sleep {delay}; for i in $(seq 300); do pids=$(pgrep -d, -f "{pattern}"); [ -n "$pids" ] && break; sleep 1; done; [ -n "$pids" ] && exec {sudo}perf record -q -F {freq} -g -p $pids -o {data} -- sleep {time}'.format(
+                delay=config.flamegraph_delay, pattern=pattern, sudo=sudo, freq=config.flamegraph_frequency, data=data_path, time=config.flamegraph_time)
+            cmd = 'mkdir -p {} && nohup sh -c \'{}\' > /dev/null 2>&1 < /dev/null & echo $! > {}'.format(_remote_profile_dir, script, pid_path)
+            return remoto.process.check(wrapper.connection, cmd, shell=True)[2] == 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            futures_start = [executor.submit(_start, node, connectionwrappers[node], role) for node, roles in targets.items() for role in roles]
+            if not all(x.result() for x in futures_start):
+                printe('Could not start profilers on all nodes (iteration {}/{})'.format(idx+1, num_experiments))
+                return False
+        print('Profiling {} nodes for {} seconds.'.format(len(targets), config.flamegraph_time))
+        return True
+    finally:
+        close_wrappers(connectionwrappers)
+
+
+def profile_stop(interface, idx, num_experiments):
+    '''Stops profilers started by `profile_start` (if still running), symbolizes samples remotely, and fetches them.
+    Produces in `<result_dir>/<result_file>.profile/`:
+        `<node_id>_<role>.folded` and `<node_id>_<role>.svg`: Folded stacks and flamegraph per profiled process role on a node.
+        `<role>.folded` and `<role>.svg`: Folded stacks and flamegraph per role ('driver', 'executor', 'osd'), aggregated over nodes.
+        `top_symbols.csv`: Symbols with most self samples, per node and per role.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+
+    Required config args:
+        See `profile_start`.
+        result_dir (str): Result dir on the local machine.
+        flamegraph_top (int): Amount of symbols to store in the top-symbol table, per node and per role.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    if config.flamegraph_time == None:
+        return True
+    targets = _profile_targets(interface)
+    if not any(targets):
+        return True
+    sudo = 'sudo -n ' if config.flamegraph_sudo else ''
+    local_dir = fs.join(config.result_dir, '{}.profile'.format(config.result_file))
+    fs.mkdir(local_dir, exist_ok=True)
+
+    connectionwrappers = get_connections(config, list(targets), silent=config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all profiled nodes (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        def _stop(node, wrapper, role):
+            data_path, script_path, pid_path = _remote_paths(config, node, role)
+            # SIGINT makes perf write out its data. We wait for it to exit before symbolizing.
+            cmd = 'pid=$(cat {pid}) && {sudo}kill -INT $pid 2>/dev/null; for i in $(seq 100); do kill -0 $pid 2>/dev/null || break; sleep 0.1; done; rm -f {pid}; [ -f {data} ] && {sudo}perf script -i {data} 2>/dev/null | gzip > {script}; {sudo}rm -f {data}'.format(
+                pid=pid_path, sudo=sudo, data=data_path, script=script_path)
+            remoto.process.check(wrapper.connection, cmd, shell=True)
+            local_path = fs.join(local_dir, '{}_{}.perf.txt.gz'.format(node.node_id, role))
+            if subprocess.call('rsync -e "ssh -F {}" -q -aHAX --remove-source-files {}:{} {}'.format(wrapper.ssh_config_path, node.ip_public, script_path, local_path), shell=True) != 0:
+                return None
+            with gzip.open(local_path, 'rt', errors='replace') as f:
+                folded = flamegraph.fold_perf_script(f)
+            fs.rm(local_path)
+            return folded
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            futures_stop = {(node, role): executor.submit(_stop, node, connectionwrappers[node], role) for node, roles in targets.items() for role in roles}
+            results = {key: x.result() for key, x in futures_stop.items()}
+    finally:
+        close_wrappers(connectionwrappers)
+
+    top_rows = []
+    role_folded = dict()
+    for (node, role), folded in results.items():
+        if not folded: # E.g. the driver is not found on most nodes in cluster mode.
+            continue
+        name = '{}_{}'.format(node.node_id, role)
+        flamegraph.write_folded(fs.join(local_dir, '{}.folded'.format(name)), folded)
+        with open(fs.join(local_dir, '{}.svg'.format(name)), 'w') as f:
+            f.write(flamegraph.flamegraph_svg(folded, title='Node {}: {} ({})'.format(node.node_id, role, config.result_file)))
+        top_rows += [('node', name)+x for x in flamegraph.top_symbols(folded, limit=config.flamegraph_top)]
+        aggregate = role_folded.setdefault(role, dict())
+        for stack, count in folded.items():
+            aggregate[stack] = aggregate.get(stack, 0) + count
+    for role, folded in role_folded.items():
+        flamegraph.write_folded(fs.join(local_dir, '{}.folded'.format(role)), folded)
+        with open(fs.join(local_dir, '{}.svg'.format(role)), 'w') as f:
+            f.write(flamegraph.flamegraph_svg(folded, title='{} ({})'.format(role, config.result_file)))
+        top_rows += [('role', role)+x for x in flamegraph.top_symbols(folded, limit=config.flamegraph_top)]
+
+    flamegraph.write_top_symbols(fs.join(local_dir, 'top_symbols.csv'), top_rows, key_columns=('scope', 'name'))
+    print('Collected {} profiles from {} nodes (iteration {}/{}).'.format(sum(1 for x in results.values() if x), len(targets), idx+1, num_experiments))
+    return True # Profiling is best-effort: Missing profiles do not invalidate the experiment.
+
+
+def register_profile_functions(interface, idx, num_experiments):
+    '''Registers profiling around the experiment stage. Profiling is only performed when config option `flamegraph_time` is set.'''
+    interface.register('monitor_start_funcs', lambda iface: profile_start(iface, idx, num_experiments))
+    interface.register('monitor_stop_funcs', lambda iface: profile_stop(iface, idx, num_experiments))
@@ -1,11 +1,171 @@
+import concurrent.futures
+import re
+import subprocess
+import urllib.request
+
 import data_deploy
 import metareserve
 import rados_deploy
+import remoto
+
+from experimenter.internal.remoto.ssh_wrapper import close_wrappers
+from experimenter.internal.experiment.execution.functionstore.data_general import deploy_data_incremental, deploy_data_striped
+from experimenter.internal.experiment.execution.functionstore.util import get_connections, all_open, package_version, compute_fingerprint, remote_fingerprints, remote_fingerprint_store
 
+import utils.fs as fs
+import utils.location as loc
 from utils.printer import *
 
+
+def rados_ceph_install_fingerprint(config):
+    '''Returns fingerprint of all parameters determining a RADOS-Ceph installation.'''
+    return compute_fingerprint({'ceph_arrow_url': config.ceph_arrow_url, 'ceph_debug': config.ceph_debug, 'rados_deploy': package_version('rados-deploy')})
+
+
+def _run_parallel(connectionwrappers, commands):
+    '''Executes a command on every given node in parallel.
+    Args:
+        connectionwrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to nodes.
+        commands (dict(metareserve.Node, str)): Command to execute per node.
+
+    Returns:
+        `True` if all commands succeeded, `False` otherwise.'''
+    if not any(commands):
+        return True
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(commands)) as executor:
+        futures_run = [executor.submit(remoto.process.check, connectionwrappers[node].connection, cmd, shell=True) for node, cmd in commands.items()]
+        return all(x.result()[2] == 0 for x in futures_run)
+
+
+def _distribute_artifact(connectionwrappers, artifact_path, holders, targets, remote_path):
+    '''Distributes a local file to many nodes using peer-to-peer tree distribution.
+    The first target receives the file from our machine, unless any holder exists. After that, every node holding the file sends it to one node without it, in parallel.
+    This way, the amount of nodes holding the file doubles every round, and distribution takes a logarithmic amount of rounds.
+    Node-to-node transfers use the internal network and cluster keys, installed with `rados_deploy.install_ssh`.
+    Args:
+        connectionwrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to all holders and targets.
+        artifact_path (str): Local path to file to distribute.
+        holders (list(metareserve.Node)): Nodes already holding the file at `remote_path`.
+        targets (list(metareserve.Node)): Nodes to distribute the file to.
+        remote_path (str): Absolute path to place the file on nodes.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    holders = list(holders)
+    targets = list(targets)
+    if not any(targets):
+        return True
+    if not any(holders):
+        seed = targets.pop(0)
+        if subprocess.call('rsync -e "ssh -F {}" -q -aHAX {} {}:{}'.format(connectionwrappers[seed].ssh_config_path, artifact_path, seed.ip_public, remote_path), shell=True) != 0:
+            printe('Could not send artifact to node {}'.format(seed.node_id))
+            return False
+        holders.append(seed)
+    rounds = 0
+    while any(targets):
+        pairs = list(zip(holders, targets))
+        cmds = {src: 'rsync -e "ssh -o StrictHostKeyChecking=no" -q -aHAX {0} {1}:{0}'.format(remote_path, dst.ip_local) for src, dst in pairs}
+        if not _run_parallel(connectionwrappers, cmds):
+            printe('Could not distribute artifact in round {}'.format(rounds+1))
+            return False
+        holders += [dst for _, dst in pairs]
+        targets = targets[len(pairs):]
+        rounds += 1
+    print('Distributed artifact to {} nodes in {} rounds.'.format(len(holders), rounds))
+    return True
+
+
+_github_archive = re.compile(r'^https?://github\.com/([^/]+)/([^/]+)/archive/(.+?)\.(?:zip|tar\.gz)$')
+
+
+def resolve_revision(url):
+    '''Resolves a download URL to the revision it currently points to. URLs like the default `ceph_arrow_url` point to a branch, which moves when upstream changes.
+    For GitHub archive URLs, resolves the branch or tag to a commit hash (using `git ls-remote`). For other URLs, uses the HTTP validator (ETag or Last-Modified) of the download.
+    Returns:
+        `str` identifying the revision, or `None` if the URL could not be resolved.'''
+    found = _github_archive.match(url)
+    if found:
+        owner, repo, ref = found.groups()
+        if re.fullmatch('[0-9a-f]{40}', ref):
+            return ref
+        try:
+            out = subprocess.check_output(['git', 'ls-remote', 'https://github.com/{}/{}'.format(owner, repo), ref], stderr=subprocess.DEVNULL, timeout=60, universal_newlines=True)
+        except (OSError, subprocess.SubprocessError) as e:
+            return None
+        return out.split()[0] if any(out.split()) else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method='HEAD'), timeout=60) as response:
+            return response.headers.get('ETag') or response.headers.get('Last-Modified')
+    except (OSError, ValueError) as e:
+        return None
+
+
+def install_arrow_artifact(interface, idx, num_experiments, nodes, connectionwrappers, revision):
+    '''Installs a prebuilt Arrow artifact on given nodes. Builds the artifact on one node first when no cached artifact exists.
+    After this function, rados-deploy finds Arrow already installed on all nodes, and skips compiling it.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+        nodes (list(metareserve.Nodes)): Nodes to install Arrow on.
+        connectionwrappers (dict(metareserve.Node, RemotoSSHWrapper)): Open connections to `nodes`.
+        revision (str): Revision `ceph_arrow_url` points to (see `resolve_revision`). Part of the cache key, so cached builds are not reused after upstream changes.
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        ceph_arrow_url (str): Arrow URL to download and install for Rados-Ceph.
+        ceph_force_reinstall (bool): If set, rebuilds the artifact, even when a cached artifact exists.
+        ceph_debug (bool): If set, builds with debug flags.
+        ceph_compile_threads (int): Number of cores to use for compiling Arrow.
+        ceph_artifact_paths (list(str)): Remote paths (starting with '~/') containing the Arrow build.
+        ceph_silent (bool): Indication whether Ceph output must be suppressed.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    if any(x for x in config.ceph_artifact_paths if not x.startswith('~/')):
+        printe('All paths in "ceph_artifact_paths" must start with "~/". Found: {}'.format(config.ceph_artifact_paths))
+        return False
+    relative_paths = ' '.join(x[2:] for x in config.ceph_artifact_paths)
+    key = compute_fingerprint({'ceph_arrow_url': config.ceph_arrow_url, 'revision': revision, 'ceph_debug': config.ceph_debug, 'rados_deploy': package_version('rados-deploy'), 'paths': config.ceph_artifact_paths})
+    artifact_name = 'arrow_{}.tar.gz'.format(key[:32])
+    artifact_path = fs.join(loc.cache_dir(), 'artifacts', artifact_name)
+    remote_path = fs.join('/tmp', artifact_name)
+
+    holders = []
+    if config.ceph_force_reinstall or not fs.isfile(artifact_path):
+        builder = nodes[0]
+        print('Building Arrow artifact on node {} (iteration {}/{})...'.format(builder.node_id, idx+1, num_experiments))
+        retval, _ = rados_deploy.install(metareserve.Reservation([builder]), key_path=config.key_path, arrow_url=config.ceph_arrow_url, force_reinstall=True, debug=config.ceph_debug, silent=config.ceph_silent or config.silent, cores=config.ceph_compile_threads) # The builder may hold an older build, which must not end up in the cache.
+        if not retval:
+            printe('Could not build Arrow on node {}'.format(builder.node_id))
+            return False
+        if not _run_parallel(connectionwrappers, {builder: 'tar czf {} -C ~ {}'.format(remote_path, relative_paths)}):
+            printe('Could not pack Arrow artifact on node {}. Do "ceph_artifact_paths" exist?'.format(builder.node_id))
+            return False
+        fs.mkdir(fs.dirname(artifact_path), exist_ok=True)
+        tmp_path = artifact_path+'.part'
+        if subprocess.call('rsync -e "ssh -F {}" -q -aHAX {}:{} {}'.format(connectionwrappers[builder].ssh_config_path, builder.ip_public, remote_path, tmp_path), shell=True) != 0:
+            printe('Could not fetch Arrow artifact from node {}'.format(builder.node_id))
+            return False
+        fs.mv(tmp_path, artifact_path)
+        holders.append(builder)
+    else:
+        print('Using cached Arrow artifact: {}'.format(artifact_path))
+
+    targets = [x for x in nodes if not x in holders]
+    if not _distribute_artifact(connectionwrappers, artifact_path, holders, targets, remote_path):
+        return False
+    if not _run_parallel(connectionwrappers, {x: 'tar xzf {} -C ~'.format(remote_path) for x in targets}):
+        printe('Could not unpack Arrow artifact on all nodes.')
+        return False
+    return True
+
+
 def install_rados_ceph(interface, idx, num_experiments, ceph_nodes, spark_nodes):
     '''Instals Rados-Ceph on a series of nodes in parallel.
+    Nodes with a matching install fingerprint (see `rados_ceph_install_fingerprint`) are skipped. Other nodes are (re)installed. When any node has a stale fingerprint, the installation is forced, as rados-deploy installs all nodes in one go.
     Args:
         interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
         idx (int): Experiment index.
@@ -16,9 +176,10 @@ def install_rados_ceph(interface, idx, num_experiments, ceph_nodes, spark_nodes)
     Required config args:
         key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
         ceph_arrow_url (str): Arrow URL to download and install for Rados-Ceph.
-        ceph_force_reinstall (bool): If set, reinstalls Arrow from scratch, even when already present.
+        ceph_force_reinstall (bool): If set, reinstalls Arrow from scratch on all nodes, even when already present.
         ceph_debug (bool): If set, builds with debug flags.
         ceph_compile_threads (int): Number of cores to use for compiling Arrow.
+        ceph_artifact_cache (bool): If set, compiles Arrow once and distributes the build. See `install_arrow_artifact`.
         ceph_silent (bool): Indication whether Ceph output must be suppressed.
         silent (bool): Indication whether general output must be suppressed.
 
@@ -32,12 +193,47 @@ def install_rados_ceph(interface, idx, num_experiments, ceph_nodes, spark_nodes)
     if not rados_deploy.install_ssh(metareserve.Reservation(ceph_nodes+spark_nodes), key_path=config.key_path, cluster_keypair=None, silent=config.ceph_silent or config.silent):
         printe('Could not install SSH keys for internal cluster communication (iteration {}/{})'.format(idx+1, num_experiments))
         return False
-    retval, rados_ceph_admin_id = rados_deploy.install(metareserve.Reservation(ceph_nodes), key_path=config.key_path, arrow_url=config.ceph_arrow_url, force_reinstall=config.ceph_force_reinstall, debug=config.ceph_debug, silent=config.ceph_silent or config.silent, cores=config.ceph_compile_threads)
-    if not retval:
-        printe('Could not install RADOS-Ceph (iteration {}/{})'.format(idx+1, num_experiments))
-        return False
-    setattr(interface, 'rados_ceph_admin_id', rados_ceph_admin_id)
-    return True
+
+    fingerprint = rados_ceph_install_fingerprint(config)
+    connectionwrappers = get_connections(config, ceph_nodes, silent=config.ceph_silent or config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all Ceph nodes (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        stored = remote_fingerprints(connectionwrappers, 'rados_ceph') # Line 1: fingerprint, line 2: admin id used when installing.
+        install_nodes = ceph_nodes if config.ceph_force_reinstall else [x for x in ceph_nodes if not (any(stored[x]) and stored[x][0] == fingerprint)]
+        ceph_node_ids = set(x.node_id for x in ceph_nodes)
+        stale = any(any(stored[x]) for x in install_nodes)
+        known_admin_ids = sorted(int(lines[1]) for x, lines in stored.items() if not x in install_nodes and len(lines) > 1 and lines[1].isdigit() and int(lines[1]) in ceph_node_ids)
+
+        if not any(install_nodes) and any(known_admin_ids):
+            print('RADOS-Ceph installation is up-to-date on all {} nodes, skipping installation.'.format(len(ceph_nodes)))
+            setattr(interface, 'rados_ceph_admin_id', known_admin_ids[0])
+            return True
+        if not any(install_nodes): # Fingerprints match, but no admin is known: Let rados-deploy pick one (it skips existing installations).
+            install_nodes = ceph_nodes
+        elif len(install_nodes) < len(ceph_nodes):
+            print('RADOS-Ceph installation is up-to-date on {}/{} nodes. Installing on the remaining {} nodes.'.format(len(ceph_nodes)-len(install_nodes), len(ceph_nodes), len(install_nodes)))
+
+        force_reinstall = config.ceph_force_reinstall or stale # rados-deploy skips nodes having any installation, so stale installations must be replaced forcibly.
+        if config.ceph_artifact_cache:
+            revision = resolve_revision(config.ceph_arrow_url)
+            if revision == None:
+                printw('Could not resolve "{}" to a fixed revision. Not using the Arrow artifact cache, as a cached build could be stale.'.format(config.ceph_arrow_url))
+            else:
+                if not install_arrow_artifact(interface, idx, num_experiments, install_nodes, connectionwrappers, revision):
+                    return False
+                force_reinstall = False # Arrow is in place now: rados-deploy must not rebuild it.
+        retval, rados_ceph_admin_id = rados_deploy.install(metareserve.Reservation(install_nodes), key_path=config.key_path, arrow_url=config.ceph_arrow_url, force_reinstall=force_reinstall, debug=config.ceph_debug, silent=config.ceph_silent or config.silent, cores=config.ceph_compile_threads)
+        if not retval:
+            printe('Could not install RADOS-Ceph (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        if not remote_fingerprint_store({x: connectionwrappers[x] for x in install_nodes}, 'rados_ceph', fingerprint, extra_lines=[str(rados_ceph_admin_id)]):
+            printw('Could not store RADOS-Ceph install fingerprint on all nodes. Next execution will reinstall these.')
+        setattr(interface, 'rados_ceph_admin_id', rados_ceph_admin_id)
+        return True
+    finally:
+        close_wrappers(connectionwrappers)
 
 
 def start_rados_ceph(interface, idx, num_experiments, ceph_nodes, rados_ceph_admin_id, spark_nodes):
@@ -134,12 +330,26 @@ def deploy_data_rados_ceph(interface, idx, num_experiments, ceph_nodes, rados_ce
         copy_multiplier (int): Amount of copies of each file to make on the remote.
         link_multiplier (int): Amount of hardlinks of each file to make on the remote.
         stripe (int): Object size to use.
+        data_deploy_incremental (bool): If set, only deploys missing or changed files, using `data_general.deploy_data_incremental` on one Spark node (CephFS is shared).
+        data_deploy_striped (bool): If set (and `data_deploy_incremental` is not), uploads in parallel through all Spark nodes using `data_general.deploy_data_striped`.
+                                    Objects are written directly with object size `min(stripe, ceph_osd_max_obj_size)`.
         ceph_silent (bool): Indication whether Ceph output must be suppressed.
         silent (bool): Indication whether general output must be suppressed.
 
     Returns:
         `True` on success, `False` on failure.'''
     config = interface.config
+    if config.data_deploy_incremental:
+        if not deploy_data_incremental(interface, idx, num_experiments, spark_nodes[:1], object_size=config.stripe*1024*1024 if config.rados_used else None):
+            printe('Incremental data deployment on RADOS-Ceph failed (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        return True
+    if config.data_deploy_striped:
+        object_size = min(config.stripe*1024*1024, config.ceph_osd_max_obj_size) if config.rados_used else None
+        if not deploy_data_striped(interface, idx, num_experiments, spark_nodes, shared=True, object_size=object_size):
+            printe('Striped data deployment on RADOS-Ceph failed (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        return True
     kwargs = {'admin_id': rados_ceph_admin_id, 'stripe': config.stripe}
     if not data_deploy.deploy(metareserve.Reservation(ceph_nodes+spark_nodes), key_path=config.key_path, paths=[config.data_path], dest=config.remote_data_dir, copy_multiplier=config.copy_multiplier, link_multiplier=config.link_multiplier, silent=config.ceph_silent or config.silent, plugin='rados_deploy', **kwargs):
         printe('Data deployment on RADOS-Ceph failed (iteration {}/{})'.format(idx+1, num_experiments))
@@ -1,10 +1,19 @@
 import metareserve
 import spark_deploy
 
+from experimenter.internal.remoto.ssh_wrapper import close_wrappers
+from experimenter.internal.experiment.execution.functionstore.util import get_connections, all_open, package_version, compute_fingerprint, remote_fingerprint_mismatches, remote_fingerprint_store
+
 from utils.printer import *
 
+
+def spark_install_fingerprint(config):
+    '''Returns fingerprint of all parameters determining a Spark installation.'''
+    return compute_fingerprint({'spark_download_url': config.spark_download_url, 'spark_deploy': package_version('spark-deploy')})
+
+
 def install_spark(interface, idx, num_experiments):
-    '''Installs Spark.
+    '''Installs Spark. Nodes with a matching install fingerprint (see `spark_install_fingerprint`) are skipped. Nodes with a stale fingerprint are reinstalled.
     Args:
         interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
         idx (int): Experiment index.
@@ -16,17 +25,38 @@ def install_spark(interface, idx, num_experiments):
     Required config args:
         key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
         spark_download_url (str or None): URL to Spark distribution to install.
-        spark_force_reinstall (bool): If set, reinstalls Spark, even when a valid installation is present.
+        spark_force_reinstall (bool): If set, reinstalls Spark on all nodes, even when a valid installation is present.
         spark_silent (bool): Indication whether Spark output must be suppressed.
         silent (bool): Indication whether general output must be suppressed.
 
     Returns:
         `True` on success, `False` on failure.'''
     config = interface.config
-    if not spark_deploy.install(metareserve.Reservation(interface.distribution['spark']), key_path=config.key_path, spark_url=config.spark_download_url, force_reinstall=config.spark_force_reinstall, silent=config.spark_silent or config.silent):
-        printe('Could not install Spark (iteration {}/{})'.format(idx+1, num_experiments))
-        return False
-    return True
+    spark_nodes = interface.distribution['spark']
+    fingerprint = spark_install_fingerprint(config)
+    connectionwrappers = get_connections(config, spark_nodes, silent=config.spark_silent or config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all Spark nodes (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        stale_nodes, new_nodes = (spark_nodes, []) if config.spark_force_reinstall else remote_fingerprint_mismatches(connectionwrappers, 'spark', fingerprint)
+        install_nodes = stale_nodes+new_nodes
+        if not any(install_nodes):
+            print('Spark installation is up-to-date on all {} nodes, skipping installation.'.format(len(spark_nodes)))
+            return True
+        if len(install_nodes) < len(spark_nodes):
+            print('Spark installation is up-to-date on {}/{} nodes. Installing on the remaining {} nodes.'.format(len(spark_nodes)-len(install_nodes), len(spark_nodes), len(install_nodes)))
+
+        # spark-deploy skips nodes having any installation, so stale installations must be replaced forcibly.
+        for nodes, force_reinstall in ((stale_nodes, True), (new_nodes, config.spark_force_reinstall)):
+            if any(nodes) and not spark_deploy.install(metareserve.Reservation(nodes), key_path=config.key_path, spark_url=config.spark_download_url, force_reinstall=force_reinstall, silent=config.spark_silent or config.silent):
+                printe('Could not install Spark (iteration {}/{})'.format(idx+1, num_experiments))
+                return False
+        if not remote_fingerprint_store({x: connectionwrappers[x] for x in install_nodes}, 'spark', fingerprint):
+            printw('Could not store Spark install fingerprint on all nodes. Next execution will reinstall these.')
+        return True
+    finally:
+        close_wrappers(connectionwrappers)
 
 
 def start_spark(interface, idx, num_experiments):
@@ -0,0 +1,179 @@
+import concurrent.futures
+import json
+import subprocess
+
+import remoto
+
+from experimenter.internal.remoto.ssh_wrapper import close_wrappers
+from experimenter.internal.experiment.execution.functionstore.util import get_connections, all_open
+import experimenter.internal.experiment.execution.functionstore.telemetry_sampler as telemetry_sampler
+
+import utils.fs as fs
+from utils.printer import *
+
+
+_remote_telemetry_dir = '~/.spark_arrow_experiments/telemetry'
+
+
+def _telemetry_nodes(interface):
+    '''Returns `dict(metareserve.Node, list(str))`, mapping every node to sample to the distribution keys it belongs to. Nodes in multiple groups are sampled only once.'''
+    nodes = dict()
+    for group in interface.config.telemetry_groups:
+        for node in interface.distribution.get(group, []):
+            nodes.setdefault(node, []).append(group)
+    return nodes
+
+
+def _remote_paths(config):
+    sample_name = '{}.samples'.format(config.result_file)
+    return fs.join(_remote_telemetry_dir, 'sampler.py'), fs.join(_remote_telemetry_dir, sample_name), fs.join(_remote_telemetry_dir, '{}.pid'.format(sample_name))
+
+
+def telemetry_dir(config):
+    '''Returns the local directory in which telemetry of an execution is stored.'''
+    return fs.join(config.result_dir, '{}.telemetry'.format(config.result_file))
+
+
+def telemetry_start(interface, idx, num_experiments):
+    '''Starts a /proc-based resource sampler (see `telemetry_sampler`) on all nodes of the configured distribution groups.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        telemetry_groups (list(str)): Distribution keys of nodes to sample.
+        telemetry_interval (float): Sampling interval in seconds.
+        result_file (str): Result file on the local machine. Used to name remote sample files.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    nodes = _telemetry_nodes(interface)
+    if not any(nodes):
+        printw('No nodes to sample telemetry from (groups: {})'.format(', '.join(config.telemetry_groups)))
+        return True
+    sampler_path, sample_path, pid_path = _remote_paths(config)
+
+    connectionwrappers = get_connections(config, list(nodes), silent=config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all telemetry nodes (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        def _start(node, wrapper):
+            _, _, exitcode = remoto.process.check(wrapper.connection, 'mkdir -p {}'.format(_remote_telemetry_dir), shell=True)
+            if exitcode != 0:
+                return False
+            if subprocess.call('rsync -e "ssh -F {}" -q -aHAX {} {}:{}'.format(wrapper.ssh_config_path, telemetry_sampler.__file__, node.ip_public, sampler_path), shell=True) != 0:
+                return False
+            cmd = 'nohup python3 {} {} --interval {} > /dev/null 2>&1 < /dev/null & echo $! > {}'.format(sampler_path, sample_path, config.telemetry_interval, pid_path)
+            return remoto.process.check(wrapper.connection, cmd, shell=True)[2] == 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            futures_start = [executor.submit(_start, node, connectionwrappers[node]) for node in nodes]
+            if not all(x.result() for x in futures_start):
+                printe('Could not start telemetry samplers on all nodes (iteration {}/{})'.format(idx+1, num_experiments))
+                return False
+        print('Started telemetry samplers on {} nodes ({}s interval).'.format(len(nodes), config.telemetry_interval))
+        return True
+    finally:
+        close_wrappers(connectionwrappers)
+
+
+def telemetry_stop(interface, idx, num_experiments):
+    '''Stops samplers started by `telemetry_start`, and fetches their samples to `<result_dir>/<result_file>.telemetry/`.
+    Sample files are named `<node_id>.samples`. A `nodes.json` file maps node ids to hostnames, ips and distribution keys.
+    Args:
+        interface (ExecutionInterface): Interface this function is registered for. Used to get the config.
+        idx (int): Experiment index.
+        num_experiments (int): Amount of experiments.
+
+    Required config args:
+        key_path (str or None): Path to ssh key to use when connecting to cluster nodes.
+        telemetry_groups (list(str)): Distribution keys of nodes to sample.
+        result_dir (str): Result dir on the local machine.
+        result_file (str): Result file on the local machine.
+        silent (bool): Indication whether general output must be suppressed.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    config = interface.config
+    nodes = _telemetry_nodes(interface)
+    if not any(nodes):
+        return True
+    _, sample_path, pid_path = _remote_paths(config)
+    local_dir = telemetry_dir(config)
+    fs.mkdir(local_dir, exist_ok=True)
+
+    connectionwrappers = get_connections(config, list(nodes), silent=config.silent)
+    try:
+        if not all_open(connectionwrappers):
+            printe('Could not connect to all telemetry nodes (iteration {}/{})'.format(idx+1, num_experiments))
+            return False
+        def _stop(node, wrapper):
+            # SIGTERM lets the sampler finish its current record. We wait for it to exit before fetching.
+            cmd = 'pid=$(cat {0} 2>/dev/null) && kill $pid 2>/dev/null; for i in $(seq 50); do kill -0 $pid 2>/dev/null || break; sleep 0.1; done; rm -f {0}'.format(pid_path)
+            remoto.process.check(wrapper.connection, cmd, shell=True)
+            if subprocess.call('rsync -e "ssh -F {}" -q -aHAX --remove-source-files {}:{} {}'.format(wrapper.ssh_config_path, node.ip_public, sample_path, fs.join(local_dir, '{}.samples'.format(node.node_id))), shell=True) != 0:
+                printw('Could not fetch telemetry samples from node {}'.format(node.node_id))
+                return False
+            return True
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            futures_stop = {node: executor.submit(_stop, node, connectionwrappers[node]) for node in nodes}
+            fetched = {node: x.result() for node, x in futures_stop.items()}
+    finally:
+        close_wrappers(connectionwrappers)
+
+    with open(fs.join(local_dir, 'nodes.json'), 'w') as f:
+        json.dump({str(node.node_id): {'hostname': node.extra_info.get('hostname') if node.extra_info else None, 'ip_local': node.ip_local, 'ip_public': node.ip_public, 'groups': groups, 'fetched': fetched[node]} for node, groups in nodes.items()}, f, indent=2)
+    print('Fetched telemetry from {}/{} nodes (iteration {}/{}).'.format(sum(1 for x in fetched.values() if x), len(nodes), idx+1, num_experiments))
+    return True # Telemetry is best-effort: Missing samples do not invalidate the experiment.
+
+
+def align_runs(result_path, dest_path):
+    '''Computes run boundaries from a result file, and stores them as JSON.
+    Result files contain only durations. We place the end of the last run at the result file's modification time
+    (preserved when fetching), and go backwards using the cumulative run durations. Runs are assumed to be executed back-to-back.
+    Args:
+        result_path (str): Path to result file, containing `init_ns,comp_ns` lines.
+        dest_path (str): Path to write JSON output to. Contains a list of `{'run': int, 'start': float, 'end': float}` dicts, in epoch seconds.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    if not fs.isfile(result_path):
+        printw('Cannot align telemetry: Result file not found: {}'.format(result_path))
+        return False
+    durations = []
+    with open(result_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            durations.append(sum(int(x) for x in line.split(','))/1000000000)
+    end = fs.stat(result_path).st_mtime
+    runs = []
+    for run, duration in reversed(list(enumerate(durations))):
+        runs.append({'run': run, 'start': end-duration, 'end': end})
+        end -= duration
+    with open(dest_path, 'w') as f:
+        json.dump(list(reversed(runs)), f, indent=2)
+    return True
+
+
+def telemetry_align(interface, idx, num_experiments):
+    '''Aligns fetched telemetry with run boundaries, writing `runs.json` next to the samples (see `align_runs`).
+    Must be registered after the function fetching the result file.'''
+    config = interface.config
+    if not fs.isdir(telemetry_dir(config)):
+        return True
+    align_runs(fs.join(config.result_dir, config.result_file), fs.join(telemetry_dir(config), 'runs.json'))
+    return True
+
+
+def register_telemetry_functions(interface, idx, num_experiments):
+    '''Registers telemetry sampling around the experiment stage, and run alignment as a result fetch function.
+    Note: Register this after the default result fetch function.'''
+    interface.register('monitor_start_funcs', lambda iface: telemetry_start(iface, idx, num_experiments))
+    interface.register('monitor_stop_funcs', lambda iface: telemetry_stop(iface, idx, num_experiments))
+    interface.register('result_fetch_funcs', lambda iface: telemetry_align(iface, idx, num_experiments))
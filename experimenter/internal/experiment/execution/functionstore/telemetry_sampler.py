@@ -0,0 +1,118 @@
+'''Lightweight /proc-based resource sampler. This file is standalone (stdlib only): It is shipped to remote nodes and executed there.
+Sample file format:
+    b'SATS1\n'                              magic line
+    <JSON header>\n                          dict with keys 'fields' (list(str)), 'interval' (float), 'hostname' (str)
+    records of len(fields) little-endian doubles, one record per sample. The first field is always 'time' (epoch seconds, remote clock).
+Rates (CPU fractions, bytes per second) are computed over the interval preceding each sample.'''
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import time
+
+
+MAGIC = b'SATS1\n'
+FIELDS = ['time', 'cpu_user', 'cpu_system', 'cpu_iowait', 'cpu_idle', 'mem_used', 'mem_total', 'disk_read', 'disk_write', 'net_rx', 'net_tx']
+
+
+def _read_cpu():
+    '''Returns `(user, system, iowait, idle, total)` jiffies, summed over all CPUs.'''
+    with open('/proc/stat', 'r') as f:
+        values = [int(x) for x in f.readline().split()[1:]]
+    user, nice, system, idle, iowait = values[:5]
+    return user+nice, system+sum(values[5:8]), iowait, idle, sum(values[:8])
+
+
+def _read_mem():
+    '''Returns `(used, total)` memory in bytes.'''
+    info = dict()
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            info[key] = int(value.split()[0])*1024
+    return info['MemTotal']-info.get('MemAvailable', info['MemFree']), info['MemTotal']
+
+
+def _read_disk():
+    '''Returns `(read, written)` bytes, summed over all physical block devices (partitions are skipped to prevent double counting).'''
+    read, written = 0, 0
+    with open('/proc/diskstats', 'r') as f:
+        for line in f:
+            parts = line.split()
+            name = parts[2]
+            if name.startswith(('loop', 'ram', 'dm-')) or not os.path.exists('/sys/block/{}'.format(name)):
+                continue
+            read += int(parts[5])*512
+            written += int(parts[9])*512
+    return read, written
+
+
+def _read_net():
+    '''Returns `(received, transmitted)` bytes, summed over all non-loopback interfaces.'''
+    received, transmitted = 0, 0
+    with open('/proc/net/dev', 'r') as f:
+        for line in f.readlines()[2:]:
+            name, _, values = line.partition(':')
+            if name.strip() == 'lo':
+                continue
+            values = values.split()
+            received += int(values[0])
+            transmitted += int(values[8])
+    return received, transmitted
+
+
+def _snapshot():
+    return time.time(), _read_cpu(), _read_mem(), _read_disk(), _read_net()
+
+
+def _record(prev, cur):
+    '''Computes a sample record from two consecutive snapshots.'''
+    t0, cpu0, _, disk0, net0 = prev
+    t1, cpu1, mem, disk1, net1 = cur
+    elapsed = max(t1-t0, 1e-9)
+    jiffies = max(cpu1[4]-cpu0[4], 1)
+    return [t1] + [(cpu1[x]-cpu0[x])/jiffies for x in range(4)] + list(mem) + [(disk1[x]-disk0[x])/elapsed for x in range(2)] + [(net1[x]-net0[x])/elapsed for x in range(2)]
+
+
+def sample(path, interval):
+    '''Samples until receiving SIGTERM or SIGINT, appending records to `path`.'''
+    stopped = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.append(signum))
+    record_struct = struct.Struct('<{}d'.format(len(FIELDS)))
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(json.dumps({'fields': FIELDS, 'interval': interval, 'hostname': socket.gethostname()}).encode('utf-8')+b'\n')
+        f.flush()
+        prev = _snapshot()
+        while not stopped:
+            time.sleep(max(0, prev[0]+interval-time.time()))
+            cur = _snapshot()
+            f.write(record_struct.pack(*_record(prev, cur)))
+            f.flush()
+            prev = cur
+
+
+def read_samples(path):
+    '''Reads a sample file. Incomplete trailing records (e.g. from a sampler killed mid-write) are ignored.
+    Returns:
+        `(dict, list(list(float)))`: The header, and the records.'''
+    with open(path, 'rb') as f:
+        if f.readline() != MAGIC:
+            raise ValueError('Not a sample file: {}'.format(path))
+        header = json.loads(f.readline().decode('utf-8'))
+        data = f.read()
+    record_struct = struct.Struct('<{}d'.format(len(header['fields'])))
+    usable = len(data) - len(data) % record_struct.size
+    return header, [list(x) for x in record_struct.iter_unpack(data[:usable])]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Samples CPU, memory, disk and network usage from /proc.')
+    parser.add_argument('path', type=str, help='Output sample file.')
+    parser.add_argument('--interval', type=float, default=1.0, help='Sampling interval in seconds.')
+    args = parser.parse_args()
+    sample(args.path, args.interval)
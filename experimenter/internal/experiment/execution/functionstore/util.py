@@ -1,5 +1,91 @@
+import concurrent.futures
+import hashlib
+import json
+
 import remoto
 
+from experimenter.internal.remoto.ssh_wrapper import get_wrappers
+
 def get_user_home(connection):
     out, err, exitcode = remoto.process.check(connection, 'echo $HOME', shell=True)
-    return '\n'.join(out).strip() if exitcode == 0 and out else None
\ No newline at end of file
+    return '\n'.join(out).strip() if exitcode == 0 and out else None
+
+
+def _merge_kwargs(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
+
+def get_connections(config, nodes, silent=False):
+    '''Opens connections to given nodes in parallel, using the ssh settings of given config.
+    Warning: The `RemotoSSHWrapper` objects created here must be properly closed.
+    Returns:
+        `dict(metareserve.Node, RemotoSSHWrapper)`, mapping nodes to open connection wrappers.'''
+    ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
+    if config.key_path:
+        ssh_kwargs['IdentityFile'] = config.key_path
+    return get_wrappers(nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=silent)
+
+
+def all_open(connectionwrappers):
+    '''Returns `True` if all given connection wrappers hold an open connection. Wrappers for nodes we could not connect to are not open.'''
+    return all(x.open for x in connectionwrappers.values())
+
+
+def package_version(name):
+    '''Returns the installed version of given Python distribution, or `None` if unknown.'''
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception as e:
+        return None
+
+
+def compute_fingerprint(params):
+    '''Computes a stable fingerprint for a dict of JSON-serializable parameters.'''
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _fingerprint_path(component):
+    return '~/.spark_arrow_experiments/{}.fingerprint'.format(component)
+
+
+def remote_fingerprints(connectionwrappers, component):
+    '''Reads stored install fingerprints for a component from all given nodes, in parallel.
+    Args:
+        connectionwrappers (dict(metareserve.Node, RemotoSSHWrapper)): Open connections to nodes to read from.
+        component (str): Name of the installed component, e.g. 'spark'.
+
+    Returns:
+        `dict(metareserve.Node, list(str))`, mapping nodes to the lines of their stored fingerprint file. The first line is the fingerprint. Nodes without fingerprint map to an empty list.'''
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(connectionwrappers)) as executor:
+        futures_read = {node: executor.submit(remoto.process.check, wrapper.connection, 'cat {} 2>/dev/null'.format(_fingerprint_path(component)), shell=True) for node, wrapper in connectionwrappers.items()}
+        results = {node: x.result() for node, x in futures_read.items()}
+    return {node: [line.strip() for line in out] if exitcode == 0 else [] for node, (out, err, exitcode) in results.items()}
+
+
+def remote_fingerprint_mismatches(connectionwrappers, component, fingerprint):
+    '''Finds nodes whose stored install fingerprint for a component does not match `fingerprint`.
+    Returns:
+        `(list(metareserve.Node), list(metareserve.Node))`: Nodes with a stale fingerprint, and nodes without fingerprint.'''
+    stored = remote_fingerprints(connectionwrappers, component)
+    return [node for node, lines in stored.items() if any(lines) and lines[0] != fingerprint], [node for node, lines in stored.items() if not any(lines)]
+
+
+def remote_fingerprint_store(connectionwrappers, component, fingerprint, extra_lines=None):
+    '''Stores an install fingerprint for a component on all given nodes, in parallel.
+    Args:
+        connectionwrappers (dict(metareserve.Node, RemotoSSHWrapper)): Open connections to nodes to write to.
+        component (str): Name of the installed component, e.g. 'spark'.
+        fingerprint (str): Fingerprint to store.
+        extra_lines (optional list(str)): Extra information lines to store after the fingerprint.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    path = _fingerprint_path(component)
+    content = '\n'.join([fingerprint]+(extra_lines if extra_lines else []))
+    cmd = 'mkdir -p $(dirname {0}) && printf "%s\\n" "{1}" > {0}'.format(path, content)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(connectionwrappers)) as executor:
+        futures_write = [executor.submit(remoto.process.check, wrapper.connection, cmd, shell=True) for wrapper in connectionwrappers.values()]
+        return all(x.result()[2] == 0 for x in futures_write)
@@ -8,6 +8,8 @@ import rados_deploy
 import experimenter.internal.data as data
 from experimenter.internal.experiment.interface import ExperimentInterface
 import experimenter.internal.experiment.blocker as blocker
+import experimenter.internal.experiment.costmodel as costmodel
+import experimenter.internal.experiment.fingerprint as fingerprint
 import experimenter.internal.result.util as func_util
 import utils.fs as fs
 import utils.location as loc
@@ -20,24 +22,111 @@ def _merge_kwargs(x, y):
     return z
 
 
-def execute_single(name, experiment, reservation, exp_idx, exp_len):
+def execute_single(name, experiment, reservation, exp_idx, exp_len, background_executor=None, prepare_func=None):
+    '''Execute all executions of a single experiment.
+    Args:
+        name (str): Name of the experiment.
+        experiment (ExperimentInterface): Experiment to execute.
+        reservation (metareserve.Reservation): Node reservation to use for executing experiments.
+        exp_idx (int): Index of this experiment.
+        exp_len (int): Total amount of experiments.
+        background_executor (optional concurrent.futures.Executor): If set, executions with `result_fetch_async` set fetch their results in the background using this executor.
+        prepare_func (optional callable): If set, called as `prepare_func(execution, idx, num_executions)` for every execution before executing it, e.g. to localize executions.
+
+    Returns:
+        `list((str, ExecutionInterface, bool))` with a `(label, execution, succeeded)` tuple for every execution.'''
     executions = list(experiment.get_executions())
 
     num_executions = len(executions)
+    outcomes = []
+    measured = dict() # Caches indices of measured configurations, per search directory.
+    previous_data = None
     for idx, execution in enumerate(executions):
-        printc('Executing "{}" (which is experiment {}/{}): Execution {}/{}'.format(name, exp_idx+1, exp_len, idx+1, num_executions), Color.CAN)
+        label = '"{}" (which is experiment {}/{}): Execution {}/{}'.format(name, exp_idx+1, exp_len, idx+1, num_executions)
+        if prepare_func:
+            prepare_func(execution, idx, num_executions)
+        if getattr(execution.config, 'skip_measured', False):
+            search_dir = execution.config.skip_measured_dir
+            if not search_dir in measured:
+                measured[search_dir] = fingerprint.index_measured(search_dir)
+            found = measured[search_dir].get(fingerprint.config_fingerprint(execution.config))
+            if found:
+                prints('Skipping {}: Already measured in {}'.format(label, found[0]))
+                continue
+        printc('Executing {}'.format(label), Color.CAN)
         execution.reservation = reservation
-        if not execution.execute():
-            printw('Failed executing "{}" (which is experiment {}/{}): Execution {}/{}'.format(name, exp_idx+1, exp_len, idx+1, num_executions))
+        use_background = background_executor and getattr(execution.config, 'result_fetch_async', False)
+        succeeded = execution.execute(background_executor=background_executor if use_background else None)
+        if succeeded: # Stage timings of failed executions are incomplete, and would skew predictions.
+            costmodel.record(execution, execution.config.stage_history_path, first=not any(outcomes), data_reused=getattr(execution.config, 'data_deploy_incremental', False) and costmodel.data_key(execution.config) == previous_data)
+        previous_data = costmodel.data_key(execution.config) if succeeded else None
+        if not succeeded:
+            printw('Failed executing {}'.format(label))
         else:
-            prints('Completed "{}" (which is experiment {}/{}): Execution {}/{}'.format(name, exp_idx+1, exp_len, idx+1, num_executions))
+            prints('Completed {}'.format(label))
+        outcomes.append((label, execution, succeeded))
+    return outcomes
+
+
+def _print_summary(outcomes):
+    '''Waits for all outstanding background result fetches, and prints a summary of all executions.
+    Returns:
+        `True` if all result fetches succeeded, `False` otherwise.'''
+    fetch_failures = []
+    pending = [(label, execution) for label, execution, _ in outcomes if execution.result_fetch_future]
+    if any(pending):
+        print('Waiting for {} background result fetch(es) to complete...'.format(sum(1 for _, x in pending if not x.result_fetch_future.done())))
+    for label, execution in pending:
+        try:
+            if not execution.result_fetch_future.result():
+                fetch_failures.append(label)
+        except Exception as e:
+            printe('Background result fetch for {} raised an exception: {}'.format(label, e))
+            fetch_failures.append(label)
+
+    failures = [label for label, _, succeeded in outcomes if not succeeded]
+    print('Summary: {}/{} executions completed.'.format(len(outcomes)-len(failures), len(outcomes)))
+    if any(failures):
+        printw('Failed executions:\n{}'.format(''.join('\t{}\n'.format(x) for x in failures)))
+    if any(fetch_failures):
+        printe('Failed background result fetches:\n{}'.format(''.join('\t{}\n'.format(x) for x in fetch_failures)))
+    return not any(fetch_failures)
+
+
+def dry_run(experiment_mapping, prepare_func=None):
+    '''Simulates executing a series of experiments, without reservation: Expands all executions, and predicts stage durations using a cost model calibrated on recorded stage timings (see `costmodel.py`).
+    Args:
+        experiment_mapping (dict(str, module)): A mapping from experiment name to experiment module.
+        prepare_func (optional callable): If set, called as `prepare_func(execution, idx, num_executions)` for every execution before simulating it.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    total = 0.0
+    models = dict() # Caches cost models, per history file.
+    for name, experiment in experiment_mapping.items():
+        if not ExperimentInterface.is_experiment(experiment):
+            raise ValueError('Passed value is not a valid experiment: {} (type: {}).'.format(name, type(experiment)))
+        executions = list(experiment.get_executions())
+        for idx, execution in enumerate(executions):
+            if prepare_func:
+                prepare_func(execution, idx, len(executions))
+        if not any(executions):
+            printw('Experiment "{}" has no executions.'.format(name))
+            continue
+        history_path = executions[0].config.stage_history_path
+        if not history_path in models:
+            models[history_path] = costmodel.CostModel(costmodel.read_history(history_path))
+        total += costmodel.report(name, costmodel.simulate(executions, models[history_path]), models[history_path])
+    prints('Predicted total wall-clock time: {}'.format(costmodel.format_seconds(total)))
+    return True
 
 
-def execute(experiment_mapping, reservation):
+def execute(experiment_mapping, reservation, prepare_func=None):
     '''Execute a series of experiments.
     Args:
         experiment_mapping (dict(str, module)): A mapping from experiment name to experiment module.
         reservation (metareserve.Reservation): Node reservation to use for executing experiments.
+        prepare_func (optional callable): If set, called as `prepare_func(execution, idx, num_executions)` for every execution before executing it.
 
     Returns:
         `True` on success, `False` on failure.'''
@@ -49,7 +138,10 @@ def execute(experiment_mapping, reservation):
     # Note: This depends on the distribution function of each experiment.
     # In general: It fits as long as the amount of nodes >= amount of nodes needed by experiment for Spark+Ceph...
 
-    for idx, (name, experiment) in enumerate(experiment_mapping.items()):
-        print('Starting experiment "{}".'.format(name))
-        execute_single(name, experiment, reservation, idx, len(experiment_mapping))
-    return True
\ No newline at end of file
+    outcomes = []
+    # One worker: Background fetches run in order of submission, and never compete with each other for bandwidth.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as background_executor:
+        for idx, (name, experiment) in enumerate(experiment_mapping.items()):
+            print('Starting experiment "{}".'.format(name))
+            outcomes += execute_single(name, experiment, reservation, idx, len(experiment_mapping), background_executor=background_executor, prepare_func=prepare_func)
+        return _print_summary(outcomes)
@@ -0,0 +1,148 @@
+from datetime import datetime
+from enum import Enum
+import hashlib
+import json
+import os
+
+import utils.fs as fs
+import utils.location as loc
+
+'''Canonical fingerprints of built experiment configurations. Equal fingerprints mean equal experiments, regardless of where results are stored or how verbose execution was.'''
+
+# Configuration fields which do not influence measurements: Output locations, verbosity, retry/polling behaviour and observability.
+COSMETIC_FIELDS = frozenset([
+    'silent', 'spark_silent', 'ceph_silent',
+    'result_dir', 'result_file', 'remote_result_dir', 'remote_result_file', 'local_application_paths', 'key_path',
+    'tries', 'sleeptime', 'dead_after_tries', 'collect_tries', 'collect_artifacts', 'result_fetch_async', 'eventlog_path',
+    'spark_force_reinstall', 'ceph_force_reinstall', 'ceph_artifact_cache', 'ceph_artifact_paths',
+    'data_deploy_incremental', 'data_deploy_striped', 'data_deploy_streams',
+    'adaptive_stop_grace', 'skip_measured', 'skip_measured_dir', 'resume_runs', 'resume_warmup_runs',
+    'driver_watch', 'driver_watch_interval', 'driver_watch_grace', 'driver_watch_context', 'driver_logs', 'driver_error_patterns', 'spark_master_webui_port',
+    'local_dir', 'local_mock_data_size', 'stage_history_path',
+    'flamegraph_time', 'flamegraph_only_master', 'flamegraph_only_worker', 'flamegraph_groups', 'flamegraph_delay', 'flamegraph_frequency', 'flamegraph_sudo', 'flamegraph_top',
+    'telemetry_groups', 'telemetry_interval', 'breakdown_logs', 'breakdown_stages',
+])
+
+# Fields holding campaign-specific directories. Occurrences in other fields (e.g. `--result-path` in `spark_application_args`) are replaced by placeholders.
+PLACEHOLDER_FIELDS = ['remote_result_dir', 'remote_data_dir']
+
+_sidecar_suffix = '.config.json'
+
+
+def _normalize(value):
+    '''Converts a configuration value to a canonical JSON-serializable form.'''
+    if value == None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, Enum):
+        return '{}.{}'.format(value.__class__.__name__, value.name)
+    if isinstance(value, (list, tuple)):
+        return [_normalize(x) for x in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_normalize(x) for x in value), key=lambda x: json.dumps(x, sort_keys=True))
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if callable(value):
+        raise ValueError('Cannot fingerprint unbuilt configuration value: {}. Build the configuration first.'.format(value))
+    if hasattr(value, '__dict__'):
+        normalized = {k.lstrip('_'): _normalize(v) for k, v in vars(value).items()}
+        normalized['__class__'] = value.__class__.__name__
+        return normalized
+    return str(value)
+
+
+def _substitute(value, replacements):
+    '''Replaces substrings in all strings of a normalized value.'''
+    if isinstance(value, str):
+        for old, new in replacements:
+            value = value.replace(old, new)
+        return value
+    if isinstance(value, list):
+        return [_substitute(x, replacements) for x in value]
+    if isinstance(value, dict):
+        return {k: _substitute(v, replacements) for k, v in value.items()}
+    return value
+
+
+def _normalize_data_path(path):
+    '''Returns a location-independent representation of a local data path, so equal data in different checkouts or machines has equal representations.
+    Paths inside the data generation directory become relative to it, like `<data_generation_dir>/x.pq`.
+    Other paths become their basename, with a digest of the names and sizes of all contained files.'''
+    path = fs.abspath(path)
+    generation_dir = fs.abspath(loc.data_generation_dir())
+    if path.startswith(generation_dir+os.sep):
+        return '<data_generation_dir>/{}'.format('/'.join(path[len(generation_dir)+1:].split(os.sep)))
+    if fs.isfile(path):
+        listing = [('', os.path.getsize(path))]
+    else:
+        listing = sorted((os.path.relpath(fs.join(dirpath, x), path), os.path.getsize(fs.join(dirpath, x))) for dirpath, _, filenames in os.walk(path) for x in filenames)
+    return '{}@{}'.format(fs.basename(path), hashlib.sha256(json.dumps(listing).encode('utf-8')).hexdigest()[:16])
+
+
+def canonical_config(config, ignore=COSMETIC_FIELDS):
+    '''Returns a canonical representation of a built configuration.
+    Campaign-specific directories (see `PLACEHOLDER_FIELDS`) embedded in other fields are replaced by placeholders like `<remote_result_dir>`, so equal configurations of different campaigns have equal representations.
+    The local `data_path` is normalized as well (see `_normalize_data_path`).
+    Args:
+        config (ExperimentConfiguration): Built configuration.
+        ignore (optional iterable(str)): Field names to leave out.
+
+    Returns:
+        `dict(str, Any)`, mapping all non-ignored public fields to normalized values.'''
+    fields = vars(config)
+    replacements = sorted(((fields[x], '<{}>'.format(x)) for x in PLACEHOLDER_FIELDS if isinstance(fields.get(x), str) and fields[x]), key=lambda x: -len(x[0])) # Longest first, in case one directory contains another.
+    canonical = {k: _normalize(v) if k in PLACEHOLDER_FIELDS else _substitute(_normalize(v), replacements) for k, v in fields.items() if not (k.startswith('_') or k in ignore)}
+    if isinstance(canonical.get('data_path'), str) and canonical['data_path']:
+        canonical['data_path'] = _normalize_data_path(canonical['data_path'])
+    return canonical
+
+
+def config_fingerprint(config, ignore=COSMETIC_FIELDS):
+    '''Computes a stable fingerprint (sha256 hexdigest) of a built configuration. See `canonical_config`.'''
+    return hashlib.sha256(json.dumps(canonical_config(config, ignore=ignore), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def sidecar_path(result_path):
+    '''Returns the path of the configuration sidecar file belonging to a result file.'''
+    return result_path+_sidecar_suffix
+
+
+def write_sidecar(config, result_path):
+    '''Writes a configuration sidecar file next to a result file, containing the fingerprint and canonical configuration.'''
+    with open(sidecar_path(result_path), 'w') as f:
+        json.dump({
+            'fingerprint': config_fingerprint(config),
+            'created': datetime.now().isoformat(),
+            'result_file': fs.basename(result_path),
+            'config': canonical_config(config)}, f, indent=2, sort_keys=True)
+
+
+def read_sidecar(result_path):
+    '''Reads the configuration sidecar file belonging to a result file. Returns `None` if there is no (readable) sidecar.'''
+    try:
+        with open(sidecar_path(result_path), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        return None
+
+
+def index_measured(path):
+    '''Searches recursively for result files with configuration sidecars.
+    Args:
+        path (str): Directory to search.
+
+    Returns:
+        `dict(str, list(str))`, mapping fingerprints to paths of existing result files measured with that configuration.'''
+    index = dict()
+    if not fs.isdir(path):
+        return index
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            if not name.endswith(_sidecar_suffix):
+                continue
+            result_path = fs.join(dirpath, name[:-len(_sidecar_suffix)])
+            sidecar = read_sidecar(result_path)
+            if sidecar and fs.isfile(result_path):
+                index.setdefault(sidecar['fingerprint'], []).append(result_path)
+    return index
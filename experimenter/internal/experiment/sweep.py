@@ -0,0 +1,137 @@
+import itertools
+import math
+import random
+
+from experimenter.internal.experiment.config import ExperimentConfigurationBuilder
+from experimenter.internal.experiment.execution.execution_interface import ExecutionInterface
+
+
+class Axis(object):
+    '''A swept parameter: A config attribute name with the values to try.'''
+    def __init__(self, name, values):
+        '''Args:
+            name (str): Name of the config attribute to set.
+            values (iterable(Any)): Values to try. May contain callables, which are resolved when the config is built (see `ExperimentConfigurationBuilder`).'''
+        self.names = [name]
+        self.levels = [{name: x} for x in values]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class Zip(Axis):
+    '''Multiple axes varying together, e.g. queries and their row selectivity. All axes must have the same amount of values.'''
+    def __init__(self, *axes):
+        if len(set(len(x) for x in axes)) > 1:
+            raise ValueError('Zipped axes must have equal lengths, found: {}'.format(', '.join('{}={}'.format(x.names, len(x)) for x in axes)))
+        self.names = [name for axis in axes for name in axis.names]
+        self.levels = [dict(kv for level in levels for kv in level.items()) for levels in zip(*(x.levels for x in axes))]
+
+
+class FullFactorial(object):
+    '''Visits every combination of axis values (cartesian product).'''
+    def count(self, axes):
+        return math.prod(len(x) for x in axes)
+
+    def indices(self, axes):
+        return itertools.product(*(range(len(x)) for x in axes))
+
+
+class LatinHypercube(object):
+    '''Visits `samples` points, such that every axis value is visited (about) equally often, and value combinations are spread out.
+    Every axis gets its own random permutation of sample strata. Deterministic for a given seed.'''
+    def __init__(self, samples, seed=0):
+        self.samples = samples
+        self.seed = seed
+
+    def count(self, axes):
+        return self.samples
+
+    def indices(self, axes):
+        rng = random.Random(self.seed)
+        columns = []
+        for axis in axes:
+            strata = list(range(self.samples))
+            rng.shuffle(strata)
+            columns.append([x*len(axis)//self.samples for x in strata])
+        return zip(*columns)
+
+
+class OneAtATime(object):
+    '''Visits a baseline point, then varies one axis at a time over all its other values, keeping the others at baseline.'''
+    def __init__(self, baseline=None):
+        '''Args:
+            baseline (optional dict(str, int)): Maps axis names (the first name, for zipped axes) to the index of their baseline value. Unlisted axes use their first value.'''
+        self.baseline = baseline if baseline else dict()
+
+    def count(self, axes):
+        return 1+sum(len(x)-1 for x in axes)
+
+    def indices(self, axes):
+        base = [self.baseline.get(x.names[0], 0) for x in axes]
+        yield tuple(base)
+        for axis_idx, axis in enumerate(axes):
+            for level_idx in range(len(axis)):
+                if level_idx != base[axis_idx]:
+                    yield tuple(base[:axis_idx]+[level_idx]+base[axis_idx+1:])
+
+
+class Sweep(object):
+    '''Declarative parameter sweep, expanding into experiment configurations lazily.
+    Example:
+    ```
+    sweep = Sweep(
+        Axis('mode', ['--arrow-only', '--spark-only']),
+        Zip(Axis('copy_multiplier', [32, 32]), Axis('link_multiplier', [4, 8])),
+        fixed={'runs': 21, 'stripe': 128},
+        derived={'result_dirname': lambda point: 'cp{}_ln{}'.format(point['copy_multiplier'], point['link_multiplier'])},
+        strategy=FullFactorial())
+    for interface in sweep.executions(register_func):
+        yield interface
+    ```'''
+    def __init__(self, *axes, fixed=None, derived=None, strategy=None):
+        '''Args:
+            *axes (Axis): Axes to sweep.
+            fixed (optional dict(str, Any)): Config attributes set for every point. Values may be callables, resolved when the config is built.
+            derived (optional dict(str, callable)): Config attributes computed from a point. Callables receive the point (`dict(str, Any)` of axis values and earlier derived fields), in insertion order.
+            strategy (optional FullFactorial, LatinHypercube, OneAtATime): Sampling strategy. Defaults to `FullFactorial`.'''
+        self.axes = list(axes)
+        self.fixed = fixed if fixed else dict()
+        self.derived = derived if derived else dict()
+        self.strategy = strategy if strategy else FullFactorial()
+        names = [name for axis in self.axes for name in axis.names]
+        duplicates = set(x for x in names if names.count(x) > 1)
+        if any(duplicates):
+            raise ValueError('Axis names must be unique, found duplicates: {}'.format(', '.join(sorted(duplicates))))
+
+    def __len__(self):
+        return self.strategy.count(self.axes)
+
+    def points(self):
+        '''Generates all points of this sweep, as `dict(str, Any)` of axis values and derived fields.'''
+        for indices in self.strategy.indices(self.axes):
+            point = dict()
+            for axis, idx in zip(self.axes, indices):
+                point.update(axis.levels[idx])
+            for name, func in self.derived.items():
+                point[name] = func(point)
+            yield point
+
+    def configs(self, builder_class=ExperimentConfigurationBuilder):
+        '''Generates built configurations, one per point. Fixed attributes are set first, so points and derived fields override them.'''
+        for point in self.points():
+            builder = builder_class()
+            for name, value in itertools.chain(self.fixed.items(), point.items()):
+                builder.set(name, value)
+            yield builder.build()
+
+    def executions(self, register_func, builder_class=ExperimentConfigurationBuilder):
+        '''Generates `ExecutionInterface`s, one per point.
+        Args:
+            register_func (callable): Called as `register_func(interface, idx, num_experiments)` for every interface, to register stage functions.
+            builder_class (optional class): Configuration builder to use.'''
+        num_experiments = len(self)
+        for idx, config in enumerate(self.configs(builder_class=builder_class)):
+            interface = ExecutionInterface(config)
+            register_func(interface, idx, num_experiments)
+            yield interface
@@ -1,19 +1,24 @@
-import distutils.sysconfig as sysconfig
+import ast
+import hashlib
 import itertools
+import json
 import re
 import sys
+import sysconfig
 import types
 
 import utils.fs as fs
+import utils.location as loc
 from utils.printer import *
 
 
-def _generate_stl_libs():
-    '''Generator for stl-names. Does a breadth-first search on the python installation directory. Adds built-in library names.
+def _walk_stl_libs(std_lib):
+    '''Does a breadth-first search on the python installation directory to find stl-names.
+    Args:
+        std_lib (str): Path to the standard library directory.
+
     Returns:
-        `set(str)` containing all known standard-library files.'''
-    ret_list = set()
-    std_lib = sysconfig.get_python_lib(standard_lib=True)
+        `set(str)` containing all standard-library modules found in `std_lib`.'''
     std_lib_len = len(std_lib)
 
     found = set()
@@ -23,26 +28,100 @@ def _generate_stl_libs():
     to_visit.append(std_lib)
     while any(to_visit):
         visit_now = to_visit.pop()
-        to_visit += list(fs.ls(visit_now, only_dirs=True, full_paths=True))
+        to_visit += list(x for x in fs.ls(visit_now, only_dirs=True, full_paths=True) if fs.basename(x) not in ('site-packages', 'dist-packages')) # Third-party libraries are no stl.
 
         files = list(fs.ls(visit_now, only_files=True, full_paths=True))
         found.update(set('.'.join(y[std_lib_len+1:].split(sep))[:-3] for y in files if y[-3:] == '.py' and y[-11:-3] != '__init__'))
         if any(True for x in files if x[-11:] == '__init__.py') and visit_now != std_lib: #If we found '/path/to/python_lib/oof/a/__init__.py', then assume library 'oof.a' exists.
             found.add('.'.join(visit_now[std_lib_len+1:].split(sep)))
-    found.update(set(sys.builtin_module_names))
     return found
 
 
+def _stl_cache_path(std_lib):
+    '''Returns path to the on-disk stl-names cache for the running interpreter. The name is keyed by interpreter version and standard library path.'''
+    key = hashlib.sha1('{}|{}|{}'.format(sys.executable, sys.version, std_lib).encode('utf-8')).hexdigest()[:16]
+    return fs.join(loc.cache_dir(), 'modulegenerator', 'stl_py{}{}_{}.json'.format(sys.version_info[0], sys.version_info[1], key))
+
+
+def _generate_stl_libs():
+    '''Generates stl-names. Uses `sys.stdlib_module_names` when available (Python 3.10+).
+    Otherwise, reads the names from an on-disk cache, and only walks the standard library directory when no cache exists yet.
+    Returns:
+        `frozenset(str)` containing all known standard-library module names. Built-in library names are included.'''
+    if hasattr(sys, 'stdlib_module_names'):
+        return frozenset(sys.stdlib_module_names).union(sys.builtin_module_names)
+
+    std_lib = sysconfig.get_paths()['stdlib']
+    cache_path = _stl_cache_path(std_lib)
+    if fs.isfile(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                return frozenset(json.load(f)).union(sys.builtin_module_names)
+        except (OSError, ValueError) as e:
+            printw('Could not read stl cache at "{}", regenerating: {}'.format(cache_path, e))
+
+    found = _walk_stl_libs(std_lib)
+    try:
+        fs.mkdir(fs.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump(sorted(found), f)
+    except OSError as e:
+        printw('Could not write stl cache to "{}": {}'.format(cache_path, e))
+    return frozenset(found).union(sys.builtin_module_names)
+
+
+_stl_modules = None
+
+def _get_stl_libs():
+    '''Returns the process-wide `frozenset(str)` of stl-names, computing it on first use.'''
+    global _stl_modules
+    if _stl_modules == None:
+        _stl_modules = _generate_stl_libs()
+    return _stl_modules
+
+
+_file_info_cache = dict()
+
+def _file_info(path):
+    '''Reads content hash and top-level import statements of a Python file. Results are memoized on (path, mtime, size), so unchanged files are never re-read.
+    Args:
+        path (str): Path to Python file.
+
+    Returns:
+        `(str, list(tuple))`: sha256 hexdigest of the file contents, and a list of found imports.
+                              Imports are formatted as `(level, module, names)`, with `level` the relative import level (0 for 'import x' statements),
+                              `module` the imported module name (or `None` for 'from . import x'), and `names` a tuple of imported names ('from x import y') or `None` ('import x').'''
+    stat = fs.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key in _file_info_cache:
+        return _file_info_cache[key]
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    imports = []
+    for node in ast.walk(ast.parse(content, filename=path)):
+        if isinstance(node, ast.Import):
+            imports += [(0, x.name, None) for x in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            imports.append((node.level, node.module, tuple(x.name for x in node.names)))
+    _file_info_cache[key] = (digest, imports)
+    return digest, imports
+
+
+_BUNDLE_FORMAT_VERSION = '2' # Change when the bundle layout changes, to invalidate cached bundles.
+
+
 class ModuleGenerator(object):
     '''Object to quickly construct self-contained modules, for use with remoto.
     Warning: We have several constraints for the input modules/files:
         1. When including a module X which internally imports module Y, Y is provided to the generator too. Failing to do so will produce a faulty module.
         2. When including a module X and a module Y, there are no name conflicts between X and Y.
         3. For all modules X, X does not have statements that import user-provided modules/files using import statements "import A as B", or "from A import a as b".
-        4. All uses of user-provided modules/files must be as if the user-provided modules.'''
+        4. All uses of user-provided modules/files must be as if the user-provided modules.
+    Use `generate_bundle` instead of `generate` to lift these constraints: It resolves dependencies automatically, and caches its output.'''
     def __init__(self):
         self._files = []
-        self._stl_modules_cache = []
 
     def with_module(self, module):
         if not isinstance(module, types.ModuleType):
@@ -69,9 +148,9 @@ class ModuleGenerator(object):
         return self
 
     def _is_regular_python(self, name):
-        if not self._stl_modules_cache:
-            self._stl_modules_cache = list(_generate_stl_libs())
-        return name in self._stl_modules_cache
+        '''Returns `True` if given module name (e.g. "os", "concurrent.futures") belongs to the standard library, `False` otherwise.'''
+        stl_modules = _get_stl_libs()
+        return name in stl_modules or name.split('.', 1)[0] in stl_modules
 
 
     def _read_imports(self, allowed_imports=None, silent=False):
@@ -160,4 +239,195 @@ class ModuleGenerator(object):
                 f.write('''
 ################################################################################
 
-''')
\ No newline at end of file
+''')
+
+
+    def _resolve_project_module(self, root, name):
+        '''Finds the file belonging to a module name inside the project rooted at `root`.
+        Returns:
+            `(str, bool)` with the path to the module file and whether the module is a package on success.
+            `(None, True)` if `name` is a directory without `__init__.py` (a namespace package). `(None, False)` if `name` is no project module.'''
+        base = fs.join(root, *name.split('.'))
+        if fs.isfile(base+'.py'):
+            return base+'.py', False
+        if fs.isfile(base, '__init__.py'):
+            return fs.join(base, '__init__.py'), True
+        if fs.isdir(base):
+            return None, True
+        return None, False
+
+
+    def _project_imports(self, root, path, name, is_package, allowed_set, silent):
+        '''Returns the set of project module names directly imported by the file at `path`, which is known as module `name`.
+        Warns about non-stl, non-project imports unless these are allowed or `silent` is set.'''
+        _, imports = _file_info(path)
+        package = name if is_package else name.rpartition('.')[0]
+        found = set()
+        for level, module, names in imports:
+            if level > 0: # Relative import: Resolve against the package of the importing module.
+                parts = package.split('.') if package else []
+                if level-1 > len(parts):
+                    raise ValueError('(file: {}) Relative import beyond top-level package.'.format(path))
+                base = '.'.join(parts[:len(parts)-(level-1)]+([module] if module else []))
+            else:
+                base = module
+            candidates = [base] if base else []
+            if names: # 'from x import y' may import submodule 'x.y'.
+                candidates += ['{}.{}'.format(base, x) if base else x for x in names if x != '*']
+            for candidate in candidates:
+                modpath, is_pkg = self._resolve_project_module(root, candidate)
+                if modpath or is_pkg:
+                    found.add(candidate)
+                elif candidate == base and level == 0 and not self._is_regular_python(candidate) and not (allowed_set and candidate in allowed_set) and not silent:
+                    printw('(file: {}) Found non-regular import "{}".'.format(path, candidate))
+        return found
+
+
+    def _resolve_bundle(self, root, allowed_set, silent):
+        '''Computes all project modules transitively required by the registered files.
+        Returns:
+            `list((str, str, bool))` of `(name, path, is_package)` tuples, in dependency order (dependencies first).
+            `path` is `None` for namespace packages without `__init__.py`.'''
+        entries = []
+        for x in self._files:
+            path = fs.abspath(x)
+            name = '.'.join(fs.split(path[len(root)+1:])) if path.startswith(root+fs.sep()) else fs.basename(path)
+            name = name[:-3] if name.endswith('.py') else name
+            is_package = name.endswith('.__init__')
+            entries.append((name[:-9] if is_package else name, path, is_package))
+
+        ordered = []
+        visited = set()
+        def visit(name, path, is_package):
+            if name in visited:
+                return
+            visited.add(name)
+            parent = name.rpartition('.')[0]
+            if parent: # Parent packages must exist before their children.
+                visit(parent, *self._resolve_project_module(root, parent))
+            if path:
+                for dependency in sorted(self._project_imports(root, path, name, is_package, allowed_set, silent)):
+                    visit(dependency, *self._resolve_project_module(root, dependency))
+            ordered.append((name, path, is_package))
+
+        entry_names = set(name for name, _, _ in entries)
+        for name, path, is_package in entries:
+            for dependency in sorted(self._project_imports(root, path, name, is_package, allowed_set, silent)):
+                if dependency not in entry_names:
+                    visit(dependency, *self._resolve_project_module(root, dependency))
+        return [x for x in ordered if x[0] not in entry_names], entries
+
+
+    def generate_bundle(self, outputpath, root=None, allowed_imports=None, silent=False):
+        '''Generates a self-contained module, to be used with Remoto remote module execution.
+        Unlike `generate`, this mode has no constraints on input files: All project modules imported by registered files are found automatically (transitively), using `ast`.
+        Found project modules are embedded in the output, and importable under their original names on load. They execute on first import. Registered files are appended as top-level code.
+        Import statements are kept as-is. Non-stl, non-project imports must be available on the remote.
+
+        Generated modules are cached in the cache directory, keyed by the content hashes of all input files.
+        When nothing changed since the last call, nothing is regenerated, and `outputpath` is not rewritten.
+        Args:
+            outputpath (str): Location to store module, including output filename. Creates every directory that does not exist.
+            root (optional str): Project root to resolve imports against. Defaults to the root of this project.
+            allowed_imports (optional iterable(str)): Non-stl, non-project imports that are known to exist on the remote. We do not warn about these.
+            silent (optional bool): If set, skips printing warnings when non-standard imports are encountered.
+
+        Returns:
+            `str` path to the generated module (i.e. `outputpath`).'''
+        root = fs.abspath(root if root else loc.root())
+        allowed_set = set(allowed_imports) if allowed_imports else None
+        dependencies, entries = self._resolve_bundle(root, allowed_set, silent)
+
+        hasher = hashlib.sha256(_BUNDLE_FORMAT_VERSION.encode('utf-8'))
+        for name, path, is_package in itertools.chain(dependencies, entries):
+            hasher.update('{}|{}|{}\n'.format(name, is_package, _file_info(path)[0] if path else '').encode('utf-8'))
+        key = hasher.hexdigest()
+        key_line = '# bundle-key: {}\n'.format(key)
+
+        if fs.isfile(outputpath):
+            with open(outputpath, 'r') as f:
+                if f.readline() == key_line:
+                    return outputpath # Up-to-date, nothing to do.
+
+        cache_path = fs.join(loc.cache_dir(), 'modulegenerator', 'bundle_{}.py'.format(key))
+        if not fs.isfile(cache_path):
+            fs.mkdir(fs.dirname(cache_path), exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(cache_path, fs.basename(outputpath))
+            with open(tmp_path, 'w') as f:
+                f.write(key_line)
+                f.write(self._bundle_content(dependencies, entries))
+            fs.mv(tmp_path, cache_path)
+
+        dest_dir = fs.dirname(outputpath)
+        if dest_dir and not fs.isdir(dest_dir):
+            fs.mkdir(dest_dir, exist_ok=True)
+        fs.cp(cache_path, outputpath)
+        return outputpath
+
+
+    def _bundle_content(self, dependencies, entries):
+        '''Builds the source of a bundle. See `generate_bundle`.'''
+        sources = []
+        for name, path, is_package in dependencies:
+            if path:
+                with open(path, 'r') as f:
+                    sources.append((name, is_package, f.read()))
+            else:
+                sources.append((name, is_package, ''))
+
+        content = '''
+################################################################################
+# Generated by the meta modulegenerator (bundle mode)
+# Bundled {} dependencies:
+{}
+# Processed {} files/modules:
+{}
+################################################################################
+
+import importlib.abc as _bundle_abc
+import importlib.util as _bundle_util
+import sys as _bundle_sys
+
+class _BundleFinder(_bundle_abc.MetaPathFinder, _bundle_abc.Loader):
+    \'\'\'Serves bundled modules to the import system. Modules execute on first import, like regular modules.
+    This way, packages may import their own submodules, and parents receive their child modules as attributes.\'\'\'
+    def __init__(self, sources):
+        self.sources = {{name: (is_package, source) for name, is_package, source in sources}}
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname not in self.sources:
+            return None
+        return _bundle_util.spec_from_loader(fullname, self, origin='<bundle:{{}}>'.format(fullname), is_package=self.sources[fullname][0])
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        _, source = self.sources[module.__name__]
+        module.__file__ = module.__spec__.origin
+        exec(compile(source, module.__file__, 'exec'), module.__dict__)
+
+def _bundle_install(sources):
+    \'\'\'Registers a finder for bundled modules. Bundled modules take precedence over installed modules with the same name.\'\'\'
+    _bundle_sys.meta_path.insert(0, _BundleFinder(sources))
+
+_bundle_install([
+{}
+])
+'''.format(
+            len(dependencies), '\n'.join('#    {}'.format(name) for name, _, _ in dependencies),
+            len(entries), '\n'.join('#    {}'.format(path) for _, path, _ in entries),
+            '\n'.join('    ({!r}, {!r}, {!r}),'.format(*x) for x in sources))
+
+        for _, path, _ in entries:
+            with open(path, 'r') as f:
+                content += '''
+################################################################################
+# Created from file {}
+'''.format(path)
+                content += f.read()
+                content += '''
+################################################################################
+
+'''
+        return content
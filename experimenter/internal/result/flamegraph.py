@@ -0,0 +1,151 @@
+import csv
+from html import escape
+import re
+
+
+def fold_perf_script(lines):
+    '''Folds `perf script` output into stack counts.
+    Args:
+        lines (iterable(str)): Lines of `perf script` output. Samples are separated by empty lines. The first line of a sample holds the command name, next lines hold frames (innermost first).
+
+    Returns:
+        `dict(str, int)`, mapping folded stacks (`comm;outermost;...;innermost`) to their sample counts.'''
+    folded = dict()
+    comm, frames = None, []
+    def _flush():
+        if comm != None:
+            stack = ';'.join([comm]+list(reversed(frames)))
+            folded[stack] = folded.get(stack, 0) + 1
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.strip():
+            _flush()
+            comm, frames = None, []
+        elif line[0].isspace():
+            parts = line.strip().split(None, 1) # '<address> <symbol>+<offset> (<dso>)'
+            symbol = parts[1] if len(parts) > 1 else parts[0]
+            symbol = re.sub(r'\s+\([^)]*\)$', '', symbol) # Strip dso.
+            symbol = re.sub(r'\+0x[0-9a-f]+$', '', symbol) # Strip offset.
+            if symbol == '[unknown]':
+                dso = re.search(r'\(([^)]*)\)$', line.strip())
+                symbol = '[unknown] ({})'.format(dso.group(1).rsplit('/', 1)[-1]) if dso else symbol
+            frames.append(symbol.replace(';', ':'))
+        elif comm == None:
+            comm = line.strip().split(None, 1)[0].replace(';', ':') # Thread names containing whitespace are cut off.
+    _flush()
+    return folded
+
+
+def read_folded(path):
+    '''Reads a folded stacks file (`stack count` lines) into a `dict(str, int)`.'''
+    folded = dict()
+    with open(path, 'r') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                folded[stack] = folded.get(stack, 0) + int(count)
+    return folded
+
+
+def write_folded(path, folded):
+    '''Writes folded stacks, sorted by stack name (as expected by other flamegraph tools).'''
+    with open(path, 'w') as f:
+        for stack in sorted(folded):
+            f.write('{} {}\n'.format(stack, folded[stack]))
+
+
+def top_symbols(folded, limit=None):
+    '''Computes per-symbol sample counts.
+    Args:
+        folded (dict(str, int)): Folded stacks.
+        limit (optional int): If set, returns only this many symbols, with most self samples.
+
+    Returns:
+        `list((str, int, float, int, float))` of `(symbol, self samples, self percentage, total samples, total percentage)`, sorted by self samples.
+        Self samples count samples in which the symbol is the innermost frame. Total samples count samples in which the symbol occurs anywhere in the stack.'''
+    total = sum(folded.values())
+    self_counts, total_counts = dict(), dict()
+    for stack, count in folded.items():
+        frames = stack.split(';')[1:] # First element is the command name.
+        if not frames:
+            continue
+        self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+        for frame in set(frames):
+            total_counts[frame] = total_counts.get(frame, 0) + count
+    ordered = sorted(total_counts, key=lambda x: (-self_counts.get(x, 0), -total_counts[x], x))
+    if limit != None:
+        ordered = ordered[:limit]
+    pct = lambda x: 100.0*x/total if total else 0.0
+    return [(x, self_counts.get(x, 0), pct(self_counts.get(x, 0)), total_counts[x], pct(total_counts[x])) for x in ordered]
+
+
+def write_top_symbols(path, rows, key_columns=()):
+    '''Writes `top_symbols` output as CSV.
+    Args:
+        path (str): Output path.
+        rows (list(tuple)): Rows as produced by `top_symbols`, optionally prefixed by values for `key_columns`.
+        key_columns (optional iterable(str)): Names of leading key columns (e.g. the node a row belongs to).'''
+    key_columns = list(key_columns)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(key_columns+['symbol', 'self_samples', 'self_percent', 'total_samples', 'total_percent'])
+        for row in rows:
+            keys, (symbol, self_samples, self_pct, total_samples, total_pct) = row[:len(key_columns)], row[len(key_columns):]
+            writer.writerow(list(keys)+[symbol, self_samples, '{:.2f}'.format(self_pct), total_samples, '{:.2f}'.format(total_pct)])
+
+
+def _build_tree(folded):
+    tree = {'count': 0, 'children': dict()}
+    for stack, count in folded.items():
+        node = tree
+        node['count'] += count
+        for frame in stack.split(';'):
+            node = node['children'].setdefault(frame, {'count': 0, 'children': dict()})
+            node['count'] += count
+    return tree
+
+
+def _color(name):
+    '''Deterministic warm color per frame name, like classic flamegraphs.'''
+    value = sum(ord(x) for x in name)
+    return 'rgb({},{},{})'.format(205+value % 50, 80+(value*7) % 150, 30+(value*13) % 50)
+
+
+def flamegraph_svg(folded, title='Flame Graph', width=1200, frame_height=16, min_width=0.5):
+    '''Renders folded stacks as a static SVG flamegraph (root at the bottom). Hovering a frame shows its name and sample count.
+    Args:
+        folded (dict(str, int)): Folded stacks.
+        title (optional str): Title to render.
+        width (optional int): Image width in pixels.
+        frame_height (optional int): Height of a frame in pixels.
+        min_width (optional float): Frames narrower than this many pixels are omitted.
+
+    Returns:
+        `str` containing the SVG document.'''
+    tree = _build_tree(folded)
+    total = tree['count']
+    rects = []
+    def _depth(node):
+        return 1+max((_depth(x) for x in node['children'].values()), default=0)
+    max_depth = _depth(tree)
+    height = (max_depth+2)*frame_height
+    def _walk(name, node, x, depth):
+        frame_width = width*node['count']/total if total else 0
+        if frame_width < min_width:
+            return
+        y = height-(depth+1)*frame_height
+        label = '{} ({} samples, {:.2f}%)'.format(name, node['count'], 100.0*node['count']/total)
+        text = name if len(name)*7 < frame_width else (name[:int(frame_width/7)-2]+'..' if frame_width > 28 else '')
+        rects.append('<g><title>{}</title><rect x="{:.2f}" y="{}" width="{:.2f}" height="{}" fill="{}" rx="2"/><text x="{:.2f}" y="{}">{}</text></g>'.format(
+            escape(label), x, y, frame_width, frame_height-1, _color(name), x+3, y+frame_height-4, escape(text)))
+        for child_name in sorted(node['children']):
+            child = node['children'][child_name]
+            _walk(child_name, child, x, depth+1)
+            x += width*child['count']/total
+    _walk('all', tree, 0.0, 0)
+    return '\n'.join([
+        '<?xml version="1.0" standalone="no"?>',
+        '<svg version="1.1" width="{0}" height="{1}" viewBox="0 0 {0} {1}" xmlns="http://www.w3.org/2000/svg" font-family="Verdana" font-size="11">'.format(width, height),
+        '<text x="{}" y="{}" text-anchor="middle" font-size="15">{}</text>'.format(width/2, frame_height, escape(title)),
+        *rects,
+        '</svg>'])
@@ -0,0 +1,78 @@
+import math
+import re
+
+
+_warmup_marker = re.compile(r'^#.*\bwarmup=([0-9]+)')
+
+
+def parse_result_lines(lines, skip_leading=0):
+    '''Parses result lines (`init_ns,comp_ns`) into total run times in nanoseconds.
+    Args:
+        lines (iterable(str)): Result lines. Empty lines, comment lines (starting with '#') and lines that cannot be parsed (e.g. partially written) are ignored.
+                               Comment lines like `# attempt 2 warmup=1` (see `attempt_marker`) tag the given amount of following runs as warm-up runs, which are ignored as well.
+        skip_leading (optional int): Amount of leading runs to skip (warm-up runs).
+
+    Returns:
+        `list(int)` of run times, in order.'''
+    values = []
+    warmup = 0
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#'):
+            found = _warmup_marker.match(line)
+            if found:
+                warmup = int(found.group(1))
+            continue
+        try:
+            value = sum(int(x) for x in line.split(','))
+        except ValueError:
+            continue
+        if warmup > 0:
+            warmup -= 1
+            continue
+        values.append(value)
+    return values[skip_leading:]
+
+
+def attempt_marker(attempt, warmup):
+    '''Returns the comment line marking the start of an application attempt in a result file. The first `warmup` runs after this line are warm-up runs of the new attempt.'''
+    return '# attempt {} warmup={}'.format(attempt, warmup)
+
+
+def _binom_cdf_half(k, n):
+    '''Returns P(X <= k) for X ~ Binomial(n, 0.5).'''
+    return sum(math.comb(n, i) for i in range(k+1)) / 2**n
+
+
+def median_ci(values, confidence=0.95):
+    '''Computes a distribution-free confidence interval for the median, using order statistics.
+    The interval is `[x_(j), x_(n-j+1)]` (1-based ranks in sorted order), with `j` the largest rank such that the interval covers the median with at least `confidence` probability.
+    Args:
+        values (list(number)): Measurements.
+        confidence (optional float): Required coverage probability.
+
+    Returns:
+        `(median, low, high)`. `low` and `high` are `None` when there are too few values to reach the required confidence (e.g. fewer than 6 values for 95%).'''
+    ordered = sorted(values)
+    n = len(ordered)
+    if n == 0:
+        return None, None, None
+    median = (ordered[(n-1)//2]+ordered[n//2])/2
+    alpha = 1.0-confidence
+    rank = 0
+    for j in range(1, n//2+1):
+        if 2*_binom_cdf_half(j-1, n) <= alpha:
+            rank = j
+        else:
+            break
+    if rank == 0:
+        return median, None, None
+    return median, ordered[rank-1], ordered[n-rank]
+
+
+def median_rel_error(values, confidence=0.95):
+    '''Returns the confidence interval half-width of the median, relative to the median. Returns `None` when the interval cannot be computed yet.'''
+    median, low, high = median_ci(values, confidence=confidence)
+    if low == None or not median:
+        return None
+    return (high-low)/2/abs(median)
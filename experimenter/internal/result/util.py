@@ -1,7 +1,11 @@
 import remoto
 import concurrent.futures
+import json
+import shlex
+import time
 
 from experimenter.internal.experiment.blocker import BlockState
+import experimenter.internal.result.stats as stats
 
 
 def remote_file_find(spark_connectionwrappers, file):
@@ -22,6 +26,54 @@ def remote_file_find(spark_connectionwrappers, file):
     return BlockState.BUSY, -1
 
 
+def remote_master_status(master_connection, port):
+    '''Fetches the status of a Spark standalone master from its JSON endpoint (`http://<master>:<port>/json/`), on the master node itself.
+    Returns:
+        `dict` with the master status (containing e.g. 'workers', 'activedrivers', 'completeddrivers'), or `None` if the endpoint could not be reached.'''
+    out, err, exitcode = remoto.process.check(master_connection, 'curl -s --max-time 5 http://localhost:{}/json/'.format(port), shell=True)
+    if exitcode != 0:
+        return None
+    try:
+        return json.loads('\n'.join(out))
+    except ValueError:
+        return None
+
+
+def remote_driver_find(master_connection, spark_nodes, port, ignore=None, completed=False):
+    '''Finds the node running the driver of an application submitted in cluster deploy mode, using the Spark standalone master status (see `remote_master_status`).
+    We pick the most recently started driver, and map its worker to a node by host.
+    Args:
+        master_connection (remoto.Connection): Connection to the Spark master node.
+        spark_nodes (list(metareserve.Node)): Nodes Spark runs on.
+        port (int): Port of the Spark master web UI.
+        ignore (optional set(str)): Driver ids to ignore, e.g. drivers known before submission.
+        completed (optional bool): If set, also considers completed drivers.
+
+    Returns:
+        (BlockState, id). `BlockState.COMPLETE` is issued when we found the driver, with id the id of the node running it.
+                          `BlockState.BUSY` is returned when no (new) driver is scheduled on a worker yet (including drivers with worker 'None'), and the id returned is -1.
+                          `BlockState.FAILED` is returned when the master status is unavailable, or the worker host matches no node, and the id returned is -1.'''
+    status = remote_master_status(master_connection, port)
+    if status == None:
+        return BlockState.FAILED, -1
+    drivers = status.get('activedrivers', []) + (status.get('completeddrivers', []) if completed else [])
+    drivers = [x for x in drivers if x.get('worker') not in (None, '', 'None') and not (ignore and x.get('id') in ignore)] # Spark reports worker 'None' for drivers waiting to be scheduled.
+    if not any(drivers):
+        return BlockState.BUSY, -1
+    worker_id = max(drivers, key=lambda x: x.get('starttime', 0))['worker']
+    host = next((x.get('host') for x in status.get('workers', []) if x.get('id') == worker_id), None)
+    node = next((x for x in spark_nodes if host in (x.ip_local, x.ip_public, (x.extra_info or dict()).get('hostname'))), None) if host else None
+    if node == None:
+        return BlockState.FAILED, -1
+    return BlockState.COMPLETE, node.node_id
+
+
+def remote_count_runs(connection, file):
+    '''Counts result lines (excluding comment lines) of a file on a remote node. Returns 0 if the file does not exist.'''
+    out, err, exitcode = remoto.process.check(connection, 'grep -vc \'^#\' {} 2>/dev/null'.format(file), shell=True)
+    return int(out[0]) if any(out) and out[0].strip().isdigit() else 0
+
+
 def remote_count_lines(connection, file, needed_lines, silent):
     '''Method to count lines on a file on a remote node.
     Args:
@@ -33,10 +85,93 @@ def remote_count_lines(connection, file, needed_lines, silent):
     Returns:
         (BlockState, id). Returns `BlockState.COMPLETE` when the file contained enough lines, along with the number of lines.
                           Returns `BlockState.BUSY` when the file did not contain enough lines, along with the number of lines.'''
-    out, err, exitcode = remoto.process.check(connection, 'cat {}'.format(file), shell=True)
-    num_lines = len(out)
+    num_lines = remote_count_runs(connection, file)
     if not silent:
         print('Found {}/{} lines'.format(num_lines, needed_lines))
     if num_lines >= needed_lines:
         return BlockState.COMPLETE, num_lines
-    return BlockState.BUSY, num_lines
\ No newline at end of file
+    return BlockState.BUSY, num_lines
+
+
+def remote_check_convergence(connection, file, min_runs, max_runs, rel_error, confidence, skip_leading, silent):
+    '''Method to check whether measurements in a file on a remote node have converged.
+    Measurements have converged when the confidence interval half-width of the median run time, relative to the median, is at most `rel_error`.
+    Args:
+        connection (remoto.Connection): Connection to remote.
+        file (str): Filepath to read lines from.
+        min_runs (int): Minimal number of measurements (excluding skipped leading runs) before we consider convergence.
+        max_runs (int): Number of lines after which we return a `BlockState.COMPLETE`, converged or not.
+        rel_error (float): Maximal relative confidence interval half-width.
+        confidence (float): Confidence level of the interval.
+        skip_leading (int): Number of leading (warm-up) lines to exclude from the convergence check.
+        silent (bool): If set, we don't print. Otherwise, we print the amount of found lines and the current relative error.
+
+    Returns:
+        (BlockState, num_lines, relative error). Returns `BlockState.COMPLETE` when measurements converged or the file contained `max_runs` lines, along with the number of lines and the relative error (`None` if not computable yet).
+                                                 Returns `BlockState.BUSY` otherwise.'''
+    out, err, exitcode = remoto.process.check(connection, 'cat {}'.format(file), shell=True)
+    num_lines = sum(1 for x in out if x.strip() and not x.startswith('#'))
+    values = stats.parse_result_lines(out, skip_leading=skip_leading)
+    current = stats.median_rel_error(values, confidence=confidence)
+    if not silent:
+        print('Found {}/{} lines (relative error: {}, target: {:.2%})'.format(num_lines, max_runs, '{:.2%}'.format(current) if current != None else 'n/a', rel_error))
+    if num_lines >= max_runs:
+        return BlockState.COMPLETE, num_lines, current
+    if len(values) >= min_runs and current != None and current <= rel_error:
+        return BlockState.COMPLETE, num_lines, current
+    return BlockState.BUSY, num_lines, current
+
+
+def remote_driver_status(connection, marker, pattern, log_globs, error_patterns, context_lines):
+    '''Checks whether the driver process is alive, and scans driver logs for errors.
+    Args:
+        connection (remoto.Connection): Connection to the node running the driver.
+        marker (str): Remote file created right before submission. Only logs modified after this file are scanned, so errors of earlier executions are ignored.
+        pattern (str): `pgrep -f` pattern matching the driver process.
+        log_globs (list(str)): Remote path globs of driver logs.
+        error_patterns (list(str)): Extended regexes marking fatal errors.
+        context_lines (int): Amount of log lines to include after the first error.
+
+    Returns:
+        `(bool, list(str))`: Whether the driver process is alive, and an excerpt of logged errors (empty when no errors were found).'''
+    cmd = 'pgrep -f \'{}\' > /dev/null && echo alive || echo dead'.format(pattern)
+    if any(log_globs) and any(error_patterns):
+        cmd += '; for f in {globs}; do [ -f "$f" ] && [ "$f" -nt {marker} ] && grep -E -m 1 -B 2 -A {ctx} -e {regex} "$f" | sed "s|^|$f: |"; done'.format(
+            globs=' '.join(log_globs), marker=marker, ctx=context_lines, regex=shlex.quote('|'.join('({})'.format(x) for x in error_patterns)))
+    out, err, exitcode = remoto.process.check(connection, cmd, shell=True)
+    return any(out) and out[0].strip() == 'alive', out[1:]
+
+
+def remote_log_tail(connection, marker, log_globs, num_lines):
+    '''Returns the last `num_lines` lines of every driver log modified after `marker`, as `list(str)`. See `remote_driver_status`.'''
+    if not any(log_globs):
+        return []
+    cmd = 'for f in {globs}; do [ -f "$f" ] && [ "$f" -nt {marker} ] && tail -n {num} "$f" | sed "s|^|$f: |"; done'.format(globs=' '.join(log_globs), marker=marker, num=num_lines)
+    out, err, exitcode = remoto.process.check(connection, cmd, shell=True)
+    return out
+
+
+def remote_watch_driver(check, check_args, connection, marker, pattern, log_globs, error_patterns, context_lines, grace_until):
+    '''Checks progress of an application using `check`, and fails fast when its driver crashed.
+    The driver has crashed when its logs contain errors, or when its process exited (after `grace_until`) before `check` completed.
+    Args:
+        check (function): Progress check, e.g. `remote_count_lines` or `remote_check_convergence`. Must return a `BlockState`, followed by its values.
+        check_args (tuple): Arguments for `check`.
+        grace_until (float): Timestamp (as `time.time()`) before which a missing driver process is not considered a crash, e.g. because the driver is still being scheduled.
+        See `remote_driver_status` for the other arguments.
+
+    Returns:
+        (BlockState, *values of check, excerpt). Returns the state and values of `check` with excerpt `None`, unless the driver crashed.
+                                                 In that case, returns `BlockState.FAILED` with the logged errors (or the tail of the driver logs) as excerpt.'''
+    state, *vals = check(*check_args)
+    if state == BlockState.COMPLETE:
+        return (state, *vals, None)
+    alive, excerpt = remote_driver_status(connection, marker, pattern, log_globs, error_patterns, context_lines)
+    if any(excerpt):
+        return (BlockState.FAILED, *vals, excerpt)
+    if alive or time.time() < grace_until:
+        return (state, *vals, None)
+    state, *vals = check(*check_args) # The driver may have completed between both checks.
+    if state == BlockState.COMPLETE:
+        return (state, *vals, None)
+    return (BlockState.FAILED, *vals, remote_log_tail(connection, marker, log_globs, context_lines))
@@ -0,0 +1,48 @@
+import argparse
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Appends main project root as importpath.
+
+from utils.printer import *
+
+import graph_generator.internal.util.regression as regression
+import graph_generator.internal.util.store as store
+from graph_generator.internal.util.warmup import parse_skip_leading
+
+
+'''Python CLI module to detect performance regressions between two result campaigns.'''
+
+
+def add_args(parser):
+    parser.add_argument('baseline', help='Result directory of the baseline campaign.')
+    parser.add_argument('candidate', help='Result directory of the candidate campaign.')
+    parser.add_argument('--store', metavar='path', type=str, default=store.default_path(), help='Results store to use (default={}).'.format(store.default_path()))
+    parser.add_argument('--no-ingest', dest='no_ingest', help='Do not (re-)ingest both campaign directories into the store before comparing.', action='store_true')
+    parser.add_argument('--threshold', metavar='fraction', type=float, default=0.05, help='Minimal relative change of median run time to flag as regression or improvement (default=0.05).')
+    parser.add_argument('--alpha', metavar='level', type=float, default=0.05, help='Significance level of the Mann-Whitney U tests, after Holm-Bonferroni adjustment (default=0.05).')
+    parser.add_argument('--min-runs', metavar='amount', dest='min_runs', type=int, default=5, help='Configurations with fewer runs in either campaign are reported, but not tested (default=5).')
+    parser.add_argument('--skip-leading', metavar='int|auto', dest='skip_leading', type=parse_skip_leading, default=0, help='If set, skips first n runs of every result file. If "auto", detects warm-up runs per result file (MSER-5) and skips them.')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='compare',
+        formatter_class=argparse.RawTextHelpFormatter,
+        description='Compare two result campaigns, matching configurations by fingerprint. Exits with a non-zero status when regressions are found.'
+    )
+    add_args(parser)
+    args = parser.parse_args()
+
+    if not args.no_ingest:
+        store.ingest([args.baseline, args.candidate], store_path=args.store)
+    rows, only_baseline, only_candidate = regression.compare(args.baseline, args.candidate, store_path=args.store, skip_leading=args.skip_leading, threshold=args.threshold, alpha=args.alpha, min_runs=args.min_runs)
+    if not any(rows):
+        printe('No configurations measured in both campaigns. Only result files with configuration sidecars (".config.json") can be matched.')
+        exit(1)
+    exit(0 if regression.report(rows, only_baseline, only_candidate, threshold=args.threshold, alpha=args.alpha) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,8 @@ import utils.location as loc
 from utils.printer import *
 
 import graph_generator.internal.generator as generator
+from graph_generator.internal.util.warmup import parse_skip_leading
+import graph_generator.internal.util.store as store
 
 
 '''Python CLI module to generate data.'''
@@ -23,13 +25,17 @@ def _default_generator():
 
 
 def add_args(parser):
-    parser.add_argument('paths', nargs='+', help='Result path(s) to read from. Searches recursively for all files in given directory.')
+    parser.add_argument('paths', nargs='*', help='Result path(s) to read from. Searches recursively for all files in given directory. When reading from a store, only used with "--ingest".')
     parser.add_argument('--interpret-path', dest='interpret_path', metavar='path', type=str, default=None, help='If set, uses given file as interpret file. This file is always considered last.')
     parser.add_argument('--generator', metavar='name', type=str, default=_default_generator(), help='Graph generator to execute (default={}).'.format(_default_generator()))
     parser.add_argument('--dest',  metavar='path', nargs='?', type=str, default=None, const='default.pdf', help='If set, outputs plot to given output path, prefixed with={}. Point to a file, with an extension. If set without value, uses val={}'.format(loc.graph_generator_dir(), 'default.pdf'))
     parser.add_argument('--no-show', dest='no_show', help='Do not show generated graph (useful on servers without xorg forwarding).', action='store_true')
     parser.add_argument('--large', help='If set, generates graphs with larger font.', action='store_true')
-    parser.add_argument('--skip-leading', metavar='int', dest='skip_leading', type=int, default=0, help='If set, skips first n readings from every result frame. Supports negative numbers, which mean: Read the last abs(negative_number) values.')
+    parser.add_argument('--skip-leading', metavar='int|auto', dest='skip_leading', type=parse_skip_leading, default=0, help='If set, skips first n readings from every result frame. Supports negative numbers, which mean: Read the last abs(negative_number) values. If "auto", detects warm-up runs per frame (MSER-5) and skips them.')
+    parser.add_argument('--store', metavar='path', nargs='?', type=str, default=None, const=store.default_path(), help='If set, reads results from given SQLite results store instead of reading result files. If set without value, uses val={}'.format(store.default_path()))
+    parser.add_argument('--ingest', help='If set, ingests result files from given paths into the store before reading (unchanged files are skipped).', action='store_true')
+    parser.add_argument('--where', metavar='filter', type=str, nargs='+', default=[], help='Store filters, e.g. "stripe=128" "link_multiplier>=16" "mode!=--spark-only". Supported operators: =, !=, <, <=, >, >=.')
+    parser.add_argument('--group-by', metavar='name', dest='group_by', type=str, nargs='+', default=None, help='Store parameters to group results by. Runs of results in the same group are merged into one frame.')
     parser.add_argument('--extra-args', metavar='arg', dest='extra_args', type=str, nargs='+', default='', help='Extra args to pass to generator.')
     parser.add_argument('--extra-kwargs', metavar='kwarg', dest='extra_kwargs', type=str, nargs='+', default='', help='Extra kwargs to pass to generator.')
 
@@ -43,9 +49,13 @@ def main():
     add_args(parser)
 
     args = parser.parse_args()
+    if args.ingest and not args.store:
+        args.store = store.default_path()
+    if not (args.paths or args.store):
+        parser.error('Provide result path(s) to read from, or a store using "--store".')
     extra_args = list(args.extra_args.split())
     extra_kwargs = {x.split('=') for x in args.extra_kwargs.split()}
-    retval = generator.generate(args.generator, args.paths, interpret_path=args.interpret_path, dest=args.dest, show=not args.no_show, large=args.large, skip_leading=args.skip_leading, args=extra_args, kwargs=extra_kwargs)[0]
+    retval = generator.generate(args.generator, args.paths, interpret_path=args.interpret_path, dest=args.dest, show=not args.no_show, large=args.large, skip_leading=args.skip_leading, args=extra_args, kwargs=extra_kwargs, store_path=args.store, ingest=args.ingest, filters=[store.parse_filter(x) for x in args.where], group_by=args.group_by)[0]
 
     if isinstance(retval, bool):
         exit(0 if retval else 1)
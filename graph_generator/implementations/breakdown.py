@@ -0,0 +1,104 @@
+import json
+import os
+import re
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from graph_generator.interface import GeneratorInterface
+import graph_generator.internal.util.storer as storer
+
+
+def get_generator(*args, **kwargs):
+    return BreakdownPlot(*args, **kwargs)
+
+
+def _breakdown_path(path):
+    return path+'.breakdown.json'
+
+
+class BreakdownPlot(GeneratorInterface):
+    '''Draws backend execution time composition charts from `<result_file>.breakdown.json` files, written by the experimenter's breakdown collection.
+    Every result file with a breakdown becomes one horizontal bar, split into stages.
+    Kwargs:
+        metric (optional str): Stage statistic to plot: 'share' (default, percentage of total), 'total_ms' or 'mean_ms'.'''
+    def __init__(self, *args, metric='share', **kwargs):
+        self.metric = metric
+
+
+    def filter(self, path):
+        return super(BreakdownPlot, self).filter(path) and os.path.isfile(_breakdown_path(path))
+
+
+    def to_identifiers(self, path):
+        identifiers = dict()
+        if path.endswith('.res_a'):
+            identifiers['producer'] = 'arrow'
+        elif path.endswith('.res_s'):
+            identifiers['producer'] = 'spark'
+        identifiers['breakdown'] = _breakdown_path(path)
+        batchsize_found = re.search(r'(?:bs|batchsize)_?([0-9]+)', path)
+        if batchsize_found:
+            identifiers['batchsize'] = int(batchsize_found.group(1))
+        identifiers['label'] = '{} ({})'.format(os.path.basename(os.path.dirname(path)), identifiers.get('producer', '?'))
+        return identifiers
+
+
+    def sorting(self, frame):
+        return (frame.identifiers.get('batchsize', 0), frame.identifiers['label'])
+
+
+    def plot(self, frames, dest=None, show=True, large=False):
+        frames = list(frames)
+        sort_func = frames[0].sort_func if any(frames) else self.sorting
+        breakdowns = []
+        for frame in sorted(frames, key=sort_func):
+            with open(frame.identifiers['breakdown'], 'r') as f:
+                breakdowns.append((str(frame), json.load(f)))
+        if not any(breakdowns):
+            print('No result files with breakdowns found.')
+            return None
+
+        stages = []
+        for _, breakdown in breakdowns:
+            stages += [x for x in breakdown['order'] if not x in stages]
+        values = np.array([[breakdown['stages'].get(stage, {}).get(self.metric, 0.0) for stage in stages] for _, breakdown in breakdowns])
+        if self.metric == 'share':
+            values = values*100
+
+        if large:
+            fontsize = 28
+            font = {
+                'family' : 'DejaVu Sans',
+                'size'   : fontsize
+            }
+            plt.rc('font', **font)
+
+        fig, ax = plt.subplots()
+        colormap = plt.get_cmap('viridis')
+        positions = np.arange(len(breakdowns))
+        left = np.zeros(len(breakdowns))
+        for idx, stage in enumerate(stages):
+            ax.barh(positions, values[:, idx], left=left, label=stage, color=colormap(idx/max(len(stages)-1, 1)), edgecolor='white')
+            left += values[:, idx]
+
+        ax.set_yticks(positions)
+        ax.set_yticklabels([label for label, _ in breakdowns])
+        ax.invert_yaxis()
+        xlabels = {'share': 'Share of backend time (%)', 'total_ms': 'Total time (ms)', 'mean_ms': 'Mean time per request (ms)'}
+        ax.set(xlabel=xlabels.get(self.metric, self.metric), title='Backend Execution Time Composition')
+        ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.12), ncol=4, frameon=False, fontsize=18 if large else None)
+
+        if large:
+            fig.set_size_inches(16, 8)
+        fig.tight_layout()
+
+        if dest:
+           storer.store_simple(dest, plt)
+
+        if large:
+            plt.rcdefaults()
+
+        if show:
+            plt.show()
+        return dest
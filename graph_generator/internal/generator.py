@@ -7,6 +7,7 @@ from utils.printer import *
 
 from graph_generator.interface import GeneratorInterface
 from graph_generator.internal.util.reader import read
+import graph_generator.internal.util.store as store
 from graph_generator.internal.interpreter import Interpreter
 
 def _import_module(generator_name):
@@ -17,7 +18,7 @@ def _import_module(generator_name):
     return importer.import_full_path(fs.join(loc.graph_generator_dir(), generator_name))
 
 
-def generate(generator_name, paths, interpret_path=None, dest=None, show=True, large=False, skip_leading=0, args=None, kwargs=None):
+def generate(generator_name, paths, interpret_path=None, dest=None, show=True, large=False, skip_leading=0, args=None, kwargs=None, store_path=None, ingest=False, filters=None, group_by=None):
     '''Generates requested `data_format`, using requested `generator_name`.
     Args:
         generator_name (str): Name of generator. Must be present in `data_generator/implementations/`. A `.py` extension does not have to be specified.
@@ -26,9 +27,13 @@ def generate(generator_name, paths, interpret_path=None, dest=None, show=True, l
         dest (optional str): If set, stores generated graph to given output path.
         show (optional bool): If set, shows graph. Otherwise, does not show anything.
         large (optional bool): If set, generates graph with larger font.
-        skip_leading (optional int): If set, skips first n readings from every result frame. Supports negative numbers, which mean: Read the last abs(negative_number) values.
+        skip_leading (optional int): If set, skips first n readings from every result frame. Supports negative numbers, which mean: Read the last abs(negative_number) values. If 'auto', detects and skips warm-up runs per frame.
         args (optional list(str)): Extra arguments to pass to generator function.
-        kwargs (optional dict(str, str): Extra keyword arguments to pass to generator function.'''
+        kwargs (optional dict(str, str): Extra keyword arguments to pass to generator function.
+        store_path (optional str): If set, reads frames from this results store (see `store.py`) instead of reading result files from `paths`.
+        ingest (optional bool): If set (and `store_path` is set), ingests result files from `paths` into the store first.
+        filters (optional list((str, str, Any))): Store filters, as produced by `store.parse_filter`. Only used when reading from a store.
+        group_by (optional list(str)): Parameters to group store results by. Only used when reading from a store.'''
 
     module = _import_module(generator_name)
     if not module:
@@ -43,9 +48,16 @@ def generate(generator_name, paths, interpret_path=None, dest=None, show=True, l
     fs.mkdir(fs.dirname(loc.graph_generation_dir()), exist_ok=True)
 
     frames = []
-    for path in paths:
-        interpreter = Interpreter(path, generator.filter, generator.to_identifiers, generator.sorting, interpret_path=interpret_path, debug=True)
-        frames.append(read(path, interpreter, skip_leading=skip_leading))
+    if store_path:
+        if ingest:
+            store.ingest(paths, store_path=store_path, interpret_path=interpret_path)
+        stored = store.query(store_path=store_path, filters=filters, group_by=group_by, skip_leading=skip_leading, sort_func=generator.sorting, to_identifiers=generator.to_identifiers, filter_func=generator.filter)
+        frames.append(stored)
+        print('Queried {} frames from store: {}'.format(len(stored), store_path))
+    else:
+        for path in paths:
+            interpreter = Interpreter(path, generator.filter, generator.to_identifiers, generator.sorting, interpret_path=interpret_path, debug=True)
+            frames.append(read(path, interpreter, skip_leading=skip_leading))
     outputgraph_path = generator.plot(itertools.chain(*frames), dest=dest, show=show, large=large)
 
     return True, (outputgraph_path if dest else None)
\ No newline at end of file
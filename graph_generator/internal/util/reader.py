@@ -1,12 +1,42 @@
 import concurrent.futures
 from multiprocessing import cpu_count
+import re
 
 import numpy as np
 
+from graph_generator.internal.util.warmup import mser_truncation
 import utils.fs as fs
 from utils.printer import *
 
 
+_warmup_marker = re.compile(r'^#.*\bwarmup=([0-9]+)')
+
+
+def data_lines(lines):
+    '''Filters result lines, keeping only data lines. Removes empty lines and comment lines (starting with '#').
+    Comment lines like `# attempt 2 warmup=1`, written by the experimenter when resuming runs after a crash, mark the given amount of following data lines as warm-up runs of the resumed attempt. These are removed as well.
+    Args:
+        lines (iterable(str)): Lines of a result file.
+
+    Returns:
+        `list(str)` of data lines.'''
+    kept = []
+    warmup = 0
+    for line in lines:
+        if line.startswith('#'):
+            found = _warmup_marker.match(line)
+            if found:
+                warmup = int(found.group(1))
+            continue
+        if not line.strip():
+            continue
+        if warmup > 0:
+            warmup -= 1
+            continue
+        kept.append(line)
+    return kept
+
+
 def walk(path):
     '''Performs a depth-first search walk over the filesystem. We assume no recursion through symlinks is possible, and that all files are relevant.
     Args:
@@ -33,7 +63,7 @@ def read(paths, interpreter, skip_leading=0):
     Args:
         paths (str,iterable(str)): Path or paths to search for files.
         interpreter (Interpreter): Interpreter instance to provide `filter`, `to_identifiers` and `sorting` functionality.
-        skip_leading (optional int): If set, skips reading the set number of lines. Supports negative numbers, which mean: Read the last abs(negative_number) values.
+        skip_leading (optional int or str): If set, skips reading the set number of lines. Supports negative numbers, which mean: Read the last abs(negative_number) values. If 'auto', detects and skips warm-up runs per frame (see `Frame`).
 
     Returns:
         `iterable(Frame)`: An iterable of frames containing the data from a file.'''
@@ -62,23 +92,46 @@ class Frame(object):
     '''Creates a new frame.
     Args:
         lines (list(str)): Read datalines. Assumes no trailing '\n'.
-        skip_leading (optional int): If set, skips reading the set number of lines. Supports negative numbers, which mean: Read the last abs(negative_number) values.
+        skip_leading (optional int or str): If set, skips reading the set number of lines. Supports negative numbers, which mean: Read the last abs(negative_number) values.
+                                            If 'auto', skips warm-up runs detected with MSER-5 on total run times (see `warmup.mser_truncation`). The amount of skipped runs is available as `skipped`.
         **kwargs: All other kwargs are assumed to be identifiers for this Frame. E.g. if the data was obtained with a framework named X, then `framework='X'` could be specified as identifier. 
 
     Returns:
     '''
     def __init__(self, lines, skip_leading=0, sort_func=lambda e: e, **kwargs):
-        lines = lines[skip_leading:]
-        self.i_arr = np.array([int(x.split(',', 1)[0]) for idx, x in enumerate(lines)])
-        self.c_arr = np.array([int(x.split(',', 1)[1]) for idx, x in enumerate(lines)])
+        skipped = 0
+        if skip_leading != 'auto': # Only parse the lines we keep.
+            skipped = len(lines[:skip_leading])
+            lines = lines[skip_leading:]
+        i_arr = np.array([int(x.split(',', 1)[0]) for idx, x in enumerate(lines)])
+        c_arr = np.array([int(x.split(',', 1)[1]) for idx, x in enumerate(lines)])
+        self._set_arrays(i_arr, c_arr, skip_leading='auto' if skip_leading == 'auto' else 0)
+        self.skipped += skipped
         self.sort_func = sort_func
         self._identifiers = dict(kwargs)
 
+    def _set_arrays(self, i_arr, c_arr, skip_leading=0):
+        '''Sets data arrays, skipping leading values like `__init__` does.'''
+        self.skipped = mser_truncation(i_arr + c_arr) if skip_leading == 'auto' else len(i_arr[:skip_leading])
+        keep = slice(self.skipped, None) if skip_leading == 'auto' else slice(skip_leading, None)
+        self.i_arr = i_arr[keep]
+        self.c_arr = c_arr[keep]
+
+    @staticmethod
+    def from_arrays(i_arr, c_arr, skip_leading=0, sort_func=lambda e: 0, **kwargs):
+        '''Creates a frame from arrays of initialization and computation times (in nanoseconds).'''
+        frame = Frame([], sort_func=sort_func, **kwargs)
+        frame._set_arrays(np.asarray(i_arr), np.asarray(c_arr), skip_leading=skip_leading)
+        return frame
+
     @staticmethod
     def from_file(path, skip_leading=0, sort_func=lambda e: 0, **kwargs):
         with open(path, 'r') as f:
-            lines = f.readlines()
-        return Frame(lines, skip_leading=skip_leading, sort_func=sort_func, **kwargs)
+            lines = data_lines(f)
+        frame = Frame(lines, skip_leading=skip_leading, sort_func=sort_func, **kwargs)
+        if skip_leading == 'auto':
+            print('Discarded {}/{} warm-up runs: {}'.format(frame.skipped, frame.skipped+frame.size, path))
+        return frame
 
     @property
     def size(self):
@@ -0,0 +1,130 @@
+import math
+
+import numpy as np
+
+import graph_generator.internal.util.store as store
+from utils.printer import *
+
+'''Regression detection between campaigns. Runs of a baseline and a candidate campaign are matched by configuration fingerprint, and compared with Mann-Whitney U tests on total run times.'''
+
+
+# Parameters shown to describe a configuration in reports, when present.
+_describing_params = ['producer', 'mode', 'copy_multiplier', 'link_multiplier', 'stripe', 'selectivity', 'batchsize', 'kind', 'nodes']
+
+
+def _average_ranks(values):
+    '''Returns 1-based ranks of values, giving tied values their average rank. Also returns the tie correction term `sum(t^3-t)` over all groups of ties.'''
+    order = np.argsort(values, kind='mergesort')
+    _, first, counts = np.unique(values[order], return_index=True, return_counts=True)
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.repeat(first + (counts+1)/2.0, counts)
+    return ranks, float(np.sum(counts.astype(np.float64)**3 - counts))
+
+
+def mann_whitney(a, b):
+    '''Two-sided Mann-Whitney U test, using the normal approximation with tie correction.
+    Args:
+        a (numpy.ndarray): Baseline measurements.
+        b (numpy.ndarray): Candidate measurements.
+
+    Returns:
+        `(float, float)`: The probability that a candidate measurement exceeds a baseline measurement (common-language effect size, 0.5 means no shift), and the p-value.'''
+    n_a, n_b = len(a), len(b)
+    ranks, ties = _average_ranks(np.concatenate([a, b]))
+    u_b = float(np.sum(ranks[n_a:])) - n_b*(n_b+1)/2.0
+    n = n_a+n_b
+    variance = n_a*n_b/12.0 * ((n+1) - ties/(n*(n-1)))
+    if variance <= 0:
+        return 0.5, 1.0
+    z = (u_b - n_a*n_b/2.0) / math.sqrt(variance)
+    return u_b/(n_a*n_b), math.erfc(abs(z)/math.sqrt(2))
+
+
+def _holm(p_values):
+    '''Holm-Bonferroni adjustment of p-values, controlling the family-wise error rate over all compared configurations.'''
+    adjusted = np.empty(len(p_values), dtype=np.float64)
+    running = 0.0
+    for rank, idx in enumerate(np.argsort(p_values, kind='mergesort')):
+        running = max(running, min(1.0, (len(p_values)-rank)*p_values[idx]))
+        adjusted[idx] = running
+    return adjusted
+
+
+def _by_fingerprint(frames):
+    return {x.identifiers['fingerprint']: x for x in frames if x.identifiers.get('fingerprint')}
+
+
+def describe(identifiers):
+    '''Returns a short description of a configuration, from its identifiers.'''
+    described = ', '.join('{}={}'.format(k, identifiers[k]) for k in _describing_params if k in identifiers)
+    return '{} ({})'.format(identifiers['fingerprint'][:12], described) if described else identifiers['fingerprint'][:12]
+
+
+def compare(baseline, candidate, store_path=None, skip_leading=0, threshold=0.05, alpha=0.05, min_runs=5):
+    '''Compares runs of two campaigns for all configurations measured in both.
+    Args:
+        baseline (str): Result directory of the baseline campaign. Must be ingested in the store.
+        candidate (str): Result directory of the candidate campaign. Must be ingested in the store.
+        store_path (optional str): Store to read from. Defaults to `store.default_path()`.
+        skip_leading (optional int or str): Leading runs to skip per result file. See `Frame`.
+        threshold (optional float): Minimal relative change of the median total run time to report as regression or improvement.
+        alpha (optional float): Significance level, after Holm-Bonferroni adjustment over all compared configurations.
+        min_runs (optional int): Configurations with fewer runs in either campaign are not tested.
+
+    Returns:
+        `(list(dict), list(str), list(str))`: Comparison rows (keys: 'identifiers', 'baseline_median', 'candidate_median', 'change', 'effect', 'p_value', 'status', sorted by change),
+        and fingerprints of configurations only found in the baseline, and only found in the candidate.'''
+    grouped = lambda path: _by_fingerprint(store.query(store_path=store_path, group_by=['fingerprint'], skip_leading=skip_leading, prefix=path))
+    base_frames, cand_frames = grouped(baseline), grouped(candidate)
+    matched = sorted(set(base_frames) & set(cand_frames))
+
+    rows = []
+    for fp in matched:
+        a = base_frames[fp].i_arr + base_frames[fp].c_arr
+        b = cand_frames[fp].i_arr + cand_frames[fp].c_arr
+        row = {'identifiers': cand_frames[fp].identifiers, 'baseline_runs': len(a), 'candidate_runs': len(b)}
+        if min(len(a), len(b)) < min_runs:
+            row.update({'baseline_median': float(np.median(a)) if len(a) else None, 'candidate_median': float(np.median(b)) if len(b) else None, 'change': None, 'effect': None, 'p_value': None, 'status': 'too few runs'})
+        else:
+            effect, p_value = mann_whitney(a, b)
+            row.update({'baseline_median': float(np.median(a)), 'candidate_median': float(np.median(b)), 'effect': effect, 'p_value': p_value})
+            row['change'] = row['candidate_median']/row['baseline_median']-1.0
+        rows.append(row)
+
+    tested = [x for x in rows if x['p_value'] != None]
+    if any(tested):
+        for row, adjusted in zip(tested, _holm(np.array([x['p_value'] for x in tested]))):
+            row['p_value'] = float(adjusted)
+            if adjusted < alpha and row['change'] > threshold:
+                row['status'] = 'regression'
+            elif adjusted < alpha and row['change'] < -threshold:
+                row['status'] = 'improvement'
+            else:
+                row['status'] = 'unchanged'
+    rows.sort(key=lambda x: -x['change'] if x['change'] != None else math.inf)
+    return rows, sorted(set(base_frames) - set(cand_frames)), sorted(set(cand_frames) - set(base_frames))
+
+
+def report(rows, only_baseline, only_candidate, threshold=0.05, alpha=0.05):
+    '''Prints a summary report of a campaign comparison (see `compare`).
+    Returns:
+        `bool`: `True` if no regressions were found, `False` otherwise.'''
+    counts = {status: sum(1 for x in rows if x['status'] == status) for status in ['regression', 'improvement', 'unchanged', 'too few runs']}
+    print('Compared {} matched configurations (threshold={:.1f}%, alpha={}): {} regressions, {} improvements, {} unchanged, {} with too few runs.'.format(
+        len(rows), threshold*100, alpha, counts['regression'], counts['improvement'], counts['unchanged'], counts['too few runs']))
+    if any(only_baseline) or any(only_candidate):
+        printw('Unmatched configurations: {} only in baseline, {} only in candidate.'.format(len(only_baseline), len(only_candidate)))
+    for row in rows:
+        description = describe(row['identifiers'])
+        if row['status'] == 'too few runs':
+            print('\t{:<12} {} ({} vs {} runs)'.format(row['status'], description, row['baseline_runs'], row['candidate_runs']))
+            continue
+        line = '\t{:<12} {:+7.1f}%  median {:.3f}s -> {:.3f}s  P(slower)={:.2f}  p={:.2g}  {}'.format(
+            row['status'], row['change']*100, row['baseline_median']/1000000000, row['candidate_median']/1000000000, row['effect'], row['p_value'], description)
+        if row['status'] == 'regression':
+            printc(line, Color.RED)
+        elif row['status'] == 'improvement':
+            printc(line, Color.GRN)
+        else:
+            print(line)
+    return counts['regression'] == 0
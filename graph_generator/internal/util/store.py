@@ -0,0 +1,221 @@
+import json
+import re
+import sqlite3
+
+import numpy as np
+
+from graph_generator.internal.interpreter import Interpreter
+from graph_generator.internal.util.reader import data_lines, walk, Frame
+import utils.fs as fs
+import utils.location as loc
+from utils.printer import *
+
+'''SQLite results store. Ingesting result files once makes them queryable by configuration parameters and identifiers, without walking and parsing the filesystem again.
+Tables:
+    results(id, path, mtime_ns, size, fingerprint, producer): One row per result file.
+    params(result_id, name, value): Configuration parameters (from `<result_file>.config.json` sidecars) and identifiers of every result file. Indexed on (name, value).
+    runs(result_id, run, init_ns, comp_ns): One row per measured run.'''
+
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime_ns INTEGER, size INTEGER, fingerprint TEXT, producer TEXT);
+CREATE TABLE IF NOT EXISTS params (result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE, name TEXT NOT NULL, value);
+CREATE TABLE IF NOT EXISTS runs (result_id INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE, run INTEGER NOT NULL, init_ns INTEGER NOT NULL, comp_ns INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS params_name_value ON params(name, value, result_id);
+CREATE INDEX IF NOT EXISTS params_result ON params(result_id);
+CREATE INDEX IF NOT EXISTS runs_result ON runs(result_id, run);
+CREATE INDEX IF NOT EXISTS results_fingerprint ON results(fingerprint);
+'''
+
+# Identifiers commonly encoded in result paths, mapped to the configuration parameter they denote.
+_path_patterns = [
+    ('copy_multiplier', r'cp([0-9]+)'),
+    ('link_multiplier', r'ln([0-9]+)'),
+    ('selectivity', r'_rs([0-9]+)'),
+    ('batchsize', r'(?:bs|batchsize)_?([0-9]+)'),
+]
+
+_ops = ['!=', '>=', '<=', '=', '>', '<']
+
+
+def default_path():
+    '''Default store location.'''
+    return fs.join(loc.result_dir(), 'results.sqlite')
+
+
+def connect(path):
+    '''Opens (and if needed, creates) a results store.'''
+    fs.mkdir(fs.dirname(fs.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(_schema)
+    return connection
+
+
+def _path_identifiers(path):
+    '''Fallback identifiers: Producer from the file extension, and common parameters encoded in the path (see `_path_patterns`).'''
+    identifiers = {'producer': 'arrow' if path.endswith('.res_a') else 'spark'}
+    for name, pattern in _path_patterns:
+        found = re.search(pattern, path)
+        if found:
+            identifiers[name] = int(found.group(1))
+    return identifiers
+
+
+def _to_sql_value(value):
+    '''Stores scalars as-is (so numeric comparisons work), and other values as JSON text.'''
+    if value == None or isinstance(value, (bool, int, float, str)):
+        return value
+    return json.dumps(value, sort_keys=True)
+
+
+def _parse_runs(path):
+    '''Reads `init_ns,comp_ns` lines from a result file. Comment lines, tagged warm-up lines (see `data_lines`) and malformed lines are skipped.'''
+    runs = []
+    with open(path, 'r') as f:
+        for line in data_lines(f):
+            try:
+                init_ns, comp_ns = line.split(',', 1)
+                runs.append((int(init_ns), int(comp_ns)))
+            except ValueError:
+                continue
+    return runs
+
+
+def _read_sidecar(path):
+    '''Reads the configuration sidecar (`<result_file>.config.json`, written by the experimenter) of a result file. Returns `None` if there is no (readable) sidecar.'''
+    try:
+        with open(path+'.config.json', 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        return None
+
+
+def ingest(paths, store_path=None, interpret_path=None):
+    '''Ingests result files into the store. Files already ingested are skipped, unless they changed (size or modification time) since.
+    Args:
+        paths (str, iterable(str)): Files or directories (searched recursively) to ingest.
+        store_path (optional str): Store to ingest into. Defaults to `default_path()`.
+        interpret_path (optional str): If set, uses given interpret file to compute identifiers (see `Interpreter`). Sidecar configuration parameters always take precedence.
+
+    Returns:
+        `(int, int)`: Amount of ingested files, and amount of unchanged (skipped) files.'''
+    if isinstance(paths, str):
+        paths = [paths]
+    files = []
+    for path in paths:
+        files += [path] if fs.isfile(path) else walk(path)
+    connection = connect(store_path if store_path else default_path())
+    ingested, skipped = 0, 0
+    try:
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in connection.execute('SELECT path, mtime_ns, size FROM results')}
+        interpreter = Interpreter(None, lambda x: x.endswith('.res_a') or x.endswith('.res_s'), _path_identifiers, lambda: None, interpret_path=interpret_path)
+        for path in files:
+            if not interpreter.filter(path):
+                continue
+            path = fs.abspath(path)
+            stat = fs.stat(path)
+            if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                skipped += 1
+                continue
+            sidecar = _read_sidecar(path)
+            params = dict(interpreter.to_identifiers(path))
+            if sidecar:
+                params.update(sidecar['config'])
+            with connection:
+                connection.execute('DELETE FROM results WHERE path = ?', (path,))
+                result_id = connection.execute('INSERT INTO results (path, mtime_ns, size, fingerprint, producer) VALUES (?, ?, ?, ?, ?)',
+                    (path, stat.st_mtime_ns, stat.st_size, sidecar['fingerprint'] if sidecar else None, params.get('producer'))).lastrowid
+                connection.executemany('INSERT INTO params (result_id, name, value) VALUES (?, ?, ?)', [(result_id, k, _to_sql_value(v)) for k, v in params.items()])
+                connection.executemany('INSERT INTO runs (result_id, run, init_ns, comp_ns) VALUES (?, ?, ?, ?)', [(result_id, idx, x, y) for idx, (x, y) in enumerate(_parse_runs(path))])
+            ingested += 1
+    finally:
+        connection.close()
+    print('Ingested {} result files ({} unchanged).'.format(ingested, skipped))
+    return ingested, skipped
+
+
+def parse_filter(string):
+    '''Parses a filter expression like "stripe=128", "mode!=--spark-only" or "link_multiplier>=16" into `(name, operator, value)`. Values are parsed as JSON when possible (numbers, booleans), and as strings otherwise.'''
+    for op in _ops:
+        name, found, value = string.partition(op)
+        if found and name:
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+            return name.strip(), op, value
+    raise ValueError('Cannot parse filter "{}": Expected <name><operator><value>, with operator in {}'.format(string, ', '.join(_ops)))
+
+
+def query(store_path=None, filters=None, group_by=None, skip_leading=0, sort_func=lambda e: 0, to_identifiers=None, prefix=None, filter_func=None):
+    '''Queries the store, returning results as frames.
+    Args:
+        store_path (optional str): Store to query. Defaults to `default_path()`.
+        filters (optional iterable((str, str, Any))): `(name, operator, value)` filters, as produced by `parse_filter`. All filters must hold.
+        group_by (optional list(str)): If set, merges runs of all results with equal values for these parameters (or 'fingerprint') into one frame per group.
+                                       Group frames have all identifiers shared by their members. Otherwise, returns one frame per result file, with all its parameters and its fingerprint as identifiers.
+                                       Results are only merged when their identifiers from `to_identifiers` are equal as well, so groups always keep these identifiers.
+        skip_leading (optional int or str): Skips leading runs of every result file, before grouping. See `Frame`.
+        sort_func (optional callable): Sorting function to give to frames.
+        to_identifiers (optional callable): If set, extra identifiers are computed from the result path using this function (e.g. a generator's `to_identifiers`).
+        prefix (optional str): If set, only returns results of files inside this path (e.g. one campaign's result directory).
+        filter_func (optional callable): If set, only returns results for which this function returns `True` given the result path (e.g. a generator's `filter`). Applied before grouping.
+
+    Returns:
+        `list(Frame)`.'''
+    connection = connect(store_path if store_path else default_path())
+    try:
+        where, args = [], []
+        for name, op, value in (filters if filters else []):
+            if not op in _ops:
+                raise ValueError('Unknown filter operator: {}'.format(op))
+            where.append('id IN (SELECT result_id FROM params WHERE name = ? AND value {} ?)'.format(op))
+            args += [name, _to_sql_value(value)]
+        if prefix:
+            prefix = fs.join(fs.abspath(prefix), '')
+            where.append('substr(path, 1, ?) = ?')
+            args += [len(prefix), prefix]
+        rows = connection.execute('SELECT id, path, fingerprint FROM results{} ORDER BY path'.format(' WHERE '+' AND '.join(where) if where else ''), args).fetchall()
+        if filter_func:
+            rows = [x for x in rows if filter_func(x[1])]
+        if not any(rows):
+            return []
+        ids = [x for x, _, _ in rows]
+        placeholders = ','.join('?'*len(ids))
+        params = {x: dict() for x in ids}
+        for result_id, name, value in connection.execute('SELECT result_id, name, value FROM params WHERE result_id IN ({})'.format(placeholders), ids):
+            params[result_id][name] = value
+        runs = {x: [] for x in ids}
+        for result_id, init_ns, comp_ns in connection.execute('SELECT result_id, init_ns, comp_ns FROM runs WHERE result_id IN ({}) ORDER BY result_id, run'.format(placeholders), ids):
+            runs[result_id].append((init_ns, comp_ns))
+    finally:
+        connection.close()
+
+    frames = []
+    extra_keys = dict()
+    for result_id, path, fingerprint in rows:
+        data = np.array(runs[result_id], dtype=np.int64).reshape(-1, 2)
+        identifiers = dict(params[result_id])
+        if to_identifiers:
+            extra = to_identifiers(path)
+            identifiers.update(extra)
+            extra_keys[path] = json.dumps(extra, sort_keys=True, default=str)
+        identifiers['path'] = path
+        identifiers['fingerprint'] = fingerprint
+        frames.append(Frame.from_arrays(data[:, 0], data[:, 1], skip_leading=skip_leading, sort_func=sort_func, **identifiers))
+    if not group_by:
+        return frames
+
+    groups = dict()
+    for frame in frames:
+        key = tuple(frame.identifiers.get(x) for x in group_by)
+        groups.setdefault((key, extra_keys.get(frame.identifiers['path'])), []).append(frame)
+    grouped = []
+    for (key, _), members in groups.items():
+        identifiers = {k: v for k, v in members[0].identifiers.items() if all(x.identifiers.get(k) == v for x in members[1:])}
+        identifiers['label'] = ', '.join('{}={}'.format(k, v) for k, v in zip(group_by, key))
+        frame = Frame.from_arrays(np.concatenate([x.i_arr for x in members]), np.concatenate([x.c_arr for x in members]), sort_func=sort_func, **identifiers)
+        frame.skipped = sum(x.skipped for x in members)
+        grouped.append(frame)
+    return grouped
@@ -0,0 +1,263 @@
+import csv
+from datetime import datetime
+import hashlib
+import json
+import re
+
+import numpy as np
+
+import utils.fs as fs
+import utils.location as loc
+from utils.printer import *
+
+
+def _cache_paths(path, tag):
+    '''Returns cache paths `(times, values, labels)` for a source file. The cache key changes whenever the source file changes.'''
+    stat = fs.stat(path)
+    key = hashlib.sha256('{}|{}|{}|{}'.format(fs.abspath(path), stat.st_mtime_ns, stat.st_size, tag).encode('utf-8')).hexdigest()[:32]
+    cache = fs.join(loc.cache_dir(), 'timeseries')
+    return fs.join(cache, '{}_times.npy'.format(key)), fs.join(cache, '{}_values.npy'.format(key)), fs.join(cache, '{}_labels.json'.format(key))
+
+
+def _cached(path, tag, loader, cache=True):
+    '''Loads a `TimeSeries` through the cache. On a miss, calls `loader()` and stores its result as `.npy` files, which are memory-mapped on later loads.'''
+    if not cache:
+        return loader()
+    times_path, values_path, labels_path = _cache_paths(path, tag)
+    if fs.isfile(times_path) and fs.isfile(values_path) and fs.isfile(labels_path):
+        with open(labels_path, 'r') as f:
+            labels = json.load(f)
+        return TimeSeries(np.load(times_path, mmap_mode='r'), np.load(values_path, mmap_mode='r'), labels)
+    series = loader()
+    fs.mkdir(fs.dirname(times_path), exist_ok=True)
+    np.save(times_path, series.times)
+    np.save(values_path, series.values)
+    with open(labels_path, 'w') as f:
+        json.dump(series.labels, f)
+    return series
+
+
+def _instance_name(column):
+    '''Returns the `instance` label of a Prometheus series name, or the full name if it has none.'''
+    match = re.search(r'instance="([^"]+)"', column)
+    return match.group(1) if match else column
+
+
+def read_prometheus_csv(path, fillna=0.0, cache=True):
+    '''Reads a Prometheus/Grafana CSV export, with a "Time" column and one column per series.
+    Args:
+        path (str): Path to CSV file.
+        fillna (optional float or None): Value to use for missing samples. If `None`, missing samples are NaN.
+        cache (optional bool): If set, caches parsed data as memory-mappable `.npy` files in the cache directory.
+
+    Returns:
+        `TimeSeries` with one series per column, labeled by `instance` label.'''
+    def _load():
+        with open(path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            rows = list(reader)
+        time_idx = header.index('Time')
+        columns = [idx for idx in range(len(header)) if idx != time_idx]
+        times = np.array([datetime.fromisoformat(row[time_idx]).timestamp() for row in rows], dtype=np.float64)
+        values = np.array([[float(row[idx]) if row[idx] else np.nan for idx in columns] for row in rows], dtype=np.float64).reshape(len(rows), len(columns))
+        if fillna != None:
+            values[np.isnan(values)] = fillna
+        order = np.argsort(times, kind='stable')
+        return TimeSeries(times[order], values[order], [_instance_name(header[idx]) for idx in columns])
+    return _cached(path, 'prometheus|{}'.format(fillna), _load, cache=cache)
+
+
+def _read_native(path, field):
+    '''Reads one field of a native telemetry sample file (see `experimenter/.../telemetry_sampler.py`) as `(times, values)`.'''
+    with open(path, 'rb') as f:
+        if f.readline() != b'SATS1\n':
+            raise ValueError('Not a sample file: {}'.format(path))
+        header = json.loads(f.readline().decode('utf-8'))
+        offset = f.tell()
+    num_fields = len(header['fields'])
+    num_records = (fs.sizeof(path)-offset) // (8*num_fields) # Ignores incomplete trailing records.
+    records = np.memmap(path, dtype='<f8', mode='r', offset=offset, shape=(num_records, num_fields))
+    return np.array(records[:, 0]), np.array(records[:, header['fields'].index(field)])
+
+
+def read_samples(paths, field, interval=None, labels=None):
+    '''Reads one field (e.g. "cpu_user", "net_rx") from native telemetry sample files, and aligns all nodes on a common time grid.
+    Args:
+        paths (list(str)): Paths to sample files, one per node.
+        field (str): Field to read.
+        interval (optional float): Grid interval in seconds. Defaults to the median sampling interval.
+        labels (optional list(str)): Series labels. Defaults to the sample file names.
+
+    Returns:
+        `TimeSeries` with one series per node, spanning the time all nodes were sampled.'''
+    labels = labels if labels else [fs.basename(x).rsplit('.', 1)[0] for x in paths]
+    data, kept_labels = [], []
+    for path, label in zip(paths, labels):
+        t, v = _read_native(path, field)
+        if len(t) > 1:
+            data.append((t, v))
+            kept_labels.append(label)
+        else:
+            printw('Skipping sample file with too few samples: {}'.format(path))
+    if not any(data):
+        return TimeSeries(np.empty(0), np.empty((0, 0)), [])
+    if interval == None:
+        interval = float(np.median(np.concatenate([np.diff(t) for t, _ in data])))
+    start, end = max(t[0] for t, _ in data), min(t[-1] for t, _ in data)
+    times = np.arange(start, end+interval/2, interval) if end > start else np.array([start])
+    values = np.column_stack([np.interp(times, t, v) for t, v in data])
+    return TimeSeries(times, values, kept_labels)
+
+
+def read_telemetry_dir(path, field, interval=None):
+    '''Reads one field for all nodes of an execution telemetry directory (`<result_file>.telemetry/`), labeling series by hostname or node id.'''
+    paths = sorted(fs.ls(path, only_files=True, full_paths=True))
+    paths = [x for x in paths if x.endswith('.samples')]
+    nodes = dict()
+    if fs.isfile(path, 'nodes.json'):
+        with open(fs.join(path, 'nodes.json'), 'r') as f:
+            nodes = json.load(f)
+    node_ids = [fs.basename(x).rsplit('.', 1)[0] for x in paths]
+    labels = [nodes.get(x, {}).get('hostname') or x for x in node_ids]
+    return read_samples(paths, field, interval=interval, labels=labels)
+
+
+def read_runs(path):
+    '''Reads run boundaries (as written by experiment telemetry alignment) into a `(n, 2)` array of `(start, end)` epoch seconds.'''
+    with open(path, 'r') as f:
+        runs = json.load(f)
+    return np.array([(x['start'], x['end']) for x in runs], dtype=np.float64).reshape(len(runs), 2)
+
+
+class TimeSeries(object):
+    '''Holds one or more aligned time series: A shared, sorted time axis (epoch seconds) and a `(samples, series)` value matrix.
+    All operations are vectorised over samples and series, and return new `TimeSeries` objects.'''
+    def __init__(self, times, values, labels):
+        self.times = times
+        self.values = values if values.ndim == 2 else values.reshape(-1, 1)
+        self.labels = list(labels)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def num_series(self):
+        return self.values.shape[1]
+
+    @property
+    def duration(self):
+        return float(self.times[-1]-self.times[0]) if len(self.times) > 1 else 0.0
+
+    def scale(self, factor):
+        '''Multiplies all values by `factor`, e.g. `1/1024/1024` to convert bytes to MiB.'''
+        return TimeSeries(self.times, self.values*factor, self.labels)
+
+    def select(self, labels):
+        '''Returns only the series with given labels.'''
+        idxs = [self.labels.index(x) for x in labels]
+        return TimeSeries(self.times, self.values[:, idxs], labels)
+
+    def total(self, label='total'):
+        '''Sums all series into one.'''
+        return TimeSeries(self.times, np.sum(self.values, axis=1), [label])
+
+    def between(self, start, end):
+        '''Returns samples with `start <= time <= end`.'''
+        lo, hi = np.searchsorted(self.times, start, side='left'), np.searchsorted(self.times, end, side='right')
+        return TimeSeries(self.times[lo:hi], self.values[lo:hi], self.labels)
+
+    def relative(self):
+        '''Returns a copy with times relative to the first sample.'''
+        return TimeSeries(self.times-self.times[0], self.values, self.labels) if len(self.times) else self
+
+    def resample(self, interval, how='mean'):
+        '''Downsamples into fixed-width bins.
+        Args:
+            interval (float): Bin width in seconds.
+            how (optional str): Aggregation per bin: 'mean', 'sum', 'max' or 'min'.
+
+        Returns:
+            `TimeSeries` with one sample per non-empty bin, timestamped at the bin start.'''
+        if not len(self.times):
+            return self
+        bins = np.floor((self.times-self.times[0])/interval).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]]) # Times are sorted, so bins are contiguous.
+        values = np.asarray(self.values)
+        if how == 'mean' or how == 'sum':
+            aggregated = np.add.reduceat(values, starts, axis=0)
+            if how == 'mean':
+                aggregated = aggregated / np.diff(np.r_[starts, len(bins)])[:, None]
+        elif how == 'max':
+            aggregated = np.maximum.reduceat(values, starts, axis=0)
+        elif how == 'min':
+            aggregated = np.minimum.reduceat(values, starts, axis=0)
+        else:
+            raise ValueError('Unknown aggregation "{}"'.format(how))
+        return TimeSeries(self.times[0]+bins[starts]*interval, aggregated, self.labels)
+
+    def downsample(self, max_points, how='mean'):
+        '''Resamples to at most `max_points` samples, for fast rendering. Returns `self` if already small enough.'''
+        if len(self.times) <= max_points or self.duration == 0:
+            return self
+        return self.resample(self.duration/(max_points-1), how=how)
+
+    def rolling(self, window, how='mean'):
+        '''Computes a trailing rolling window aggregate. The first `window-1` samples aggregate over fewer samples.
+        Args:
+            window (int): Window size, in samples.
+            how (optional str): Aggregation: 'mean', 'sum', 'max' or 'min'.
+
+        Returns:
+            `TimeSeries` with the same time axis.'''
+        values = np.asarray(self.values)
+        if how in ('mean', 'sum'):
+            cumulative = np.cumsum(np.vstack([np.zeros((1, values.shape[1])), values]), axis=0)
+            upper = np.arange(1, len(values)+1)
+            lower = np.maximum(upper-window, 0)
+            aggregated = cumulative[upper]-cumulative[lower]
+            if how == 'mean':
+                aggregated = aggregated / (upper-lower)[:, None]
+        elif how in ('max', 'min'):
+            fill = -np.inf if how == 'max' else np.inf
+            padded = np.vstack([np.full((window-1, values.shape[1]), fill), values])
+            views = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+            aggregated = views.max(axis=-1) if how == 'max' else views.min(axis=-1)
+        else:
+            raise ValueError('Unknown aggregation "{}"'.format(how))
+        return TimeSeries(self.times, aggregated, self.labels)
+
+    def percentile(self, q, across_series=False):
+        '''Computes percentiles, ignoring NaNs.
+        Args:
+            q (float or list(float)): Percentile(s) in [0, 100].
+            across_series (optional bool): If set, computes percentiles over all series per sample, returning a `TimeSeries` with one series per percentile.
+                                           Otherwise, computes percentiles over time, returning a `(len(q), num_series)` array (or `(num_series,)` for a single q).'''
+        if across_series:
+            result = np.nanpercentile(self.values, np.atleast_1d(q), axis=1).T
+            return TimeSeries(self.times, result, ['p{}'.format(x) for x in np.atleast_1d(q)])
+        return np.nanpercentile(self.values, q, axis=0)
+
+    def area_under_curve(self, intervals=None):
+        '''Computes the area under each series (trapezoid rule, value-seconds) for given intervals. Interval edges between samples are handled exactly, by linear interpolation of values.
+        Args:
+            intervals (optional np.ndarray): `(n, 2)` array of `(start, end)` epoch seconds, e.g. from `read_runs`. Defaults to the full series.
+
+        Returns:
+            `np.ndarray` of shape `(n, num_series)`.'''
+        if intervals is None:
+            intervals = np.array([[self.times[0], self.times[-1]]])
+        intervals = np.asarray(intervals, dtype=np.float64).reshape(-1, 2)
+        values = np.asarray(self.values)
+        if len(self.times) < 2:
+            return np.zeros((len(intervals), values.shape[1]))
+        # Cumulative integral at every sample. The area of any interval is the difference of the cumulative integral at its edges.
+        cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(0.5*(values[1:]+values[:-1])*np.diff(self.times)[:, None], axis=0)])
+        def _cumulative_at(edges):
+            edges = np.clip(edges, self.times[0], self.times[-1])
+            idxs = np.clip(np.searchsorted(self.times, edges, side='right')-1, 0, len(self.times)-2)
+            offset = (edges-self.times[idxs])[:, None]
+            width = (self.times[idxs+1]-self.times[idxs])[:, None]
+            value_at = values[idxs] + (values[idxs+1]-values[idxs])*np.divide(offset, width, out=np.zeros_like(offset), where=width > 0)
+            return cumulative[idxs] + 0.5*offset*(values[idxs]+value_at)
+        return _cumulative_at(intervals[:, 1]) - _cumulative_at(intervals[:, 0])
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+def mser_truncation(values, batch_size=5, max_fraction=0.5, min_batches=10, min_improvement=0.5):
+    '''Detects the warm-up period of a series of measurements using MSER (Marginal Standard Error Rule), by default on batch means of 5 runs (MSER-5).
+    For every candidate truncation point `d`, MSER computes the squared standard error of the mean of the remaining data, `var(Y[d:]) / (n-d)`.
+    The truncation point minimizing this value balances removing biased (warm-up) runs against keeping enough runs for a precise mean.
+    With few batches, this statistic is biased towards late truncation points, even for series without any warm-up. We therefore only consider truncation points keeping at least `min_batches` batches
+    (batching is disabled for series too short to form `min_batches` batches), and only truncate when this lowers the statistic clearly compared to not truncating at all.
+    Args:
+        values (np.ndarray): Measurements, in order of execution.
+        batch_size (optional int): Amount of runs to average into one batch. Batching smooths out run-to-run noise.
+        max_fraction (optional float): Maximal fraction of runs that may be truncated. Minima beyond this point indicate the series has not reached steady state; we then truncate at most this fraction.
+        min_batches (optional int): Minimal amount of (batches of) runs to keep.
+        min_improvement (optional float): Minimal relative decrease of the statistic, compared to not truncating, required to truncate.
+
+    Returns:
+        `int`, the amount of leading runs to discard.'''
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) // batch_size < min_batches:
+        batch_size = 1
+    num_batches = len(values) // batch_size
+    candidates = min(int(num_batches*max_fraction), num_batches-min_batches)+1
+    if candidates < 2:
+        return 0
+    batches = values[:num_batches*batch_size].reshape(num_batches, batch_size).mean(axis=1)
+
+    # Suffix sums give mean and variance of every tail `batches[d:]` in one pass.
+    remaining = np.arange(num_batches, 0, -1, dtype=np.float64)
+    suffix_sum = np.cumsum(batches[::-1])[::-1]
+    suffix_sqsum = np.cumsum((batches*batches)[::-1])[::-1]
+    squared_deviations = np.maximum(suffix_sqsum - suffix_sum*suffix_sum/remaining, 0.0)
+    statistic = squared_deviations / (remaining*remaining)
+
+    truncation = int(np.argmin(statistic[:candidates]))
+    if statistic[truncation] > statistic[0]*(1.0-min_improvement):
+        return 0
+    return truncation * batch_size
+
+
+def parse_skip_leading(value):
+    '''Parses a skip-leading specification: Either an integer, or 'auto' for automatic warm-up detection.'''
+    if isinstance(value, str) and value.lower() == 'auto':
+        return 'auto'
+    return int(value)
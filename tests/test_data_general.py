@@ -0,0 +1,42 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Appends main project root as importpath.
+
+for module in ('data_deploy', 'metareserve', 'remoto'):
+    pytest.importorskip(module)
+
+import experimenter.internal.experiment.execution.functionstore.data_general as data_general
+
+
+def _interface(data_path, local_dir, copy_multiplier=2, link_multiplier=3, streams=2):
+    config = types.SimpleNamespace(data_path=data_path, remote_data_dir='/nonexistent', copy_multiplier=copy_multiplier, link_multiplier=link_multiplier,
+                                   data_deploy_streams=streams, data_deploy_local_dir=local_dir, key_path=None, silent=True)
+    return types.SimpleNamespace(config=config)
+
+
+def test_deploy_data_striped_local_dir(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    (data_dir / 'a.parquet').write_bytes(b'a'*1000)
+    (data_dir / 'b.parquet').write_bytes(b'b'*3000)
+    local_dir = tmp_path / 'deployed'
+
+    assert data_general.deploy_data_striped(_interface(str(data_dir), str(local_dir)), 0, 1, nodes=[], object_size=512)
+
+    tasks, links = data_general._striped_tasks(str(data_dir), 2, 3)
+    assert sorted(os.listdir(local_dir)) == sorted([name for _, name, _ in tasks]+[name for _, name in links])
+    for source, name, _ in tasks:
+        with open(source, 'rb') as expected, open(local_dir / name, 'rb') as deployed:
+            assert expected.read() == deployed.read()
+    for target, name in links:
+        assert os.path.samefile(local_dir / target, local_dir / name)
+
+
+def test_deploy_data_striped_local_dir_no_data(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    assert not data_general.deploy_data_striped(_interface(str(data_dir), str(tmp_path / 'deployed')), 0, 1, nodes=[])
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Appends main project root as importpath.
+
+from experimenter.internal.remoto.modulegenerator import ModuleGenerator
+
+
+def _bundle(tmp_path, files, entry):
+    project = tmp_path / 'project'
+    for name, content in files.items():
+        (project / name).parent.mkdir(parents=True, exist_ok=True)
+        (project / name).write_text(content)
+    outputpath = tmp_path / 'out' / 'bundle.py'
+    ModuleGenerator().with_file(str(project / entry)).generate_bundle(str(outputpath), root=str(project), silent=True)
+    return outputpath
+
+
+def _run(path):
+    return subprocess.run([sys.executable, str(path)], cwd=str(path.parent), stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def test_bundle_package_imports_own_submodule(tmp_path):
+    files = {
+        'pkg/__init__.py': 'from pkg.b import val\n',
+        'pkg/b.py': 'val = 3\n',
+        'main.py': 'import pkg.b\nprint(pkg.val, pkg.b.val)\n',
+    }
+    result = _run(_bundle(tmp_path, files, 'main.py'))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == '3 3'
+
+
+def test_bundle_parent_receives_child_attribute(tmp_path):
+    files = {
+        'pkg/__init__.py': '',
+        'pkg/sub/__init__.py': 'from pkg.sub.c import name\n',
+        'pkg/sub/c.py': 'name = "c"\n',
+        'pkg/a.py': 'import pkg.sub\nvalue = pkg.sub.c.name\n',
+        'main.py': 'from pkg import a\nimport pkg\nprint(a.value, pkg.sub.name, pkg.a.value)\n',
+    }
+    result = _run(_bundle(tmp_path, files, 'main.py'))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'c c c'
@@ -119,6 +119,10 @@ def sizeof(directory, *args):
 def split(path):
     return path.split(os.sep)
 
+# Return os.stat_result for given path
+def stat(directory, *args):
+    return os.stat(join(directory, *args))
+
 # Touch-like command, does not emulate mtime if file already exists
 def touch(path, *args):
     path = join(path, *args)
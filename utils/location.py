@@ -27,4 +27,8 @@ def application_dir():
 
 def result_dir():
     '''Directory to contain results.'''
-    return fs.join(root(), 'results')
\ No newline at end of file
+    return fs.join(root(), 'results')
+
+def cache_dir():
+    '''Directory to contain locally cached artifacts, which are safe to remove.'''
+    return fs.join(root(), 'cache')
\ No newline at end of file